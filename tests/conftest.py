@@ -0,0 +1,19 @@
+# ---------------------------------------------------------------------------------
+# uc: tests/conftest.py
+#
+# The modules of the interpreter are at the root of the repository, and the
+# programs of the tests in tests/programs.py
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+import os
+import sys
+
+_TESTS = os.path.dirname(os.path.abspath(__file__))
+for _path in (os.path.dirname(_TESTS), _TESTS):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
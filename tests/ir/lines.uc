@@ -0,0 +1,8 @@
+int main () {
+    int s = 1;
+    int k = 2;
+    for (int i = 1; i < 10; i++)
+        s = s + k * i;
+    assert s == 91;
+    return 0;
+}
@@ -0,0 +1,70 @@
+# ---------------------------------------------------------------------------------
+# uc: tests/programs.py
+#
+# uC programs (intermediate code in tests/ir) used by the tests, with their input
+# and the output & exit code of the original interpreter
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+import os
+import random
+from uc_irtext import read_ir
+
+IR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ir")
+
+_random = random.Random(1)
+NUMBERS = [_random.randint(-1000, 1000) for _ in range(100)]
+PRIMES = [n for n in range(2, 300) if all(n % d for d in range(2, n))]
+
+# (name of the program, input, output, exit code)
+CASES = [
+    ("double", "", "\n", 0),
+    ("cast", "", "\n", 0),
+    ("ptr", "", "\n", 0),
+    ("incr", "", "\n", 1),
+    ("forloop", "", "\n", 0),
+    ("arrays", "", "Isto é um teste: t2.52\n", 0),
+    (
+        "bubble",
+        "5\n3 1 2 5 4\n",
+        "Enter number of elements: Enter 5 integers: "
+        "Sorted list in ascending order: 1 2 3 4 5 \n",
+        0,
+    ),
+    (
+        "bubble",
+        "100\n%s\n" % " ".join(map(str, NUMBERS)),
+        "Enter number of elements: Enter 100 integers: "
+        "Sorted list in ascending order: %s \n" % " ".join(map(str, sorted(NUMBERS))),
+        0,
+    ),
+    ("ptrfunc", "7 3\n", "7 + 3 = 10, 7 - 3 = 4\n", 0),
+    ("fat", "10\n", "3628800\n", 0),
+    ("fat", "25\n", "15511210043330985984000000\n", 0),
+    ("rsum", "500\n", "125250\n", 0),
+    ("gcd", "48 18\n", "GCD is 6\n", 0),
+    ("gcd", "1071\n462\n", "GCD is 21\n", 0),
+    (
+        "primes",
+        "2 300\n",
+        "Enter 2 numbers (intervals) separated by space: "
+        "Prime numbers between 2 and 300 are:\n%s  \n" % "  ".join(map(str, PRIMES)),
+        0,
+    ),
+    ("misc", "", "sum=153pc67.0317315Truez3.0 ok é\n\n", 0),
+]
+IDS = ["%d-%s" % (i, case[0]) for i, case in enumerate(CASES)]
+
+
+def path(name):
+    """ Path of the .ir file of a program """
+    return os.path.join(IR_DIR, name + ".ir")
+
+
+def program(name):
+    """ Instruction tuples of a program """
+    return read_ir(path(name))
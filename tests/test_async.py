@@ -0,0 +1,52 @@
+# ---------------------------------------------------------------------------------
+# uc: tests/test_async.py
+#
+# Tests of the AsyncInterpreter: programs run in an event loop, waiting for the
+# input of asyncio streams
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+import asyncio
+import pytest
+from programs import CASES, IDS, program
+from uc_async import AsyncInterpreter
+
+
+@pytest.mark.parametrize("name, stdin, stdout, code", CASES, ids=IDS)
+def test_output(name, stdin, stdout, code):
+    vm = AsyncInterpreter(capture=True, interval=100)
+    result = asyncio.run(vm.run(program(name), stdin))
+    assert (result.stdout, result.exit_code) == (stdout, code)
+
+
+def test_stream():
+    # the reads wait for the input, without blocking the other programs
+    async def session():
+        reader = asyncio.StreamReader()
+        vm = AsyncInterpreter(capture=True, interval=10)
+        other = AsyncInterpreter(capture=True, interval=10)
+        task = asyncio.ensure_future(vm.run(program("gcd"), reader))
+        reader.feed_data(b"10")
+        result = await other.run(program("rsum"), "100")
+        assert not task.done()
+        reader.feed_data("71\n46".encode("utf-8"))
+        await asyncio.sleep(0)
+        reader.feed_data(b"2\n")
+        reader.feed_eof()
+        return result, await task
+
+    result, gcd = asyncio.run(session())
+    assert (result.stdout, gcd.stdout) == ("5050\n", "GCD is 21\n")
+
+
+def test_unsupported():
+    vm = AsyncInterpreter()
+    vm.hooks.on_step(lambda vm, pc: None)
+    with pytest.raises(ValueError):
+        asyncio.run(vm.run(program("gcd"), "48 18"))
+    with pytest.raises(TypeError):
+        AsyncInterpreter(hooks=None)
@@ -0,0 +1,37 @@
+# ---------------------------------------------------------------------------------
+# uc: tests/test_batch.py
+#
+# Tests of the BatchRunner: a program loaded once & run over many inputs, in
+# forked workers or in this process
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+import pytest
+from programs import program
+from uc_batch import BatchRunner
+from uc_interpreter import Interpreter
+from uc_transpiler import Transpiler
+
+INPUTS = ["10", "500", "", "3"]
+
+
+@pytest.mark.parametrize("engine", [Interpreter, Transpiler])
+@pytest.mark.parametrize("processes", [1, 2])
+def test_batch(engine, processes):
+    runner = BatchRunner(program("rsum"), engine, processes)
+    results = runner.run(INPUTS)
+    expected = [Interpreter(capture=True).run(program("rsum"), i) for i in INPUTS]
+    assert [(r.stdout, r.exit_code) for r in results] == [
+        (r.stdout, r.exit_code) for r in expected
+    ]
+
+
+def test_state_after_load():
+    # each input runs from the memory after the load, not after the last run
+    runner = BatchRunner(program("misc"), processes=1)
+    first, second = runner.run(["", ""])
+    assert first.stdout == second.stdout == "sum=153pc67.0317315Truez3.0 ok é\n\n"
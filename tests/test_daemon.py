@@ -0,0 +1,52 @@
+# ---------------------------------------------------------------------------------
+# uc: tests/test_daemon.py
+#
+# Tests of the client & the daemon: the client runs the scripts by itself when
+# there is no daemon, and the daemon imports the compiler next to the ast of
+# the standard library
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+import os
+import subprocess
+import sys
+from programs import path
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LOAD = """
+import sys
+import uc_daemon
+uc = uc_daemon.load_compiler()
+import ast
+print(sys.modules["ucparser"].ast is not ast, callable(ast.literal_eval))
+"""
+
+
+def _python(args, stdin="", **environ):
+    return subprocess.run(
+        [sys.executable] + args,
+        input=stdin,
+        capture_output=True,
+        text=True,
+        cwd=ROOT,
+        env=dict(os.environ, **environ),
+        timeout=60,
+    )
+
+
+def test_client_without_daemon(tmp_path):
+    socket = str(tmp_path / "none.sock")
+    process = _python(
+        ["uc_client.py", "run", path("gcd")], "1071 462", UC_SOCKET=socket
+    )
+    assert (process.stdout, process.returncode) == ("GCD is 21\n", 0)
+
+
+def test_load_compiler():
+    process = _python(["-c", LOAD])
+    assert (process.stdout, process.returncode) == ("True True\n", 0)
@@ -0,0 +1,90 @@
+# ---------------------------------------------------------------------------------
+# uc: tests/test_formats.py
+#
+# Tests of the formats of the intermediate code: the binary format and the text
+# of the .ir files
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+import io
+import pytest
+from programs import CASES, IDS, path, program
+from uc_binary import BinaryProgram, FormatError, dump_binary
+from uc_interpreter import Interpreter
+from uc_irtext import IRWriter, iter_ir, parse_line, read_coords, read_ir, write_ir
+
+CONSTANTS = [
+    ("global_int_3", "@v", [1, -(2**40), 2**80]),
+    ("global_float_2", "@f", [0.5, -1e300]),
+    ("global_string", "@s", "é" * 300),
+    ("define", "@main"),
+    ("literal_bool", True, "%1"),
+    ("literal_int", None, "%2"),
+    ("return_void",),
+]
+
+
+@pytest.mark.parametrize("name, stdin, stdout, code", CASES, ids=IDS)
+def test_binary(tmp_path, name, stdin, stdout, code):
+    filename = str(tmp_path / (name + ".irb"))
+    dump_binary(program(name), filename)
+    with BinaryProgram(filename) as ircode:
+        assert list(ircode) == program(name)
+        result = Interpreter(capture=True).run(ircode, stdin)
+    assert (result.stdout, result.exit_code) == (stdout, code)
+
+
+def test_binary_constants(tmp_path):
+    filename = str(tmp_path / "constants.irb")
+    dump_binary(CONSTANTS, filename)
+    with BinaryProgram(filename) as ircode:
+        assert len(ircode) == len(CONSTANTS)
+        assert ircode[-1] == CONSTANTS[-1]
+        assert ircode[1:3] == CONSTANTS[1:3]
+        assert list(ircode) == CONSTANTS
+
+
+def test_binary_format(tmp_path):
+    filename = tmp_path / "text.irb"
+    filename.write_text("('define', '@main')\n")
+    with pytest.raises(FormatError):
+        BinaryProgram(str(filename))
+
+
+@pytest.mark.parametrize(
+    "line, parsed",
+    [
+        ("('load_int', '%1', '%2')", (("load_int", "%1", "%2"), None)),
+        (
+            "('literal_float', -2.5e3, '%3')  # @ 12:9",
+            (("literal_float", -2.5e3, "%3"), 12),
+        ),
+        ("('8',)", (("8",), None)),
+        ("('global_int_2', '@v', [1, 2])  # @ 3", (("global_int_2", "@v", [1, 2]), 3)),
+        ("('global_string', '@s', 'a\\n')", (("global_string", "@s", "a\n"), None)),
+        ("('return_void',)  # comment", (("return_void",), None)),
+        ("# comment", (None, None)),
+        ("", (None, None)),
+    ],
+)
+def test_parse_line(line, parsed):
+    assert parse_line(line) == parsed
+
+
+def test_text(tmp_path):
+    # the writer & the reader keep the instructions and their lines
+    filename = str(tmp_path / "lines.ir")
+    ircode = program("lines")
+    coords = read_coords(path("lines"))
+    write_ir(ircode, filename, coords)
+    assert (read_ir(filename), read_coords(filename)) == (ircode, coords)
+    stream = io.StringIO()
+    with IRWriter(stream, buffer_size=1 << 10) as writer:
+        for op in CONSTANTS:
+            writer.write(op)
+        assert stream.getvalue() == ""
+    assert list(iter_ir(io.StringIO(stream.getvalue()))) == CONSTANTS
@@ -0,0 +1,99 @@
+# ---------------------------------------------------------------------------------
+# uc: tests/test_hooks.py
+#
+# Tests of the hooks of the interpreter, and of the debugger & tracer on top of
+# them: calls, returns, branches, watches, breakpoints and traces
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+import io
+from programs import program
+from uc_debug import Debugger, Tracer
+from uc_hooks import WRITES
+from uc_interpreter import Interpreter
+
+
+def test_events():
+    # the hooks see the same run, one event per call, return & branch
+    vm = Interpreter(capture=True)
+    events = []
+    vm.hooks.on_call(lambda vm, layout: events.append(("call", layout.name)))
+    vm.hooks.on_return(
+        lambda vm, layout, value: events.append(("return", layout.name, value))
+    )
+    vm.hooks.on_branch(lambda vm, pc, target: events.append(("branch", pc)))
+    result = vm.run(program("gcd"), "48 18\n")
+    assert result.stdout == "GCD is 6\n"
+    _calls = [event[1] for event in events if event[0] == "call"]
+    _returns = [event[1:] for event in events if event[0] == "return"]
+    assert _calls[0] == "@main" and len(_calls) == len(_returns)
+    assert ("@gcd", 6) in _returns
+    assert any(event[0] == "branch" for event in events)
+
+
+def test_watch():
+    # a watch on a global array sees the change of v[0] from 1 to 7, and
+    # not the copy of the same values back to it
+    vm = Interpreter(capture=True)
+    vm.load(program("misc"))
+    address = vm.M[vm.globals["@v"]]
+    changes = []
+    vm.hooks.watch(
+        address, 5, lambda vm, at, old, new: changes.append((at - address, old, new))
+    )
+    result = vm.rerun()
+    assert result.stdout == "sum=153pc67.0317315Truez3.0 ok é\n\n"
+    assert changes == [(0, 1, 7)]
+
+
+def test_watch_writes():
+    # only the instructions that may write memory check the watches
+    vm = Interpreter(capture=True)
+    vm.load(program("misc"))
+    vm.hooks.watch(vm.globals["@pi"], 1, lambda vm, at, old, new: None)
+    table = vm.hooks.instrument()
+    for (handler, args), (plain, _) in zip(table, vm.hooks.plain):
+        _name = getattr(plain, "__name__", "")
+        assert (handler == vm.hooks._watched) == _name.startswith(WRITES)
+
+
+def test_debugger():
+    # a scripted session: stop at the change of @v, backtrace & continue
+    vm = Interpreter(capture=True)
+    vm.load(program("misc"))
+    output = io.StringIO()
+    debugger = Debugger(vm, io.StringIO("bt\nc\n"), output)
+    debugger.watch("@v")
+    result = vm.rerun()
+    assert result.exit_code == 0
+    assert "Watch @v[0]: 1 -> 7\n" in output.getvalue()
+    assert "in @main" in output.getvalue()
+
+
+def test_breakpoint():
+    # the backtrace at the breakpoint has gcd over main
+    vm = Interpreter(capture=True)
+    vm.load(program("gcd"))
+    output = io.StringIO()
+    debugger = Debugger(vm, io.StringIO("bt\nc\n"), output)
+    debugger.break_at("@gcd")
+    result = vm.rerun("48 18\n")
+    assert result.stdout == "GCD is 6\n"
+    _text = output.getvalue()
+    assert _text.startswith("Breakpoint at @gcd\n")
+    assert _text.index("in @gcd") < _text.index("in @main")
+
+
+def test_tracer():
+    # the trace keeps the last instructions run, the last one the exit
+    vm = Interpreter(capture=True)
+    tracer = Tracer(vm, 5)
+    result = vm.run(program("gcd"), "48 18\n")
+    assert result.stdout == "GCD is 6\n"
+    _lines = tracer.lines()
+    assert len(_lines) == 5
+    assert "return_void" in _lines[-1]
@@ -0,0 +1,114 @@
+# ---------------------------------------------------------------------------------
+# uc: tests/test_interpreter.py
+#
+# Tests of the Interpreter: the outputs of the programs are the same of the
+# original interpreter
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+import pytest
+from programs import CASES, IDS, program
+from uc_interpreter import Interpreter
+
+
+@pytest.mark.parametrize("name, stdin, stdout, code", CASES, ids=IDS)
+def test_output(name, stdin, stdout, code):
+    result = Interpreter(capture=True).run(program(name), stdin)
+    assert (result.stdout, result.exit_code) == (stdout, code)
+
+
+def test_decoded_once():
+    # the opcodes are parsed by load only, not by the execution loop
+    name, stdin, stdout, code = CASES[6]
+    vm = Interpreter(capture=True)
+    vm.load(program(name))
+    assert all(callable(handler) for handler, args in vm.program)
+
+    def _fail(source):
+        raise AssertionError("opcode parsed at run time: %s" % source)
+
+    vm._extract_operation = _fail
+    assert vm.rerun(stdin).stdout == stdout
+
+
+def test_operands_resolved():
+    # the registers are frame slots and the globals their ~address
+    vm = Interpreter()
+    vm.load(program("misc"))
+    for handler, args in vm.program:
+        for arg in args:
+            assert not (isinstance(arg, str) and arg[:1] in {"%", "@"})
+    for layout in vm.functions.values():
+        assert set(layout.slots.values()) == set(range(layout.size))
+
+
+def test_recursive_frames():
+    # each call gets a frame of its own, the caller's is kept
+    result = Interpreter(capture=True).run(program("rsum"), "900")
+    assert result.stdout == "%d\n" % sum(range(901))
+
+
+def test_labels_resolved():
+    # the jumps go to the pc after their label, the calls to a FrameLayout
+    vm = Interpreter(fuse=False, vectorize=False)
+    ircode = program("gcd")
+    vm.load(ircode)
+    gcd = vm.functions[1]
+    assert gcd.labels["%8"] == ircode.index(("8",)) + 1
+    for pc, (handler, args) in enumerate(vm.program):
+        if ircode[pc][0] in {"jump", "cbranch"}:
+            targets = args[-1:] if ircode[pc][0] == "jump" else args[1:]
+            labels = [(label[1:],) for label in ircode[pc][-len(targets) :]]
+            assert [ircode[target - 1] for target in targets] == labels
+        elif ircode[pc][0] == "call":
+            assert args[0] is gcd
+
+
+@pytest.mark.parametrize("name, stdin, stdout, code", CASES, ids=IDS)
+def test_unfused(name, stdin, stdout, code):
+    # the superinstructions do what the sequences they replace did
+    result = Interpreter(capture=True, fuse=False).run(program(name), stdin)
+    assert (result.stdout, result.exit_code) == (stdout, code)
+
+
+def test_fused():
+    vm = Interpreter(capture=True)
+    vm.load(program("bubble"))
+    assert sum(vm.fusions.values()) > 0
+    names = {handler.__name__ for handler, args in vm.program}
+    assert set(vm.fusions) <= names
+    name, count = vm.fusions.most_common(1)[0]
+    assert vm.fusion_report().split()[:2] == [name[len("_run_") :], str(count)]
+
+
+@pytest.mark.parametrize("name, stdin, stdout, code", CASES, ids=IDS)
+def test_unpacked(name, stdin, stdout, code):
+    # the slots of the dead temporaries are reused without changing a value
+    result = Interpreter(capture=True, pack=False).run(program(name), stdin)
+    assert (result.stdout, result.exit_code) == (stdout, code)
+
+
+def test_packed_frames():
+    packed = Interpreter()
+    packed.load(program("bubble"))
+    unpacked = Interpreter(pack=False)
+    unpacked.load(program("bubble"))
+    sizes = [
+        (layout.size, unpacked.functions[pc].size)
+        for pc, layout in packed.functions.items()
+    ]
+    assert all(size <= original for size, original in sizes)
+    assert sum(size for size, _ in sizes) < sum(original for _, original in sizes)
+
+
+def test_array_copy():
+    # the copy of an array is a single superinstruction, a slice of memory
+    vm = Interpreter(capture=True)
+    result = vm.run(program("copy"))
+    assert vm.fusions["_run_array_copy"] == 1
+    unfused = Interpreter(capture=True, fuse=False).run(program("copy"))
+    assert result.stdout == unfused.stdout == "1999" + "6\n"
@@ -0,0 +1,82 @@
+# ---------------------------------------------------------------------------------
+# uc: tests/test_io.py
+#
+# Tests of the input & output of the programs: the flush policies of the output
+# buffer and the tokens of the input source
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+import io
+import os
+import threading
+import pytest
+from programs import CASES, program
+from uc_interpreter import Interpreter
+from uc_io import BUFFER_SIZE, InputSource, OutputBuffer
+
+
+@pytest.mark.parametrize(
+    "policy, flushed",
+    [("exit", ["", ""]), ("line", ["", "a\n"]), ("always", ["a", "a\n"])],
+)
+def test_flush_policy(policy, flushed):
+    sink = io.StringIO()
+    output = OutputBuffer(sink, policy)
+    written = []
+    for text in ["a", "\n"]:
+        output.write(text)
+        written.append(sink.getvalue())
+    assert written == flushed
+    output.flush()
+    assert sink.getvalue() == "a\n"
+
+
+def test_flush_full():
+    # a full buffer is written even with the "exit" policy
+    sink = io.BytesIO()
+    output = OutputBuffer(sink, encoding="utf-8")
+    output.write("é" * (BUFFER_SIZE - 1))
+    assert sink.getvalue() == b""
+    output.write("é")
+    assert sink.getvalue() == "é".encode("utf-8") * BUFFER_SIZE
+
+
+def test_output_sink():
+    # the output of a program goes to the sink, encoded if it is binary
+    name, stdin, stdout, code = CASES[5]
+    sink = io.BytesIO()
+    Interpreter(output=sink).run(program(name), stdin)
+    assert sink.getvalue() == stdout.encode("utf-8")
+
+
+def test_input_pipe():
+    # a read returns the input available, even if the pipe is still open
+    read_end, write_end = os.pipe()
+    os.write(write_end, b"5\n")
+    with open(read_end, "r") as stream:
+        source = InputSource(stream)
+        values = []
+        reader = threading.Thread(target=lambda: values.append(source.read_int()))
+        reader.start()
+        reader.join(5)
+        waiting = reader.is_alive()
+        os.write(write_end, b"6 ")
+        os.close(write_end)
+        reader.join()
+        assert not waiting
+        assert (values, source.read_int()) == ([5], 6)
+
+
+def test_input_chunks():
+    # the chars split between two chunks are decoded
+    data = "3 é 2.5 x".encode("utf-8")
+    source = InputSource(io.BufferedReader(io.BytesIO(data), 1))
+    source.read_chunk = lambda size: source.stream.read1(1)
+    values = [source.read_int(), source.read_char(), source.read_float()]
+    assert values + [source.read_char()] == [3, "é", 2.5, "x"]
+    with pytest.raises(EOFError):
+        source.read_int()
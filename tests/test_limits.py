@@ -0,0 +1,75 @@
+# ---------------------------------------------------------------------------------
+# uc: tests/test_limits.py
+#
+# Tests of the limits of the runs: the instructions, the memory & the depth of
+# the calls of the programs
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+import pytest
+from programs import program
+from uc_interpreter import Interpreter
+from uc_limits import LimitExceeded, Limits
+
+NO_RETURN = [
+    ("define", "@main"),
+    ("literal_int", 1, "%1"),
+    ("print_int", "%1"),
+]
+
+
+def _run(name, stdin="", **limits):
+    return Interpreter(capture=True, limits=Limits(**limits)).run(program(name), stdin)
+
+
+def test_instructions():
+    result = _run("rsum", "100", instructions=10**6)
+    assert (result.stdout, result.error) == ("5050\n", None)
+    limited = _run("rsum", "100", instructions=result.instructions - 1)
+    assert limited.exit_code == 1
+    assert isinstance(limited.error, LimitExceeded)
+    assert limited.instructions == result.instructions - 1
+
+
+@pytest.mark.parametrize("interval", [1, 2, 100])
+def test_end_of_program(interval):
+    # a program that ends without return, at the limit of instructions
+    limits = Limits(instructions=len(NO_RETURN), interval=interval)
+    result = Interpreter(capture=True, limits=limits).run(NO_RETURN)
+    assert (result.stdout, result.exit_code) == ("1", 0)
+
+
+def test_vectorized_loops():
+    # the loops run one instruction at a time, so they are all counted
+    vm = Interpreter(capture=True, limits=Limits(instructions=10**7))
+    result = vm.run(program("vector"))
+    assert vm.vector_loops == {}
+    scalar = Interpreter(capture=True, vectorize=False, limits=Limits())
+    assert result.instructions == scalar.run(program("vector")).instructions
+
+
+@pytest.mark.parametrize(
+    "name, stdin", [("rsum", "100"), ("primes", "2 300"), ("bubble", "5\n3 1 2 5 4")]
+)
+def test_superinstructions(name, stdin):
+    # the instructions are not fused, so they are all counted
+    vm = Interpreter(capture=True, limits=Limits())
+    result = vm.run(program(name), stdin)
+    assert not vm.fusions
+    plain = Interpreter(capture=True, fuse=False, limits=Limits())
+    assert result.instructions == plain.run(program(name), stdin).instructions
+
+
+def test_memory():
+    result = _run("vector", memory=1000)
+    assert result.exit_code == 1
+    assert (result.error.limit, result.error.maximum) == ("memory", 1000)
+
+
+def test_depth():
+    result = _run("rsum", "100", depth=50, interval=16)
+    assert (result.error.limit, result.error.maximum) == ("depth", 50)
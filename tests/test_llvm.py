@@ -0,0 +1,149 @@
+# ---------------------------------------------------------------------------------
+# uc: tests/test_llvm.py
+#
+# Tests of the LLVMEngine: the outputs of the programs run natively (or by the
+# interpreter, as a fallback) are the same of the original interpreter
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+import io
+import os
+import subprocess
+import sys
+import threading
+import pytest
+import uc_llvm
+from programs import CASES, IDS, path, program
+from uc_interpreter import Interpreter
+from uc_llvm import LLVMEngine, LoweringError, ir
+
+native = pytest.mark.skipif(ir is None, reason="llvmlite is not installed")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DIVISION = [
+    ("define", "@main"),
+    ("read_int", "%1"),
+    ("literal_int", 10, "%2"),
+    ("div_int", "%2", "%1", "%3"),
+    ("print_int", "%3"),
+    ("return_void",),
+]
+
+READ = [
+    ("define", "@main"),
+    ("read_int", "%1"),
+    ("print_int", "%1"),
+    ("read_char", "%2"),
+    ("print_char", "%2"),
+    ("return_void",),
+]
+
+
+@pytest.mark.parametrize("name, stdin, stdout, code", CASES, ids=IDS)
+def test_output(name, stdin, stdout, code):
+    result = LLVMEngine(capture=True).run(program(name), stdin)
+    assert (result.stdout, result.exit_code) == (stdout, code)
+
+
+@native
+def test_native():
+    engine = LLVMEngine(capture=True)
+    assert engine.run(program("gcd"), "48 18").stdout == "GCD is 6\n"
+    assert engine.fallback is None
+
+
+@native
+def test_end_of_input():
+    # the ProgramExit of a shim ends the program, not the process
+    expected = Interpreter(capture=True).run(program("gcd"), "48")
+    engine = LLVMEngine(capture=True)
+    result = engine.run(program("gcd"), "48")
+    assert (result.stdout, result.exit_code) == (expected.stdout, 1)
+    assert engine.fallback is None
+
+
+@native
+def test_zero_division():
+    with pytest.raises(ZeroDivisionError):
+        LLVMEngine(capture=True).run(DIVISION, "0")
+    assert LLVMEngine(capture=True).run(DIVISION, "-3").stdout == "-4\n"
+
+
+@native
+def test_overflow():
+    # the ints of the interpreter have no limit: the program runs again
+    # in it, reading the same input from the stream
+    engine = LLVMEngine(capture=True)
+    result = engine.run(program("fat"), io.BytesIO(b"25\n"))
+    assert result.stdout == "%d\n" % 15511210043330985984000000
+    assert "overflow" in engine.fallback
+
+
+@native
+def test_deep_recursion():
+    # a recursion deeper than the native stack ends as in the interpreter,
+    # with a StackOverflow, not with a crash of the process
+    process = subprocess.run(
+        [sys.executable, "uc_run.py", path("rsum"), "-engine=llvm"],
+        input="1000000\n",
+        capture_output=True,
+        text=True,
+        cwd=ROOT,
+        timeout=120,
+    )
+    assert process.returncode == 1
+    assert "Stack overflow" in process.stderr
+    engine = LLVMEngine(capture=True)
+    assert engine.run(program("rsum"), "100000").stdout == "5000050000\n"
+    assert "native stack" in engine.fallback
+
+
+@native
+def test_threads():
+    # the engines in threads share the shims of the process, each one
+    # printing to its own output
+    results = {}
+
+    def _run(n):
+        engine = LLVMEngine(capture=True)
+        for _ in range(3):
+            results[n] = (engine.run(program("rsum"), str(n)).stdout, engine.fallback)
+
+    threads = [threading.Thread(target=_run, args=(n,)) for n in range(100, 108)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {n: ("%d\n" % sum(range(n + 1)), None) for n in range(100, 108)}
+    assert uc_llvm._engines == {}
+    assert len(uc_llvm._callbacks) == len(uc_llvm.SHIMS)
+
+
+@native
+@pytest.mark.parametrize("stdin", ["abc x", "3 xy", "99999999999999999999 x"])
+def test_input(stdin):
+    # an input that the native types can't hold runs in the interpreter
+    expected = Interpreter(capture=True).run(READ, stdin).stdout
+    engine = LLVMEngine(capture=True)
+    assert engine.run(READ, stdin).stdout == expected
+    assert engine.fallback is not None
+
+
+@native
+def test_print_string():
+    # only the global strings are printed by the native code
+    code = [
+        ("global_string", "@.str.0", "hi"),
+        ("define", "@main"),
+        ("alloc_char_2", "%1"),
+        ("store_char_2", "@.str.0", "%1"),
+        ("print_string", "%1"),
+        ("return_void",),
+    ]
+    with pytest.raises(LoweringError):
+        LLVMEngine()._lower(code)
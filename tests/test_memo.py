@@ -0,0 +1,44 @@
+# ---------------------------------------------------------------------------------
+# uc: tests/test_memo.py
+#
+# Tests of the memoized calls of the pure functions: the same output, with the
+# calls answered by their tables
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+from programs import program
+from uc_interpreter import Interpreter
+from uc_limits import Limits
+
+
+def test_memoized():
+    plain = Interpreter(capture=True).run(program("fib"), "20")
+    vm = Interpreter(capture=True, memoize=True)
+    result = vm.run(program("fib"), "20")
+    assert (result.stdout, plain.stdout) == ("6765\n", "6765\n")
+    (memo,) = vm.memos.values()
+    assert memo.hits > 0 and memo.misses == 21
+    # the tables are kept by each rerun
+    vm.load(program("fib"))
+    vm.rerun("20")
+    (memo,) = vm.memos.values()
+    assert vm.rerun("20").stdout == "6765\n"
+    assert (memo.hits, memo.misses) == (19, 21)
+
+
+def test_impure():
+    # the functions that print or read are not memoized
+    vm = Interpreter(capture=True, memoize=True)
+    vm.run(program("gcd"), "48 18")
+    assert all(memo.name != "@main" for memo in vm.memos.values())
+
+
+def test_limits():
+    # with limits, the calls are run and counted
+    vm = Interpreter(capture=True, memoize=True, limits=Limits())
+    assert vm.run(program("fib"), "10").stdout == "55\n"
+    assert vm.memos == {}
@@ -0,0 +1,131 @@
+# ---------------------------------------------------------------------------------
+# uc: tests/test_memory.py
+#
+# Tests of the memory of the interpreter: the typed & paged segments of the
+# arrays
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+import pytest
+from uc_interpreter import Interpreter
+from uc_memory import (
+    BOOL,
+    FLOAT,
+    INT,
+    PAGE_SIZE,
+    Memory,
+    OutOfRange,
+    StackOverflow,
+)
+
+BOOLS = [
+    ("global_bool_3", "@b", [True, False, True]),
+    ("define", "@main"),
+    ("alloc_bool_2", "%1"),
+    ("literal_int", 1, "%2"),
+    ("elem_bool", "@b", "%2", "%3"),
+    ("load_bool_*", "%3", "%4"),
+    ("print_bool", "%4"),
+    ("elem_bool", "%1", "%2", "%5"),
+    ("literal_int", 1, "%6"),
+    ("store_bool_*", "%6", "%5"),
+    ("load_bool_*", "%5", "%7"),
+    ("print_bool", "%7"),
+    ("return_void",),
+]
+
+BIG = [
+    ("global_int_2", "@v", [1, 2]),
+    ("define", "@main"),
+    ("literal_int", 0, "%1"),
+    ("elem_int", "@v", "%1", "%2"),
+    ("literal_int", 1 << 63, "%3"),
+    ("store_int_*", "%3", "%2"),
+    ("return_void",),
+]
+
+
+def test_round_trip():
+    memory = Memory()
+    for segment, values in [(INT, [1, -2, 3]), (FLOAT, [0.5, 2.0]), (BOOL, [1, 0])]:
+        address = memory.alloc(segment, len(values))
+        memory.write(address, values)
+        assert [memory.load(address + i) for i in range(len(values))] == values
+
+
+def test_bools():
+    # the elements of a bool array are bools, not ints
+    memory = Memory()
+    address = memory.alloc(BOOL, 2)
+    memory.store(address, True)
+    assert memory.load(address) is True
+    assert memory.load(address + 1) is False
+    result = Interpreter(capture=True).run(BOOLS)
+    assert result.stdout == "FalseTrue\n"
+
+
+def test_out_of_range():
+    memory = Memory()
+    address = memory.alloc(INT, 2)
+    with pytest.raises(OutOfRange):
+        memory.store(address, 1 << 63)
+    with pytest.raises(OutOfRange):
+        memory.write(address, [1, -(1 << 64)])
+    # the program stops, the interpreter does not
+    result = Interpreter(capture=True).run(BIG)
+    assert result.exit_code == 1
+    assert isinstance(result.error, OutOfRange)
+
+
+def test_pages_lazy():
+    # an array costs nothing until touched, and only its touched pages
+    memory = Memory()
+    address = memory.alloc(INT, 1 << 24)
+    assert len(memory.pages) <= 1
+    memory.store(address + (1 << 23), 7)
+    assert memory.load(address + (1 << 23)) == 7
+    assert memory.load(address + (1 << 22)) == 0
+    assert len(memory.pages) <= 2
+
+
+def test_release():
+    # the cells & pages allocated after a mark are freed by release
+    memory = Memory()
+    memory.push(3)
+    mark = memory.mark()
+    memory.push(5)
+    address = memory.alloc(INT, 3 * PAGE_SIZE)
+    memory.write(address, range(3 * PAGE_SIZE))
+    memory.release(mark)
+    assert (len(memory.cells), memory.tops[INT], memory.pages) == (3, 0, {})
+    # the memory released is zero-filled again by alloc
+    address = memory.alloc(INT, 4)
+    assert [memory.load(address + i) for i in range(4)] == [0, 0, 0, 0]
+
+
+def test_stack_overflow():
+    memory = Memory(stack_limit=8)
+    memory.push(8)
+    with pytest.raises(StackOverflow):
+        memory.push(1)
+
+
+def test_strings_shared():
+    # the string constants with the same text share their cell
+    vm = Interpreter()
+    vm.load(
+        [
+            ("global_string", "@.str.0", "abc"),
+            ("global_string", "@.str.1", "abc"),
+            ("global_string", "@.str.2", "abd"),
+            ("define", "@main"),
+            ("return_void",),
+        ]
+    )
+    assert vm.globals["@.str.0"] == vm.globals["@.str.1"]
+    assert vm.globals["@.str.0"] != vm.globals["@.str.2"]
+    assert vm.pool.chars("abc") is vm.pool.chars("abc")
@@ -0,0 +1,72 @@
+# ---------------------------------------------------------------------------------
+# uc: tests/test_profiler.py
+#
+# Tests of the Profiler: the counts of the instructions, functions & labels of
+# the programs profiled
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+import json
+from programs import path, program
+from uc_interpreter import Interpreter
+from uc_irtext import read_coords
+from uc_limits import Limits
+from uc_profiler import Profiler
+
+
+def test_report(tmp_path):
+    profiler = Profiler(capture=True, fuse=False)
+    result = profiler.run(program("rsum"), "10")
+    assert result.stdout == "55\n"
+    report = profiler.report()
+    # the same instructions counted by the limits of the interpreter (a
+    # superinstruction of the profile counts as one)
+    vm = Interpreter(limits=Limits(instructions=10**6), capture=True)
+    assert report["instructions"] == vm.run(program("rsum"), "10").instructions
+    assert report["functions"]["rsum"]["calls"] == 11
+    assert report["functions"]["main"]["calls"] == 1
+    assert report["opcodes"]["call"]["count"] == 11
+    assert report["memory"]["peak_cells"] > 0
+    profiler.write_report(str(tmp_path / "rsum.json"))
+    with open(str(tmp_path / "rsum.json")) as stream:
+        assert json.load(stream)["instructions"] == report["instructions"]
+
+
+def test_rerun():
+    # the report of a run doesn't count the former runs
+    profiler = Profiler(capture=True)
+    profiler.run(program("rsum"), "10")
+    first = profiler.report()
+    profiler.run(program("rsum"), "10")
+    report = profiler.report()
+    assert report["instructions"] == first["instructions"]
+    assert report["functions"]["rsum"]["calls"] == 11
+    assert report["functions"]["main"]["calls"] == 1
+    assert report["memory"] == first["memory"]
+
+
+def test_folded(tmp_path):
+    profiler = Profiler(capture=True)
+    profiler.run(program("rsum"), "3")
+    profiler.write_folded(str(tmp_path / "rsum.folded"))
+    with open(str(tmp_path / "rsum.folded")) as stream:
+        stacks = [line.rsplit(" ", 1)[0] for line in stream]
+    assert "main;rsum;rsum;rsum;rsum" in stacks
+
+
+def test_lines():
+    # the instructions run by each line of the source
+    profiler = Profiler(capture=True, fuse=False, vectorize=False)
+    profiler.run(program("lines"))
+    lines = read_coords(path("lines"))
+    profile = profiler.line_profile(lines)
+    assert profile[5]["count"] == 9 * 6
+    total = sum(entry["count"] for entry in profile.values())
+    with open(path("lines")[: -len(".ir")] + ".uc") as source:
+        annotated = profiler.annotate(source.read(), lines).splitlines()
+    assert annotated[5].split()[:2] == ["54", "%.1f%%" % (100.0 * 54 / total)]
+    assert annotated[5].endswith("s = s + k * i;")
@@ -0,0 +1,78 @@
+# ---------------------------------------------------------------------------------
+# uc: tests/test_run.py
+#
+# Tests of the command line of uc_run.py: the engines & the options of the runs
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+import io
+import json
+import shutil
+import sys
+import pytest
+import uc_run
+from programs import path
+
+
+def _run(monkeypatch, capfd, *args, stdin=""):
+    # The exit code, the output & the errors of uc_run.py with args
+    monkeypatch.setattr(sys, "argv", ["uc_run.py"] + list(args))
+    monkeypatch.setattr(sys, "stdin", io.StringIO(stdin))
+    with pytest.raises(SystemExit) as exit:
+        uc_run.run()
+    out, err = capfd.readouterr()
+    return exit.value.code, out, err
+
+
+@pytest.mark.parametrize("engine", ["interpreter", "python", "llvm"])
+def test_engines(monkeypatch, capfd, engine):
+    code, out, err = _run(
+        monkeypatch, capfd, path("gcd"), "-engine=" + engine, stdin="48 18"
+    )
+    assert (code, out) == (0, "GCD is 6\n")
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        ["-engine=python", "-memoize"],
+        ["-engine=llvm", "-max-instructions=100"],
+        ["-engine=python", "-trace=10"],
+        ["-engine=llvm", "-profile"],
+        ["-profile", "-max-time=1"],
+        ["-lines", "-max-instructions=100"],
+        ["-memoize", "-max-depth=10"],
+        ["-max-memory=x"],
+    ],
+)
+def test_conflicts(monkeypatch, capfd, options):
+    # the options that can't be honored are rejected, not ignored
+    code, out, err = _run(monkeypatch, capfd, path("gcd"), *options)
+    assert code == 1
+    assert out.startswith("Option ") or out.startswith("Unknown option")
+
+
+def test_limits(monkeypatch, capfd):
+    code, out, err = _run(
+        monkeypatch, capfd, path("rsum"), "-max-instructions=100", stdin="50"
+    )
+    assert code == 1
+    assert "instructions (100 of 100)" in err
+
+
+def test_profile_memoize(monkeypatch, capfd, tmp_path):
+    shutil.copy(path("fib"), str(tmp_path))
+    filename = str(tmp_path / "fib.ir")
+    code, out, err = _run(
+        monkeypatch, capfd, filename, "-profile", "-memoize", "-report", stdin="25"
+    )
+    assert (code, out) == (0, "75025\n")
+    assert "@fib" in err.split("\n\n")[-1]
+    with open(str(tmp_path / "fib.profile.json")) as stream:
+        report = json.load(stream)
+    # the calls answered by the table are not run
+    assert report["functions"]["fib"]["calls"] < 100
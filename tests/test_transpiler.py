@@ -0,0 +1,68 @@
+# ---------------------------------------------------------------------------------
+# uc: tests/test_transpiler.py
+#
+# Tests of the Transpiler: the outputs of the programs translated to Python are
+# the same of the original interpreter
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+import sys
+import threading
+import pytest
+import uc_transpiler
+from programs import CASES, IDS, program
+from uc_transpiler import Transpiler
+
+
+@pytest.mark.parametrize("name, stdin, stdout, code", CASES, ids=IDS)
+def test_output(name, stdin, stdout, code):
+    result = Transpiler(capture=True).run(program(name), stdin)
+    assert (result.stdout, result.exit_code) == (stdout, code)
+
+
+def test_translated_once():
+    # the code object is cached by the hash of the program
+    Transpiler.cache.clear()
+    vm = Transpiler(capture=True)
+    vm.run(program("gcd"), "48 18")
+    assert "def uc_gcd(" in vm.source
+    other = Transpiler(capture=True)
+    result = other.run(program("gcd"), "1071 462")
+    assert (other.source, result.stdout) == (None, "GCD is 21\n")
+
+
+def test_cache_size(monkeypatch):
+    # the least recently used program is dropped first
+    monkeypatch.setattr(uc_transpiler, "CACHE_SIZE", 2)
+    Transpiler.cache.clear()
+    for name, stdin in [("gcd", "48 18"), ("rsum", "10"), ("gcd", "1 1")]:
+        Transpiler(capture=True).run(program(name), stdin)
+    Transpiler(capture=True).run(program("fat"), "5")
+    assert len(Transpiler.cache) == 2
+    vm = Transpiler(capture=True)
+    vm.run(program("gcd"), "48 18")
+    assert vm.source is None
+    vm.run(program("rsum"), "10")
+    assert "def uc_rsum(" in vm.source
+
+
+def test_threads():
+    # the runs in threads share the recursion limit of the process, that
+    # is restored when the last one ends
+    limit = sys.getrecursionlimit()
+    results = {}
+
+    def _run(n):
+        results[n] = Transpiler(capture=True).run(program("rsum"), str(n)).stdout
+
+    threads = [threading.Thread(target=_run, args=(n,)) for n in range(2000, 2008)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {n: "%d\n" % sum(range(n + 1)) for n in range(2000, 2008)}
+    assert sys.getrecursionlimit() == limit
@@ -0,0 +1,39 @@
+# ---------------------------------------------------------------------------------
+# uc: tests/test_vector.py
+#
+# Tests of the loops run as NumPy operations: the outputs are the same of the
+# loops run one instruction at a time
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+import pytest
+import uc_vector
+from programs import program
+from uc_interpreter import Interpreter
+
+pytestmark = pytest.mark.skipif(uc_vector.numpy is None, reason="no numpy")
+
+
+def _run(**options):
+    vm = Interpreter(capture=True, **options)
+    return vm, vm.run(program("vector"))
+
+
+def test_vectorized():
+    vm, result = _run()
+    assert sum(loop.runs for loop in vm.vector_loops.values()) > 1
+    assert len(vm.vector_report().splitlines()) == len(vm.vector_loops)
+    assert result.stdout == _run(vectorize=False)[1].stdout
+
+
+def test_chunks(monkeypatch):
+    # a long loop runs in chunks, with the same result
+    report = _run()[0].vector_report()
+    monkeypatch.setattr(uc_vector, "MAX_TRIP_COUNT", 100)
+    vm, result = _run()
+    assert vm.vector_report() == report
+    assert result.stdout == _run(vectorize=False)[1].stdout
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# ---------------------------------------------------------------------------------
+# uc: uc_async.py
+#
+# AsyncInterpreter class: runs the uC intermediate representation in an asyncio
+#                         event loop, so one process serves many interactive
+#                         runs at once (see uc_interpreter.py)
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+import asyncio
+import codecs
+import sys
+import time
+from collections.abc import Sequence
+from uc_interpreter import Interpreter, ProgramExit
+from uc_io import BUFFER_SIZE, InputSource, OutputBuffer
+from uc_irtext import read_ir
+from uc_limits import LimitExceeded
+from uc_memory import DEFAULT_STACK_LIMIT, OutOfRange, StackOverflow
+
+# Number of instructions run before yielding to the event loop
+YIELD_INTERVAL = 1 << 10
+
+
+class NeedInput(Exception):
+    """ Raised by a read when the text received so far has no token. """
+
+    pass
+
+
+class AsyncInputSource(InputSource):
+    """
+    Input of the read_* opcodes from an asyncio stream (e.g. the reader
+    of a connection), or from a str, a bytes or a list as InputSource.
+    A read that needs more text than received raises NeedInput, with
+    nothing consumed, so it can be run again after refill.
+    """
+
+    def __init__(self, source=None):
+        super().__init__(source)
+        self.decoder = codecs.getincrementaldecoder("utf-8")("replace")
+
+    def _fill(self):
+        raise NeedInput()
+
+    async def refill(self):
+        # Wait for more text from the stream (None after its end)
+        while True:
+            _data = await self.stream.read(BUFFER_SIZE)
+            _chunk = _data
+            if isinstance(_data, bytes):
+                # a char may be split between two chunks
+                _chunk = self.decoder.decode(_data, final=not _data)
+            if _chunk or not _data:
+                break
+        if not _chunk:
+            self.stream = None
+        else:
+            self.text = self.text[self.pos :] + _chunk
+            self.pos = 0
+
+
+class _WriterSink(object):
+    # Binary sink of the output over an asyncio stream writer: the text
+    # is queued in the writer, and drained by the interpreter
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def write(self, data):
+        self.writer.write(data)
+
+    def flush(self):
+        pass
+
+
+class AsyncInterpreter(Interpreter):
+    """
+    Interpreter that runs in an asyncio event loop.  The read_* opcodes
+    wait for the input of an asyncio stream without blocking the loop,
+    the output goes to an asyncio stream writer, and the program yields
+    to the loop every interval instructions, so many programs run at
+    once in a single thread, each getting its turn:
+
+        async def session(reader, writer):
+            vm = AsyncInterpreter(output=writer)
+            result = await vm.run(ircode, reader)
+            writer.close()
+
+        await asyncio.start_server(session, port=8921)
+
+    The output is flushed before waiting for the input (the prompt) and
+    when the program ends.  With capture, or without an output writer,
+    it is the same as in the Interpreter.  A read without input runs
+    again when the input arrives, so the reads are never fused into a
+    superinstruction, and the hooks (see uc_hooks) are not supported.
+    """
+
+    def __init__(
+        self,
+        stack_limit=DEFAULT_STACK_LIMIT,
+        output=None,
+        flush="exit",
+        limits=None,
+        capture=False,
+        interval=YIELD_INTERVAL,
+        fuse=True,
+        vectorize=True,
+        pack=True,
+        memoize=False,
+    ):
+        if interval < 1:
+            raise ValueError("The yield interval must be positive")
+        self.interval = interval
+        super().__init__(
+            stack_limit,
+            output,
+            flush,
+            fuse,
+            vectorize,
+            limits,
+            capture,
+            pack,
+            memoize,
+        )
+
+    def _reset(self):
+        super()._reset()
+        if hasattr(self.sink, "drain") and not self.capture:
+            self.output = OutputBuffer(
+                _WriterSink(self.sink), self.flush, encoding="utf-8"
+            )
+
+    async def run(self, ircode, stdin=None):
+        """
+        Run intermediate code, reading the input from stdin: an asyncio
+        stream (with a coroutine read), a str, a bytes or a list of the
+        values to be read.  Returns its RunResult, as Interpreter.run.
+        """
+        if self.hooks:
+            raise ValueError("The AsyncInterpreter doesn't run hooks")
+        if not isinstance(ircode, Sequence):
+            ircode = list(ircode)
+        self._reset()
+        _start = time.perf_counter()
+        _code = 0
+        _error = None
+        try:
+            self._load(ircode)
+            self._enter_main(AsyncInputSource(stdin))
+            await self._dispatch_async(self.program)
+        except ProgramExit as e:
+            _code = e.code
+        except (LimitExceeded, StackOverflow, OutOfRange) as e:
+            _code = 1
+            _error = e
+        finally:
+            self.output.flush()
+            await self._drain()
+        return self._run_result(_code, _error, _start)
+
+    async def _drain(self):
+        if hasattr(self.sink, "drain") and not self.capture:
+            await self.sink.drain()
+
+    async def _dispatch_async(self, program):
+        # The program runs in slices of interval instructions (or of the
+        # instructions left to the limit), and yields to the event loop
+        # between them. A read without input is run again after waiting.
+        limits = self.limits
+        _start = time.monotonic()
+        while self.pc < len(program):
+            _slice = self.interval
+            if limits is not None and limits.instructions is not None:
+                _slice = min(_slice, limits.instructions - self.executed)
+                if _slice <= 0:
+                    raise self._limit_exceeded(
+                        "instructions", limits.instructions, self.executed
+                    )
+            try:
+                if not self._run_slice(program, _slice):
+                    return
+            except NeedInput:
+                self.output.flush()
+                await self._drain()
+                await self.input.refill()
+                continue
+            if limits is not None:
+                self._check_limits(_start)
+            await self._drain()
+            await asyncio.sleep(0)
+
+    def _decode_program(self, ircode):
+        # The reads are wrapped before the fusion, so they are never part
+        # of a superinstruction (see Interpreter._fuse)
+        program = super()._decode_program(ircode)
+        for pc, (handler, args) in enumerate(program):
+            if getattr(handler, "__name__", "").startswith("run_read_"):
+                program[pc] = (self._run_read, (pc, handler, args))
+        return program
+
+    def _run_read(self, pc, handler, args):
+        # A read without input runs again from its pc, after the refill
+        try:
+            handler(*args)
+        except NeedInput:
+            self.pc = pc
+            raise
+
+    def _run_slice(self, program, count):
+        # Run at most count instructions, False at the end of the program
+        _done = 0
+        try:
+            for _done in range(count):
+                try:
+                    handler, args = program[self.pc]
+                except IndexError:
+                    return False
+                self.pc += 1
+                handler(*args)
+            _done = count
+            return True
+        finally:
+            self.executed += _done
+
+
+def run():
+    """ Serves the program of the command line on a port. """
+
+    if len(sys.argv) < 2:
+        print("Usage: ./uc_async.py <ir-file> [-port=N]")
+        sys.exit(1)
+
+    port = 8921
+
+    params = sys.argv[1:]
+    files = sys.argv[1:]
+
+    for param in params:
+        if param[0] == "-":
+            if param.startswith("-port=") and param[6:].isdigit():
+                port = int(param[6:])
+            else:
+                print("Unknown option: %s" % param)
+                sys.exit(1)
+            files.remove(param)
+
+    ircode = read_ir(files[0])
+
+    async def session(reader, writer):
+        # each connection runs the program, with its input & output
+        try:
+            await AsyncInterpreter(output=writer, flush="line").run(ircode, reader)
+        finally:
+            writer.close()
+
+    async def serve():
+        server = await asyncio.start_server(session, port=port)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# ---------------------------------------------------------------------------------
+# uc: uc_batch.py
+#
+# Runs a program in the uC intermediate representation over many inputs, in a
+# pool of worker processes forked after the program is loaded
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+import multiprocessing
+import os
+import sys
+from uc_interpreter import Interpreter
+from uc_irtext import read_ir
+from uc_transpiler import Transpiler
+
+# Engines that can run a loaded program again (see Interpreter.rerun)
+ENGINES = {
+    "interpreter": Interpreter,
+    "python": Transpiler,
+}
+
+# The interpreter loaded by the parent, inherited by the forked workers
+_loaded = None
+
+
+def _rerun(stdin):
+    return _loaded.rerun(stdin)
+
+
+class BatchRunner(object):
+    """
+    Runs the same program over many inputs.  The program is loaded once
+    (the globals & constants stored, the code decoded or compiled), then
+    the pool of workers is forked, so each worker starts with a copy of
+    the loaded interpreter, and each input runs from the state after the
+    load (see Interpreter.load & rerun):
+
+        runner = BatchRunner(ircode, processes=8)
+        for result in runner.run(["10", "20", "30"]):
+            print(result.exit_code, result.stdout)
+
+    The results (see RunResult) are returned in the order of the inputs,
+    with the output captured.  Without fork (e.g. on Windows), or with a
+    single process, the inputs run one after the other in this process.
+    """
+
+    def __init__(self, ircode, engine=Interpreter, processes=None, **options):
+        self.vm = engine(capture=True, **options)
+        self.vm.load(ircode)
+        self.processes = processes or os.cpu_count() or 1
+
+    def run(self, inputs, chunksize=1):
+        """
+        Run the program for each input (a str, a bytes or a list of the
+        values to be read) and return the list of results.
+        """
+        global _loaded
+        inputs = list(inputs)
+        _processes = min(self.processes, len(inputs))
+        if _processes <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+            return [self.vm.rerun(stdin) for stdin in inputs]
+        _loaded = self.vm
+        try:
+            _context = multiprocessing.get_context("fork")
+            with _context.Pool(_processes) as pool:
+                return pool.map(_rerun, inputs, chunksize)
+        finally:
+            _loaded = None
+
+
+def run():
+    """ Runs the program of the command line over each input file. """
+
+    if len(sys.argv) < 3:
+        print(
+            "Usage: ./uc_batch.py <ir-file> <input-file>... "
+            "[-engine=interpreter|python] [-processes=N]"
+        )
+        sys.exit(1)
+
+    engine = "interpreter"
+    processes = None
+
+    params = sys.argv[1:]
+    files = sys.argv[1:]
+
+    for param in params:
+        if param[0] == "-":
+            if param.startswith("-engine=") and param[8:] in ENGINES:
+                engine = param[8:]
+            elif param.startswith("-processes=") and param[11:].isdigit():
+                processes = int(param[11:])
+            else:
+                print("Unknown option: %s" % param)
+                sys.exit(1)
+            files.remove(param)
+
+    # The output of each input file goes to <input-file>.out, and its
+    # exit code to the stdout
+    runner = BatchRunner(read_ir(files[0]), ENGINES[engine], processes)
+    inputs = []
+    for file in files[1:]:
+        with open(file, "r") as input_file:
+            inputs.append(input_file.read())
+    failed = 0
+    for file, result in zip(files[1:], runner.run(inputs)):
+        with open(file + ".out", "w") as output_file:
+            output_file.write(result.stdout)
+        if result.error is not None:
+            print("%s %s %s" % (file, result.exit_code, result.error))
+        else:
+            print("%s %s" % (file, result.exit_code))
+        failed += result.exit_code != 0
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# ---------------------------------------------------------------------------------
+# uc: uc_binary.py
+#
+# Compact binary format of the uC intermediate representation: a writer, and a
+# reader that maps the file in memory and decodes the instructions lazily
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+import mmap
+import struct
+import sys
+from collections.abc import Sequence
+from uc_irtext import read_ir
+
+# Layout of the file (little endian):
+#
+#   header        magic, version, the size in bytes of the items of the 3
+#                 tables (1, 2 or 4, the smallest that fits), the number of
+#                 constants, instructions & operands
+#   constants     offset of each constant in the data
+#   instructions  index of the first operand of each instruction, plus one
+#                 at the end
+#   operands      the operands of the instructions: the constant of the
+#                 opcode followed by the constants of the arguments
+#   data          the constants: a tag & the encoded value
+#
+# Every opcode (e.g. 'load_int_10' or the label '9') and every argument
+# (register, global, literal, initializer) is a constant of the table, so
+# each of them is stored once, and an instruction is just integers.
+MAGIC = b"uCIR"
+VERSION = 1
+HEADER = struct.Struct("<4sBBBBIII")
+
+# Typecode of the items of a table, by size
+SIZES = {1: "B", 2: "H", 4: "I"}
+
+# Tags of the constants
+NONE, FALSE, TRUE, INT32, INT64, BIGINT, FLOAT, STR, LIST = b"NFTiqIfsl"
+
+WORD = struct.Struct("<I")
+DOUBLE = struct.Struct("<d")
+LONG_STR = 255  # Length of a string that takes a word
+
+
+def _size(maximum):
+    # The size of the items of a table whose largest item is maximum
+    return 1 if maximum < 1 << 8 else 2 if maximum < 1 << 16 else 4
+
+
+class FormatError(Exception):
+    """ Raised when a file is not in the binary format of the uCIR. """
+
+    pass
+
+
+class _Table(object):
+    # The table of constants built by the writer: each distinct value gets
+    # an index, and is encoded once in the data
+
+    def __init__(self):
+        self.indexes = {}  # Dictionary of key of the value -> index
+        self.offsets = []  # Offset of each constant in the data
+        self.data = bytearray()
+
+    def index(self, value):
+        if isinstance(value, (list, tuple)):
+            _items = tuple(self.index(_item) for _item in value)
+            _key = ("list", _items)
+        else:
+            # 1, 1.0 & True are the same key of a dict, so use the type
+            _key = (type(value), repr(value))
+            _items = None
+        _index = self.indexes.get(_key)
+        if _index is None:
+            _index = self.indexes[_key] = len(self.offsets)
+            self.offsets.append(len(self.data))
+            self._encode(value, _items)
+        return _index
+
+    def _encode(self, value, items):
+        data = self.data
+        if items is not None:
+            data.append(LIST)
+            data += WORD.pack(len(items))
+            data += struct.pack("<%dI" % len(items), *items)
+        elif value is None:
+            data.append(NONE)
+        elif value is True or value is False:
+            data.append(TRUE if value else FALSE)
+        elif isinstance(value, int):
+            if -(1 << 31) <= value < (1 << 31):
+                data.append(INT32)
+                data += struct.pack("<i", value)
+            elif -(1 << 63) <= value < (1 << 63):
+                data.append(INT64)
+                data += struct.pack("<q", value)
+            else:
+                data.append(BIGINT)
+                self._encode_text(str(value).encode())
+        elif isinstance(value, float):
+            data.append(FLOAT)
+            data += DOUBLE.pack(value)
+        elif isinstance(value, str):
+            data.append(STR)
+            self._encode_text(value.encode("utf-8", "surrogatepass"))
+        else:
+            raise TypeError("Can't encode %r in the uCIR" % (value,))
+
+    def _encode_text(self, text):
+        # the length in a byte, or LONG_STR & the length in a word
+        if len(text) < LONG_STR:
+            self.data.append(len(text))
+        else:
+            self.data.append(LONG_STR)
+            self.data += WORD.pack(len(text))
+        self.data += text
+
+
+def dump_binary(ircode, filename):
+    """ Write the instruction tuples of ircode in the binary format """
+    table = _Table()
+    starts = []
+    operands = []
+    for op in ircode:
+        starts.append(len(operands))
+        operands.extend(table.index(_arg) for _arg in op)
+    starts.append(len(operands))
+    _tables = (table.offsets, starts, operands)
+    _sizes = [_size(max(_items, default=0)) for _items in _tables]
+    with open(filename, "wb") as binary_file:
+        binary_file.write(
+            HEADER.pack(
+                MAGIC,
+                VERSION,
+                *_sizes,
+                len(table.offsets),
+                len(ircode),
+                len(operands),
+            )
+        )
+        for _items, _item_size in zip(_tables, _sizes):
+            binary_file.write(
+                struct.pack("<%d%s" % (len(_items), SIZES[_item_size]), *_items)
+            )
+        binary_file.write(table.data)
+
+
+class BinaryProgram(Sequence):
+    """
+    The instruction tuples of a binary uCIR file.  The file is mapped in
+    memory, and each instruction (and each constant) is decoded the first
+    time it is used, so opening a program costs nothing but the header.
+    It is a sequence, as the list of tuples read from a .ir file, and so
+    can be run by the engines as is:
+
+        with BinaryProgram("prog.irb") as ircode:
+            Interpreter().run(ircode)
+    """
+
+    def __init__(self, filename):
+        with open(filename, "rb") as binary_file:
+            try:
+                self.map = mmap.mmap(binary_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise FormatError("%s: empty file" % filename)
+        try:
+            _header = HEADER.unpack_from(self.map)
+        except struct.error:
+            _header = (None, None)
+        if _header[:2] != (MAGIC, VERSION):
+            self.map.close()
+            raise FormatError("%s: not a binary uCIR file" % filename)
+        _, _, _offset, _start, _operand, _constants, _length, _operands = _header
+        # Each table as (offset in the file, size & typecode of the items)
+        self.offsets = (HEADER.size, _offset, SIZES[_offset])
+        self.starts = (self.offsets[0] + _offset * _constants, _start, SIZES[_start])
+        self.operands = (
+            self.starts[0] + _start * (_length + 1),
+            _operand,
+            SIZES[_operand],
+        )
+        self.data = self.operands[0] + _operand * _operands
+        self.length = _length
+        self.constants = [None] * _constants  # Constants decoded
+        self.decoded = [False] * _constants
+        self.code = [None] * _length  # Instructions decoded
+
+    def _items(self, table, index, count):
+        # count items of the table, from the index
+        _offset, _size, _typecode = table
+        return struct.unpack_from(
+            "<%d%s" % (count, _typecode), self.map, _offset + _size * index
+        )
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, pc):
+        if isinstance(pc, slice):
+            return [self[_pc] for _pc in range(*pc.indices(self.length))]
+        if pc < 0:
+            pc += self.length
+        if not 0 <= pc < self.length:
+            raise IndexError("instruction index out of range")
+        op = self.code[pc]
+        if op is None:
+            _first, _end = self._items(self.starts, pc, 2)
+            _operands = self._items(self.operands, _first, _end - _first)
+            op = self.code[pc] = tuple(map(self._constant, _operands))
+        return op
+
+    def __repr__(self):
+        # the same of the list of tuples (e.g. the key of Transpiler.cache)
+        return repr(list(self))
+
+    def _constant(self, index):
+        if self.decoded[index]:
+            return self.constants[index]
+        _offset = self.data + self._items(self.offsets, index, 1)[0]
+        _tag = self.map[_offset]
+        _offset += 1
+        if _tag == LIST:
+            (_count,) = WORD.unpack_from(self.map, _offset)
+            _items = struct.unpack_from("<%dI" % _count, self.map, _offset + 4)
+            _value = [self._constant(_item) for _item in _items]
+        elif _tag in (STR, BIGINT):
+            _size = self.map[_offset]
+            _offset += 1
+            if _size == LONG_STR:
+                (_size,) = WORD.unpack_from(self.map, _offset)
+                _offset += 4
+            _text = self.map[_offset : _offset + _size]
+            if _tag == STR:
+                _value = _text.decode("utf-8", "surrogatepass")
+            else:
+                _value = int(_text)
+        elif _tag in (INT32, INT64):
+            (_value,) = struct.unpack_from(
+                "<i" if _tag == INT32 else "<q", self.map, _offset
+            )
+        elif _tag == FLOAT:
+            (_value,) = DOUBLE.unpack_from(self.map, _offset)
+        else:
+            _value = {NONE: None, FALSE: False, TRUE: True}[_tag]
+        if _tag != LIST:
+            # the lists are mutable, so each use gets its own
+            self.constants[index] = _value
+            self.decoded[index] = True
+        return _value
+
+    def close(self):
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run():
+    """ Converts the .ir files of the command line to .irb files. """
+
+    if len(sys.argv) < 2:
+        print("Usage: ./uc_binary.py <ir-file>...")
+        sys.exit(1)
+
+    for file in sys.argv[1:]:
+        if file[-3:] == ".ir":
+            ir_filename = file
+        else:
+            ir_filename = file + ".ir"
+        dump_binary(read_ir(ir_filename), ir_filename + "b")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# ---------------------------------------------------------------------------------
+# uc: uc_client.py
+#
+# Thin client of the uC daemon (see uc_daemon.py): sends a command line to the
+# daemon, which runs it with the standard streams of the client
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+import json
+import os
+import socket
+import sys
+
+# Path of the Unix domain socket of the daemon
+SOCKET = os.environ.get("UC_SOCKET") or "/tmp/uc-daemon-%d.sock" % os.getuid()
+
+_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Commands of the daemon: the script that runs each one, and the options
+# added to its command line
+COMMANDS = {
+    "compile": (os.path.join(_DIR, "projeto1", "uc.py"), []),
+    "check": (os.path.join(_DIR, "projeto1", "uc.py"), ["-no-ast"]),
+    "run": (os.path.join(_DIR, "uc_run.py"), []),
+}
+
+
+def request(command, args, path=SOCKET):
+    """
+    Run the command with the args in the daemon, with the stdin, stdout
+    & stderr of this process, and return its exit code.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(path)
+        _message = json.dumps({"command": command, "args": args, "cwd": os.getcwd()})
+        socket.send_fds(client, [_message.encode() + b"\n"], [0, 1, 2])
+        with client.makefile("rb") as reply_file:
+            _reply = reply_file.readline()
+    if not _reply:
+        # the worker died (e.g. it was killed)
+        sys.stderr.write("uc daemon: the request was not completed\n")
+        return 1
+    return json.loads(_reply)["exit"]
+
+
+def run():
+    """ Runs the command of the command line in the daemon. """
+
+    if len(sys.argv) < 2 or sys.argv[1] not in COMMANDS:
+        print("Usage: ./uc_client.py compile|check|run <args>...")
+        sys.exit(1)
+
+    command = sys.argv[1]
+    args = sys.argv[2:]
+
+    sys.stdout.flush()
+    try:
+        code = request(command, args)
+    except (FileNotFoundError, ConnectionRefusedError):
+        # no daemon, so the script runs in the place of the client
+        _script, _options = COMMANDS[command]
+        os.execv(sys.executable, [sys.executable, _script] + args + _options)
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    run()
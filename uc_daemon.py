@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# ---------------------------------------------------------------------------------
+# uc: uc_daemon.py
+#
+# Daemon that keeps the uC compiler & the interpreter loaded, and serves the
+# compile, check & run requests of the clients (see uc_client.py) from a pool
+# of worker processes forked in advance
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+import io
+import json
+import os
+import signal
+import socket
+import sys
+import traceback
+import uc_run
+from uc_client import COMMANDS, SOCKET
+
+# Directory of the compiler (uc.py & its modules)
+COMPILER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "projeto1")
+
+# Number of requests served by a worker before it is replaced by a fresh
+# one, forked from the daemon
+JOBS = 1
+
+# Maximum size of a request, in bytes
+MAX_REQUEST = 1 << 16
+
+
+def load_compiler():
+    """
+    Import the compiler, returning its uc module.  Its modules import
+    each other as scripts, from their directory, and its AST module is
+    named ast, as the module of the standard library used here (e.g. by
+    inspect & uc_irtext), so it takes that name only while the compiler
+    is imported.
+    """
+    # ply (the lexer & the parser generator) uses inspect, that imports
+    # the ast of the standard library: they are imported before the ast
+    # of the compiler takes its name
+    import inspect
+    import ply.lex
+    import ply.yacc
+
+    _ast = sys.modules.pop("ast")
+    sys.path.insert(0, COMPILER)
+    try:
+        import uc
+    finally:
+        sys.path.remove(COMPILER)
+        sys.modules["ast"] = _ast
+    return uc
+
+
+class Daemon(object):
+    """
+    Serves the requests of the clients on a Unix domain socket.  The
+    compiler is imported & its parser built (the lexer and the LALR
+    tables) once, then the workers are forked, each with a copy of them.
+    A request is a command line of uc.py (compile or check) or uc_run.py
+    (run), and the standard streams of the client, received with the
+    request, so the output, the input & the exit code are the same as
+    running the script:
+
+        $ ./uc_daemon.py -workers=8 &
+        $ ./uc_client.py compile prog.uc
+        $ ./uc_client.py run prog.ir < input.txt
+
+    Each worker serves jobs requests, and is replaced by a new fork when
+    it ends (or dies), so the requests don't share any state by default.
+    """
+
+    def __init__(self, path=SOCKET, workers=None, jobs=JOBS):
+        if jobs < 1:
+            raise ValueError("A worker must serve at least one request")
+        self.path = path
+        self.workers = workers or os.cpu_count() or 1
+        self.jobs = jobs
+        self.compiler = load_compiler()
+        self.parser = self.compiler.UCParser()
+        # the compiler builds a parser for each compile: it gets this one
+        self.compiler.UCParser = lambda: self.parser
+        self.pids = set()  # Process ids of the workers
+        self.listener = None
+
+    def serve(self):
+        """ Serve the requests until the daemon gets SIGTERM or SIGINT. """
+        if os.path.exists(self.path):
+            # the socket left by a daemon that didn't end
+            os.unlink(self.path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.path)
+        self.listener.listen(128)
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            for _ in range(self.workers):
+                self._fork()
+            while True:
+                _pid, _ = os.wait()
+                if _pid in self.pids:
+                    self.pids.remove(_pid)
+                    self._fork()
+        except (KeyboardInterrupt, SystemExit):
+            pass
+        finally:
+            for _pid in self.pids:
+                try:
+                    os.kill(_pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+            self.listener.close()
+            os.unlink(self.path)
+
+    def _fork(self):
+        _pid = os.fork()
+        if _pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            try:
+                for _ in range(self.jobs):
+                    connection, _ = self.listener.accept()
+                    with connection:
+                        self._handle(connection)
+            finally:
+                os._exit(0)
+        self.pids.add(_pid)
+
+    def _handle(self, connection):
+        # A request: a line of JSON, with the fds of stdin, stdout & stderr
+        _message, _fds, _, _ = socket.recv_fds(connection, MAX_REQUEST, 3)
+        while not _message.endswith(b"\n"):
+            _data = connection.recv(MAX_REQUEST)
+            if not _data:
+                break
+            _message += _data
+        _request = json.loads(_message)
+        _code = self.execute(
+            _request["command"], _request["args"], _request["cwd"], _fds
+        )
+        connection.sendall(json.dumps({"exit": _code}).encode() + b"\n")
+
+    def execute(self, command, args, cwd, fds):
+        """
+        Run the command line in this process, in the directory cwd, with
+        fds as its stdin, stdout & stderr, and return its exit code.
+        """
+        _script, _options = COMMANDS[command]
+        sys.stdout.flush()
+        sys.stderr.flush()
+        _saved = [os.dup(_fd) for _fd in range(3)]
+        for _fd, _client in enumerate(fds):
+            os.dup2(_client, _fd)
+            os.close(_client)
+        _stdin, _argv, _cwd = sys.stdin, sys.argv, os.getcwd()
+        # nothing read from a former stdin is left in the buffer
+        sys.stdin = io.open(0, "r", closefd=False)
+        sys.argv = [_script] + args + _options
+        _code = 0
+        try:
+            os.chdir(cwd)
+            if command == "run":
+                uc_run.run()
+            else:
+                self._compile()
+        except SystemExit as e:
+            _code = e.code
+            if _code is None:
+                _code = 0
+            elif not isinstance(_code, int):
+                sys.stderr.write("%s\n" % _code)
+                _code = 1
+        except Exception:
+            traceback.print_exc()
+            _code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            sys.stdin.close()
+            for _fd in range(3):
+                os.dup2(_saved[_fd], _fd)
+                os.close(_saved[_fd])
+            sys.stdin, sys.argv = _stdin, _argv
+            os.chdir(_cwd)
+        return _code
+
+    def _compile(self):
+        # uc.py, with the parser already built: the errors & the lines are
+        # counted from the start of this compile
+        self.compiler.clear_errors()
+        self.parser.lexer.reset_lineno()
+        self.compiler.run_compiler()
+
+
+def run():
+    """ Runs the daemon. """
+
+    workers = None
+    jobs = JOBS
+    path = SOCKET
+
+    for param in sys.argv[1:]:
+        if param.startswith("-workers=") and param[9:].isdigit():
+            workers = int(param[9:])
+        elif param.startswith("-jobs=") and param[6:].isdigit():
+            jobs = int(param[6:])
+        elif param.startswith("-socket="):
+            path = param[8:]
+        else:
+            print("Usage: ./uc_daemon.py [-workers=N] [-jobs=N] [-socket=<path>]")
+            sys.exit(1)
+
+    Daemon(path, workers, jobs).serve()
+
+
+if __name__ == "__main__":
+    run()
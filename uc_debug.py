@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# ---------------------------------------------------------------------------------
+# uc: uc_debug.py
+#
+# Debugger & Tracer classes: breakpoints, watchpoints and a trace of the last
+# instructions of a program run by the interpreter of the uC intermediate
+# representation, on top of its hooks (see uc_hooks.py)
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+import sys
+from collections import deque
+from uc_interpreter import Interpreter, ProgramExit
+from uc_irtext import read_coords, read_ir
+
+# Number of instructions kept by a trace
+TRACE_SIZE = 1 << 10
+
+HELP = """Commands:
+    c               continue
+    s               step one instruction
+    p NAME          print a register (e.g. %3) or a global var (e.g. @x)
+    bt              backtrace of the calls
+    b WHERE         break at a function (@f), a pc or a source line (:N)
+    w NAME          watch a global var
+    l               list the instruction at the pc
+    q               quit"""
+
+
+class Debugger(object):
+    """
+    Debugger of the programs run by an interpreter.  The program stops
+    at the breakpoints (a function, a pc or a line of the source) and
+    when a watched global var changes, and then the debugger reads its
+    commands (see HELP) from the commands stream, until one continues:
+
+        vm = Interpreter()
+        vm.load(ircode)
+        debugger = Debugger(vm, lines=read_coords("prog.ir"))
+        debugger.break_at("@fib")
+        debugger.watch("@count")
+        vm.rerun()
+
+    The breakpoints & watchpoints are hooks (see uc_hooks.Hooks), so the
+    program must be loaded before they are set, and only the instructions
+    with a hook pay for them.  At the end of the commands, the program
+    runs to the end without stopping.
+    """
+
+    def __init__(self, vm, commands=None, output=None, lines=None):
+        self.vm = vm
+        self.commands = commands or sys.stdin
+        self.output = output or sys.stderr
+        self.lines = lines  # Source line of each instruction, or None
+        self.breaks = {}  # Dictionary of pc -> where the breakpoint was set
+        self.watches = {}  # Dictionary of name -> Watch
+        self.stepping = False
+
+    #
+    # Breakpoints & watchpoints
+    #
+    def break_at(self, where):
+        """
+        Set a breakpoint at a function (its name, e.g. '@main'), at a pc
+        (an int) or at a line of the source (':N').
+        """
+        for pc in self._resolve(where):
+            if pc not in self.breaks:
+                self.vm.hooks.at(pc, self._break)
+            self.breaks[pc] = where
+
+    def watch(self, name):
+        """ Stop when the value of the global var (or array) changes. """
+        if name not in self.vm.globals:
+            raise ValueError("Unknown global var: %s" % name)
+        _address = self.vm.globals[name]
+        _size = 1
+        if name in self.vm.arrays:
+            # the elements of the array, not its address
+            _size = self._array_size(name)
+            _address = self.vm.M[_address]
+        self.watches[name] = self.vm.hooks.watch(_address, _size, self._changed)
+
+    def _resolve(self, where):
+        # The pcs of a breakpoint
+        vm = self.vm
+        if isinstance(where, int):
+            return [where]
+        if where.startswith(":") and where[1:].isdigit():
+            if self.lines is None:
+                raise ValueError("No source lines to break at %s" % where)
+            _line = int(where[1:])
+            # the first instruction of each piece of code of the line
+            return [
+                pc
+                for pc, line in enumerate(self.lines)
+                if line == _line and (pc == 0 or self.lines[pc - 1] != _line)
+            ]
+        if where.isdigit():
+            return [int(where)]
+        if not vm._is_function(where):
+            raise ValueError("Unknown function: %s" % where)
+        # right after the define
+        return [vm.M[vm.globals[where]] + 1]
+
+    def _array_size(self, name):
+        for op in self.vm.code:
+            if op[0].startswith("global") and op[1] == name:
+                _, modifier = self.vm._extract_operation(op[0])
+                return self.vm._extract_size(modifier)[0]
+        return 1
+
+    #
+    # Stops
+    #
+    def _break(self, vm, pc):
+        if pc in self.breaks:
+            self.output.write("Breakpoint at %s\n" % self.breaks[pc])
+        self._stop(pc)
+
+    def _step(self, vm, pc):
+        self.vm.hooks.remove(self._step)
+        self._stop(pc)
+
+    def _changed(self, vm, address, old, new):
+        for name, _watch in self.watches.items():
+            if _watch.address <= address < _watch.address + _watch.size:
+                _index = address - _watch.address
+                if _watch.size > 1:
+                    name = "%s[%d]" % (name, _index)
+                self.output.write("Watch %s: %r -> %r\n" % (name, old, new))
+        # the instruction that wrote it is already done
+        self._stop(vm.pc, where="before")
+
+    def _stop(self, pc, where="at"):
+        self.output.write("Stopped %s %s\n" % (where, self._location(pc)))
+        while True:
+            self.output.write("(ucdb) ")
+            self.output.flush()
+            _line = self.commands.readline()
+            if not _line:
+                # no more commands: run to the end
+                self.output.write("\n")
+                self._detach()
+                return
+            _words = _line.split()
+            if not _words:
+                continue
+            try:
+                if self._command(_words[0], _words[1:], pc):
+                    return
+            except ValueError as e:
+                self.output.write("%s\n" % e)
+
+    def _command(self, command, args, pc):
+        # Run a command, True when the program goes on
+        if command == "c":
+            return True
+        elif command == "s":
+            self.vm.hooks.on_step(self._step)
+            return True
+        elif command == "p" and len(args) == 1:
+            self.output.write("%s = %r\n" % (args[0], self._value(args[0])))
+        elif command == "bt":
+            for _pc, _frame in self._backtrace(pc):
+                self.output.write("  %s\n" % self._location(_pc, _frame))
+        elif command == "b" and len(args) == 1:
+            self.break_at(args[0])
+        elif command == "w" and len(args) == 1:
+            self.watch(args[0])
+        elif command == "l":
+            if pc < len(self.vm.code):
+                self.output.write("  %d: %r\n" % (pc, self.vm.code[pc]))
+        elif command == "q":
+            raise ProgramExit(1)
+        else:
+            self.output.write(HELP + "\n")
+        return False
+
+    def _detach(self):
+        for _callback in (self._break, self._step, self._changed):
+            self.vm.hooks.remove(_callback)
+
+    #
+    # State of the program
+    #
+    def _value(self, name):
+        vm = self.vm
+        if name in vm.frame.slots:
+            _value = vm.M[vm.fp + vm.frame.slots[name]]
+            if name in vm.frame.arrays:
+                return list(vm.memory.read(_value, vm.frame.arrays[name][1]))
+            return _value
+        if name in vm.globals:
+            _value = vm.M[vm.globals[name]]
+            if name in vm.arrays:
+                return list(vm.memory.read(_value, self._array_size(name)))
+            return _value
+        raise ValueError("Unknown name: %s" % name)
+
+    def _backtrace(self, pc):
+        # The (pc, frame) of the current function & of each caller, the
+        # pc of a caller is right after its call
+        _frames = [(pc, self.vm.frame)]
+        for _pc, _, _frame, _, _ in reversed(self.vm.stack):
+            _frames.append((_pc - 1, _frame))
+        return _frames
+
+    def _location(self, pc, frame=None):
+        frame = frame or self.vm.frame
+        _location = "pc %d in %s" % (pc, frame.name)
+        if self.lines is not None and pc < len(self.lines):
+            if self.lines[pc] is not None:
+                _location += ", line %d" % self.lines[pc]
+        return _location
+
+
+class Tracer(object):
+    """
+    Trace of the last size instructions run by an interpreter, kept in a
+    ring buffer (with the depth of the calls of each one), so a long run
+    costs no more memory than a short one:
+
+        tracer = Tracer(vm)
+        vm.run(ircode)
+        tracer.dump(sys.stderr)
+    """
+
+    def __init__(self, vm, size=TRACE_SIZE):
+        self.vm = vm
+        self.events = deque(maxlen=size)  # (pc, depth) of each instruction
+        vm.hooks.on_step(self._step)
+
+    def _step(self, vm, pc):
+        self.events.append((pc, len(vm.stack)))
+
+    def lines(self, coords=None):
+        """ The lines of the trace, with the source lines if given. """
+        _lines = []
+        for pc, _depth in self.events:
+            _line = "%6d  %s%r" % (pc, "  " * _depth, self.vm.code[pc])
+            if coords is not None and coords[pc] is not None:
+                _line += "  # line %d" % coords[pc]
+            _lines.append(_line)
+        return _lines
+
+    def dump(self, stream, coords=None):
+        for _line in self.lines(coords):
+            stream.write(_line + "\n")
+
+
+def run():
+    """ Runs the program of the command line in the debugger. """
+
+    if len(sys.argv) < 2:
+        print("Usage: ./uc_debug.py <ir-file> [-break=<where>] [-commands=<file>]")
+        sys.exit(1)
+
+    breaks = []
+    commands = None
+
+    params = sys.argv[1:]
+    files = sys.argv[1:]
+
+    for param in params:
+        if param[0] == "-":
+            if param.startswith("-break="):
+                breaks.append(param[7:])
+            elif param.startswith("-commands="):
+                commands = open(param[10:], "r")
+            else:
+                print("Unknown option: %s" % param)
+                sys.exit(1)
+            files.remove(param)
+
+    ir_filename = files[0] if files[0][-3:] == ".ir" else files[0] + ".ir"
+    vm = Interpreter()
+    vm.load(read_ir(ir_filename))
+    # without a file of commands, they are read from the terminal, and the
+    # input of the program from its stdin
+    debugger = Debugger(vm, commands, lines=read_coords(ir_filename))
+    for where in breaks or ["@main"]:
+        try:
+            debugger.break_at(where)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+    result = vm.rerun()
+    if result.error is not None:
+        sys.stderr.write(str(result.error) + "\n")
+    sys.exit(result.exit_code)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,232 @@
+# ---------------------------------------------------------------------------------
+# uc: uc_hooks.py
+#
+# Hooks class: callbacks on the events of a program run by the interpreter of
+#              the uC intermediate representation (see uc_interpreter.py)
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+from uc_memory import BOOLS, INDEX_MASK
+
+# Handlers of the instructions that enter a function, leave it, or branch
+CALLS = {"run_call", "_run_call_pointer", "_run_call_memo"}
+RETURNS = {"run_return_int", "run_return_void", "_run_return_memo"}
+BRANCHES = {"run_cbranch"}
+
+# Prefixes of the handlers of the instructions that may write a global var
+# or an element of an array: the stores & copies of arrays, the allocs,
+# the reads, the refs (get) & the moves from/to the global vars
+WRITES = ("run_store", "run_load", "run_alloc", "run_read", "run_get", "_run_move")
+
+
+class Watch(object):
+    """
+    A range of size addresses (global vars or elements of an array)
+    watched for changes.  The values of the range are compared after
+    each instruction that may write to it (see WRITES), so the callback
+    is called for each address whose value changed, not for a write of
+    the same value.
+    """
+
+    def __init__(self, address, size, callback):
+        self.address = address
+        self.size = size
+        self.callback = callback
+        self.values = None  # Values of the range after the last check
+
+
+class Hooks(object):
+    """
+    Callbacks on the events of the programs run by an interpreter (its
+    hooks attribute):
+
+        - on_call(callback): callback(vm, layout) when a function is
+          entered (main included), with the FrameLayout of the function
+        - on_return(callback): callback(vm, layout, value) when it is
+          left, with the value returned (None for void)
+        - on_branch(callback): callback(vm, pc, target) when the cbranch
+          at pc goes to the target pc
+        - watch(address, size, callback): callback(vm, address, old, new)
+          when an instruction changes a value of the range of global
+          vars or array elements (see Watch)
+        - at(pc, callback): callback(vm, pc) before the instruction at pc
+        - on_step(callback): callback(vm, pc) before every instruction
+
+    Without hooks, the interpreter runs its program as is, so it pays
+    nothing for them.  With hooks, it runs an instrumented copy of the
+    program: the instructions decoded again (without superinstructions
+    or vectorized loops, so each one is seen) and the handlers that
+    raise events wrapped by the methods that call the callbacks.  The
+    hooks can be added or removed by the callbacks themselves, while
+    the program runs (e.g. a breakpoint that sets another).  Only the
+    Interpreter (and the Profiler) runs the hooks, not the other engines.
+    """
+
+    def __init__(self, vm):
+        self.vm = vm
+        self.calls = []
+        self.returns = []
+        self.branches = []
+        self.watches = []
+        self.pcs = {}  # Dictionary of pc -> callbacks
+        self.steps = []
+        self.plain = None  # Program decoded without superinstructions
+        self.table = None  # The instrumented program, while it runs
+
+    def __bool__(self):
+        return bool(
+            self.calls
+            or self.returns
+            or self.branches
+            or self.watches
+            or self.pcs
+            or self.steps
+        )
+
+    #
+    # Registration
+    #
+    def on_call(self, callback):
+        self.calls.append(callback)
+        self._update()
+        return callback
+
+    def on_return(self, callback):
+        self.returns.append(callback)
+        self._update()
+        return callback
+
+    def on_branch(self, callback):
+        self.branches.append(callback)
+        self._update()
+        return callback
+
+    def on_step(self, callback):
+        self.steps.append(callback)
+        self._update()
+        return callback
+
+    def at(self, pc, callback):
+        self.pcs.setdefault(pc, []).append(callback)
+        self._update()
+        return callback
+
+    def watch(self, address, size, callback):
+        _watch = Watch(address, size, callback)
+        _watch.values = self._values(_watch)
+        self.watches.append(_watch)
+        self._update()
+        return _watch
+
+    def remove(self, callback):
+        """ Remove the callback (or the Watch) from all the events. """
+        for _callbacks in (self.calls, self.returns, self.branches, self.steps):
+            while callback in _callbacks:
+                _callbacks.remove(callback)
+        self.watches = [
+            _watch
+            for _watch in self.watches
+            if _watch is not callback and _watch.callback != callback
+        ]
+        for pc, _callbacks in list(self.pcs.items()):
+            while callback in _callbacks:
+                _callbacks.remove(callback)
+            if not _callbacks:
+                del self.pcs[pc]
+        self._update()
+
+    #
+    # Instrumented program
+    #
+    def instrument(self):
+        """
+        The instrumented program of the code loaded in the interpreter,
+        to be run in the place of its program.
+        """
+        self.plain = self.vm._decode_program(self.vm.code)
+        for _watch in self.watches:
+            # the memory of the run, not of the former one
+            _watch.values = self._values(_watch)
+        self.table = [self._entry(pc) for pc in range(len(self.plain))]
+        return self.table
+
+    def enter(self):
+        # main is entered by the interpreter, not by a call
+        for _callback in self.calls:
+            _callback(self.vm, self.vm.frame)
+
+    def _update(self):
+        # The hooks changed while the program runs: the table is changed
+        # in place, so the execution loop sees it at the next instruction
+        if self.table is not None:
+            self.table[:] = [self._entry(pc) for pc in range(len(self.plain))]
+
+    def _entry(self, pc):
+        # The (handler, args) of the instruction at pc, wrapped by the
+        # methods of the events it may raise
+        handler, args = self.plain[pc]
+        _name = getattr(handler, "__name__", "")
+        if _name in CALLS and self.calls:
+            handler, args = (self._call, (handler, args))
+        elif _name in RETURNS and self.returns:
+            handler, args = (self._return, (handler, args))
+        elif _name in BRANCHES and self.branches:
+            handler, args = (self._branch, (pc, handler, args))
+        if pc in self.pcs or self.steps:
+            handler, args = (self._at, (pc, handler, args))
+        if self.watches and _name.startswith(WRITES):
+            handler, args = (self._watched, (handler, args))
+        return (handler, args)
+
+    def _call(self, handler, args):
+        vm = self.vm
+        _depth = len(vm.stack)
+        handler(*args)
+        if len(vm.stack) > _depth:
+            # not a call answered by the table of a pure function
+            for _callback in self.calls:
+                _callback(vm, vm.frame)
+
+    def _return(self, handler, args):
+        vm = self.vm
+        _value = vm.M[vm.fp + args[0]] if args else None
+        for _callback in self.returns:
+            _callback(vm, vm.frame, _value)
+        handler(*args)
+
+    def _branch(self, pc, handler, args):
+        handler(*args)
+        for _callback in self.branches:
+            _callback(self.vm, pc, self.vm.pc)
+
+    def _at(self, pc, handler, args):
+        for _callback in self.steps + self.pcs.get(pc, []):
+            _callback(self.vm, pc)
+        handler(*args)
+
+    def _watched(self, handler, args):
+        handler(*args)
+        for _watch in list(self.watches):
+            _values = self._values(_watch)
+            if _values != _watch.values:
+                _old = _watch.values
+                _watch.values = _values
+                for i, (_before, _after) in enumerate(zip(_old, _values)):
+                    if _before != _after:
+                        if _watch.address >= BOOLS:
+                            _before, _after = bool(_before), bool(_after)
+                        _watch.callback(self.vm, _watch.address + i, _before, _after)
+
+    def _values(self, watch):
+        # A copy of the values of the range (a slice, so the comparison
+        # is cheap), None for the cells not in use (e.g. in the frame of
+        # a function that returned)
+        memory = self.vm.memory
+        if watch.address > INDEX_MASK:
+            return memory.read(watch.address, watch.size)
+        _values = memory.cells[watch.address : watch.address + watch.size]
+        return _values + [None] * (watch.size - len(_values))
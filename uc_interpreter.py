@@ -10,7 +10,92 @@
 # Redistribution and use in source form with or without modification are
 # permitted but the source code must retain the above copyright notice.
 # ---------------------------------------------------------------------------------
-import sys
+import io
+import heapq
+import itertools
+import operator
+import time
+from collections import Counter
+from collections.abc import Sequence
+from uc_hooks import Hooks
+from uc_io import InputSource, OutputBuffer
+from uc_limits import LimitExceeded
+from uc_memo import MISSING, find_pure
+from uc_memory import (
+    DEFAULT_STACK_LIMIT,
+    INT,
+    KINDS,
+    ConstantPool,
+    Memory,
+    OutOfRange,
+    StackOverflow,
+)
+from uc_vector import find_loops
+
+
+class FrameLayout(object):
+    """
+    Layout of the activation frame of a function.  Every register of the
+    function (temporaries, local vars & parameters) gets a fixed slot, i.e.
+    an offset relative to the frame base, and every label its absolute pc,
+    computed once at load time.
+    """
+
+    def __init__(self, name, entry):
+        self.name = name  # Name of the function (e.g. '@main')
+        self.entry = entry  # PC of the define instruction
+        self.slots = {}  # Dictionary of register name -> offset in the frame
+        self.size = 0  # Number of memory cells used by the frame
+        self.numbered = {}  # Register number -> offset (used to pass params)
+        self.arrays = {}  # Array register -> (segment, number of elements)
+        self.labels = {}  # Dictionary of labels -> pc of the next instruction
+
+    def alloc(self, register):
+        if register not in self.slots:
+            self.slots[register] = self.size
+            self.size += 1
+            self.numbered[int(register[1:])] = self.slots[register]
+        return self.slots[register]
+
+    def alloc_array(self, register, segment, size):
+        # The elements of the array live in the typed buffer of the
+        # segment, the slot of the register holds its address.
+        self.arrays[register] = (segment, size)
+        return self.alloc(register)
+
+
+class ProgramExit(Exception):
+    """ Raised to end the program, with its exit code (see Interpreter.run) """
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+
+class RunResult(object):
+    """
+    Result of a run: the exit code of the program (the value returned by
+    main, 0 for void, or 1 if it was stopped by an error), the output if
+    captured (or None), the number of instructions run (only counted with
+    limits, else None), the elapsed time in seconds, and the error that
+    stopped the program (LimitExceeded, StackOverflow or OutOfRange), if
+    any.
+    """
+
+    def __init__(self, exit_code, stdout, instructions, elapsed, error=None):
+        self.exit_code = exit_code
+        self.stdout = stdout
+        self.instructions = instructions
+        self.elapsed = elapsed
+        self.error = error
+
+    def __repr__(self):
+        return "RunResult(exit_code=%r, instructions=%r, elapsed=%.6f, error=%r)" % (
+            self.exit_code,
+            self.instructions,
+            self.elapsed,
+            self.error,
+        )
 
 
 class Interpreter(object):
@@ -34,34 +119,123 @@ class Interpreter(object):
              self.run_add_int('%1', '%2', '%3')
              self.run_print_int('%3')
 
+    At load time the register names are replaced by their slot in the
+    frame of the function (see FrameLayout) and the global names by their
+    absolute address, so the methods only index the memory relative to
+    the frame pointer (fp).  Operands that may name either a register or
+    a global are encoded as the slot (>= 0) or as ~address (< 0), and are
+    resolved by _address.
+
+    The scalars live in the cells of the memory (M), one Python object per
+    cell.  Arrays live in the typed buffers of the memory (see uc_memory)
+    and the cell of an array var holds the address of its first element.
+
+    After decoding, a peephole pass replaces the most frequent sequences
+    of instructions (e.g. load, load, lt, cbranch) by a single fused
+    handler, a superinstruction, that does the work of all of them in a
+    single dispatch (see _fuse).  The fused instructions are kept in the
+    program, so a jump into the middle of a sequence still works.
+
+    When numpy is available, the counted loops over arrays (see
+    uc_vector.VectorLoop) run as NumPy operations on the whole arrays,
+    if their check at run time succeeds, and one instruction at a time
+    otherwise.
+
+    Given the limits of a run (see uc_limits.Limits), the program runs in
+    a loop that checks them every few instructions, and is stopped with
+    a LimitExceeded error, that tells the pc & the function, when one of
+    them is exceeded.  Without limits, the loop has no checks at all.
+    With limits, the instructions are not fused, the loops are not
+    vectorized and the calls are not memoized, so that every instruction
+    is counted & checked.
+
+    With memoize, the results of the calls of the pure functions (see
+    uc_memo.find_pure) are cached by the values of their arguments, so a
+    call already made returns at once, with the same output.  The tables
+    are filled by load, and kept by each rerun.
+
+    The hooks (see uc_hooks.Hooks) call back debuggers & tracers on the
+    events of a run: the calls, the returns, the branches, the writes to
+    the watched addresses and the instructions at given pcs.  Only when
+    a hook is set, the program runs through an instrumented table.
+
+    The output of the print opcodes is buffered (see uc_io.OutputBuffer),
+    and written to sys.stdout or to the given output sink, a binary or
+    text stream, according to the flush policy ("exit", "line" or
+    "always").  With capture, the output of each run is kept in the
+    result instead.
+
+    The state of a run is all in the object, and is reset by each run,
+    so an interpreter can run many programs, one after the other, and
+    several interpreters can run at once in different threads.  The run
+    returns a RunResult, and never exits the process:
+
+        result = Interpreter(capture=True).run(ircode, stdin="10")
+        result.exit_code, result.stdout
+
     Instructions for use:
         1. Instantiate an object of the Interpreter class
         2. Call the run method of this object passing the produced
            code as a parameter
     """
 
-    def __init__(self):
-        global inputline, M
-        inputline = []
-        M = 10000 * [None]  # Memory for global & local vars
+    def __init__(
+        self,
+        stack_limit=DEFAULT_STACK_LIMIT,
+        output=None,
+        flush="exit",
+        fuse=True,
+        vectorize=True,
+        limits=None,
+        capture=False,
+        pack=True,
+        memoize=False,
+    ):
+        # Memory for global & local vars. The stack_limit is the maximum
+        # number of cells used by the global vars & the frames.
+        self.stack_limit = stack_limit
+        self.sink = output  # Stream of the output, None for sys.stdout
+        self.flush = flush  # Flush policy of the output
+        self.capture = capture  # Keep the output of each run in its result
+        self.fuse = fuse  # Replace sequences of instructions by superinstructions
+        self.vectorize = vectorize  # Run the loops over arrays with NumPy
+        self.limits = limits  # Limits of the run (uc_limits.Limits) or None
+        self.pack = pack  # Reuse the slots of the temporaries no longer live
+        self.memoize = memoize  # Cache the results of the pure functions
+        self.hooks = Hooks(self)  # Callbacks on the events of the runs
+        self._reset()
+
+    def _reset(self):
+        # The state of a run, new for each run
+        self.memory = Memory(self.stack_limit)
+        self.M = self.memory.cells
+        self.pool = ConstantPool(self.memory)  # The string constants
+        self.output = OutputBuffer(
+            io.StringIO() if self.capture else self.sink, self.flush
+        )
+        self.input = None
 
         self.globals = {}  # Dictionary of address of global vars & constants
-        self.vars = {}  # Dictionary of address of local vars relative to sp
+        self.arrays = set()  # Names of the global arrays
+        self.functions = {}  # Dictionary of entry pc -> FrameLayout
+        self.arity = {}  # Name of function -> number of parameters
 
-        self.offset = 0  # offset (index) of local & global vars. Note that
-        # each instance of var has absolute address in Memory
-        self.stack = []  # Stack to save address of vars between calls
-        self.sp = []  # Stack to save & restore the last offset
+        self.fp = 0  # Frame pointer: base address of the current frame
+        self.frame = None  # FrameLayout of the current function
+        self.stack = []  # Stack to save the caller state between calls
 
-        self.params = []  # List of parameters from caller (address)
-        self.result = None  # Result Value (address) from the callee
-
-        self.registers = []  # Stack of register names (in the caller) to return value
-        self.returns = []  # Stack of return addresses (program counters)
+        self.params = []  # List of parameters from caller (values)
 
         self.pc = 0  # Program Counter
         self.start = 0  # PC of the main function
         self.code = None
+        self.program = None
+        self.fusions = Counter()  # Number of sequences replaced by each one
+        self.vector_loops = {}  # Dictionary of header pc -> VectorLoop
+        self.memos = {}  # Dictionary of entry pc -> MemoTable
+        self.memo_keys = []  # Arguments of the memoized calls running
+        self.executed = 0  # Number of instructions run (with limits only)
+        self.loaded = None  # Snapshot of the memory after load (see rerun)
 
     def _extract_operation(self, source):
         _modifier = {}
@@ -85,422 +259,1048 @@ class Interpreter(object):
             _opcode = _aux[0]
         return (_opcode, _modifier)
 
+    def _is_array(self, modifier):
+        return any(_val.isdigit() for _val in modifier.values())
+
+    def _extract_size(self, modifier):
+        # Number of cells (product of the dims) & number of refs (*)
+        _dim = 1
+        _ref = 0
+        for arg in modifier.values():
+            if arg.isdigit():
+                _dim *= int(arg)
+            elif arg == "*":
+                _ref += 1
+        return (_dim, _ref)
+
     def _copy_data(self, address, size, value):
-        if isinstance(value, str):
-            _value = list(value)
-        elif any(isinstance(item, list) for item in value):
-            _value = [item for sublist in value for item in sublist]
+        # the initializer of a global array (the rows of a matrix are
+        # lists) is written at once, as a typed buffer
+        if any(isinstance(item, list) for item in value):
+            value = itertools.chain.from_iterable(value)
+        self.memory.write(address, itertools.islice(value, size))
+
+    def _layout(self, ircode, entry):
+        # Compute the frame layout of the function defined at pc entry:
+        # each register takes a single slot, and the arrays (allocated or
+        # copied by value) are also placed in the buffer of their type.
+        # The return register of main (%0) is always allocated to check
+        # whether it returns void.
+        layout = FrameLayout(ircode[entry][1], entry)
+        if layout.name == "@main":
+            layout.alloc("%0")
+        for pc in range(entry + 1, len(ircode)):
+            op = ircode[pc]
+            if op[0] == "define":
+                break
+            if op[0].isdigit():
+                # labels don't go to memory, just in the dictionary
+                layout.labels["%" + op[0]] = pc + 1
+                continue
+            opcode, modifier = self._extract_operation(op[0])
+            if opcode == "jump":
+                continue
+            elif opcode == "cbranch":
+                operands = op[1:2]
+            elif opcode.startswith("literal"):
+                operands = op[2:]
+            else:
+                operands = op[1:]
+            for name in operands:
+                if isinstance(name, str) and name.startswith("%"):
+                    layout.alloc(name)
+            _kind = opcode.split("_")[0]
+            if _kind in {"alloc", "load"} and self._is_array(modifier):
+                _dim, _ref = self._extract_size(modifier)
+                if _kind == "alloc" or _ref == 0:
+                    # the array is the last operand of alloc & load
+                    _segment = INT if _ref else KINDS[opcode.split("_")[1]]
+                    layout.alloc_array(op[-1], _segment, _dim)
+        return layout
+
+    def _count_params(self, ircode):
+        # The number of parameters of each function is the number of
+        # param_* before its calls. The functions whose address is taken
+        # may be called by any call through a pointer.
+        _params = 0
+        _pointers = 0
+        _taken = set()
+        for op in ircode:
+            if op[0].startswith("param"):
+                _params += 1
+            elif op[0] == "call":
+                if self._is_function(op[1]):
+                    self.arity[op[1]] = max(self.arity.get(op[1], 0), _params)
+                else:
+                    _pointers = max(_pointers, _params)
+                _params = 0
+            elif op[0].startswith("get"):
+                if self._is_function(op[1]):
+                    _taken.add(op[1])
+        for _name in _taken:
+            self.arity[_name] = max(self.arity.get(_name, 0), _pointers)
+
+    def _operands(self, op):
+        # The registers written (defs) & read (uses) by the instruction op
+        opcode, modifier = self._extract_operation(op[0])
+        _kind = opcode.split("_")[0]
+        if opcode in {"jump", "define"} or _kind == "global":
+            _defs, _uses = (), ()
+        elif opcode == "cbranch":
+            _defs, _uses = (), op[1:2]
+        elif opcode == "call":
+            _defs, _uses = op[2:], op[1:2]
+        elif _kind == "literal":
+            _defs, _uses = op[2:], ()
+        elif _kind == "store" and not modifier:
+            _defs, _uses = op[2:], op[1:2]
+        elif _kind in {"store", "param", "return", "print"}:
+            _defs, _uses = (), op[1:]
+        elif _kind in {"alloc", "read"}:
+            _defs, _uses = op[1:], ()
         else:
-            _value = value
-        M[address : address + size] = _value
-
-    def run(self, ircode):
+            # loads, elem, get, operations & casts write the last operand
+            _defs, _uses = op[-1:], op[1:-1]
+        return (
+            [_name for _name in _defs if str(_name).startswith("%")],
+            [_name for _name in _uses if str(_name).startswith("%")],
+        )
+
+    def _pack(self, ircode, layout, end):
         """
-        Run intermediate code in the interpreter.  ircode is a list
-        of instruction tuples.  Each instruction (opcode, *args) is
-        dispatched to a method self.run_opcode(*args)
+        Reuse the slots of the temporaries of the function from its entry
+        to end: each temporary is live from its first to its last use (or
+        to the end of a loop, if it is live at the loop header) and gets
+        the lowest slot that is free in that interval (a linear scan).
+        The parameters, the return register, the local vars (alloc), the
+        arrays, the registers whose address is taken and the ones read
+        before written keep a slot of their own.
         """
+        _first = {}  # Register -> pc of its first def or use
+        _last = {}  # Register -> pc of its last def or use
+        _defined = set()
+        _fixed = set(layout.arrays)  # Registers that keep their own slot
+        _loops = []  # (pc of the header, pc of the jump back) of each loop
+        for pc in range(layout.entry + 1, end):
+            op = ircode[pc]
+            if op[0].isdigit():
+                continue
+            _defs, _uses = self._operands(op)
+            for _name in _uses + _defs:
+                _first.setdefault(_name, pc)
+                _last[_name] = pc
+            _fixed.update(_name for _name in _uses if _name not in _defined)
+            _defined.update(_defs)
+            if op[0].startswith("alloc"):
+                _fixed.update(_defs)
+            elif op[0].startswith("get") and str(op[1]).startswith("%"):
+                _fixed.add(op[1])
+            elif op[0] in {"jump", "cbranch"}:
+                for _label in op[1:] if op[0] == "jump" else op[2:]:
+                    if layout.labels[_label] <= pc:
+                        _loops.append((layout.labels[_label], pc))
+        _arity = self.arity.get(layout.name, 0)
+        for _name in layout.slots:
+            if int(_name[1:]) <= _arity or _name not in _first:
+                _fixed.add(_name)
+
+        # a value live at the header of a loop is live in the whole loop
+        _changed = True
+        while _changed:
+            _changed = False
+            for _header, _back in _loops:
+                for _name, _end in _last.items():
+                    if _first[_name] < _header <= _end < _back:
+                        _last[_name] = _back
+                        _changed = True
+
+        slots = {}
+        for _name in sorted(_fixed & set(layout.slots), key=layout.slots.get):
+            slots[_name] = len(slots)
+        size = len(slots)
+        _free = []  # Heap of the slots free
+        _active = []  # Heap of (last pc, slot) of the temporaries live
+        _temporaries = [_name for _name in layout.slots if _name not in slots]
+        for _name in sorted(_temporaries, key=_first.get):
+            while _active and _active[0][0] < _first[_name]:
+                heapq.heappush(_free, heapq.heappop(_active)[1])
+            if _free:
+                slots[_name] = heapq.heappop(_free)
+            else:
+                slots[_name] = size
+                size += 1
+            heapq.heappush(_active, (_last[_name], slots[_name]))
+        layout.slots = slots
+        layout.size = size
+        layout.numbered = {int(_name[1:]): _slot for _name, _slot in slots.items()}
+
+    def _is_function(self, name):
+        if name not in self.globals:
+            return False
+        _entry = self.M[self.globals[name]]
+        return _entry in self.functions and self.functions[_entry].name == name
+
+    def _operand(self, name):
+        if name.startswith("@"):
+            return ~self.globals[name]
+        return self.frame.slots[name]
+
+    def _decode(self, op):
+        # Translate one instruction tuple into a (handler, args) pair. The
+        # opcode string is parsed only here, the register operands become
+        # frame slots, the globals their ~address, the labels their pc, and
+        # the modifiers (array dims & pointer refs) are passed as extra
+        # (dim, ref) arguments.
+        if op[0].isdigit():
+            # labels are not executed, they just mark a pc for the jumps
+            return (self._run_nop, ())
+        opcode, modifier = self._extract_operation(op[0])
+        if opcode == "define" or opcode.startswith("global"):
+            # functions are entered by run_call, after the define
+            return (self._run_nop, ())
+        labels = self.frame.labels
+        if opcode == "jump":
+            args = (labels[op[1]],)
+        elif opcode == "cbranch":
+            args = (self._operand(op[1]), labels[op[2]], labels[op[3]])
+        elif opcode == "call" and self._is_function(op[1]):
+            # direct call, resolve the callee at load time
+            _callee = self.functions[self.M[self.globals[op[1]]]]
+            if _callee.entry in self.memos:
+                return (
+                    self._run_call_memo,
+                    (_callee, self._operand(op[2]), self.memos[_callee.entry]),
+                )
+            return (self.run_call, (_callee, self._operand(op[2])))
+        elif opcode == "call":
+            # call through a pointer to function
+            return (self._run_call_pointer, tuple(map(self._operand, op[1:])))
+        elif opcode.startswith("return") and self.frame.entry in self.memos:
+            # the result goes to the table of the function too
+            _memo = self.memos[self.frame.entry]
+            return (self._run_return_memo, (self._operand(op[1]), _memo))
+        elif opcode.startswith("literal"):
+            args = (op[1], self._operand(op[2]))
+        else:
+            args = tuple(self._operand(name) for name in op[1:])
+        if not modifier:
+            handler = getattr(self, "run_" + opcode, None)
+            if opcode.split("_")[0] in {"load", "store"} and min(args) < 0:
+                # a scalar move from/to a global var
+                handler = self._run_move
+        elif opcode.startswith("get") and (
+            op[1] in self.arrays or op[1] in self.frame.arrays
+        ):
+            # the address of an array is the value in its cell
+            handler = self._run_move
+        elif opcode.startswith("alloc") and not self._is_array(modifier):
+            # pointers are scalars
+            handler = getattr(self, "run_" + opcode, None)
+        else:
+            handler = getattr(self, "run_" + opcode + "_", None)
+            args += self._extract_size(modifier)
+        if handler is None:
+            return (self._run_unknown, (opcode,))
+        return (handler, args)
 
-        # First, store the global vars & constants
-        # Also, set the start pc to the main function entry
+    def _load(self, ircode):
+        """
+        Load the intermediate code: store the global vars & constants,
+        set the start pc to the main function entry, compute the frame
+        layout of each function and decode every instruction once, so the
+        execution loop only indexes into the decoded program.
+        """
+        self._load_globals(ircode)
+        if self.pack:
+            self._count_params(ircode)
+            _entries = sorted(self.functions) + [len(ircode)]
+            for _entry, _end in zip(_entries, _entries[1:]):
+                self._pack(ircode, self.functions[_entry], _end)
+        if self.memoize and self.limits is None:
+            self.memos = find_pure(self, ircode)
+
+        # The globals are all known, now decode the functions
+        self.program = self._decode_program(ircode)
+        if self.fuse and self.limits is None:
+            self._fuse()
+        if self.vectorize and self.limits is None:
+            # the header label is only run when entering the loop, the
+            # jump back goes to the instruction after the label
+            self.vector_loops = find_loops(self, ircode)
+            for pc, loop in self.vector_loops.items():
+                self.program[pc] = (self._run_vector_loop, (loop,))
+
+    def _decode_program(self, ircode):
+        # The list of the (handler, args) of each instruction
+        program = []
+        for pc, op in enumerate(ircode):
+            if pc in self.functions:
+                self.frame = self.functions[pc]
+            program.append(self._decode(op))
+        return program
+
+    def _load_globals(self, ircode):
+        # Store the global vars & constants, and compute the layout of
+        # the functions (the cell of a function holds its entry pc).
+        M = self.M
         self.code = ircode
-        self.pc = 0
-        self.offset = 0
-        while True:
-            try:
-                op = ircode[self.pc]
-            except IndexError:
-                break
+        for pc, op in enumerate(ircode):
             if not op[0].isdigit():
                 opcode, modifier = self._extract_operation(op[0])
-                if opcode.startswith("global"):
-                    self.globals[op[1]] = self.offset
+                if opcode == "global_string" and len(op) == 3:
+                    # the strings with the same text share the cell
+                    self.globals[op[1]] = self.pool.intern(op[2])
+                elif opcode.startswith("global"):
+                    _address = self.globals[op[1]] = self.memory.push(1)
                     # get the size of global var
-                    if not modifier:
+                    if not self._is_array(modifier):
                         # size equals 1 or is a constant, so we use only
                         # one slot in the memory to make it simple.
                         if len(op) == 3:
-                            M[self.offset] = op[2]
-                        self.offset += 1
+                            M[_address] = op[2]
                     else:
-                        _len = 1
-                        for args in modifier.values():
-                            if args.isdigit():
-                                _len *= int(args)
+                        # alloc the array in the buffer of its type and
+                        # keep its address in the slot of the global
+                        _len, _ref = self._extract_size(modifier)
+                        _type = opcode.split("_")[1]
+                        _segment = INT if _ref else KINDS[_type]
+                        M[_address] = self.memory.alloc(_segment, _len)
+                        self.arrays.add(op[1])
                         if len(op) == 3:
-                            self._copy_data(self.offset, _len, op[2])
-                        self.offset += _len
+                            self._copy_data(M[_address], _len, op[2])
                 elif opcode == "define":
-                    self.globals[op[1]] = self.offset
-                    M[self.offset] = self.pc
-                    self.offset += 1
+                    _address = self.globals[op[1]] = self.memory.push(1)
+                    M[_address] = pc
+                    self.functions[pc] = self._layout(ircode, pc)
                     if op[1] == "@main":
-                        self.start = self.pc
-            self.pc += 1
-
-        # Now, running the program starting from the main function
-        self.pc = self.start
-        while True:
-            try:
-                op = ircode[self.pc]
-            except IndexError:
-                break
-            self.pc += 1
-            if not op[0].isdigit():
-                opcode, modifier = self._extract_operation(op[0])
-                if hasattr(self, "run_" + opcode):
-                    if not modifier:
-                        getattr(self, "run_" + opcode)(*op[1:])
-                    else:
-                        getattr(self, "run_" + opcode + "_")(*op[1:], **modifier)
-                else:
-                    print("Warning: No run_" + opcode + "() method", flush=True)
+                        self.start = pc
 
     #
-    # Auxiliary methods
+    # Superinstructions
     #
-    def _alloc_labels(self):
-        # Alloc labels for current function definition. Due to the uCIR and due to
-        # the chosen memory model, this is done every time we enter a function.
-        _lpc = self.pc
-        while True:
-            try:
-                _opcode = self.code[_lpc][0]
-                _lpc += 1
-                if _opcode == "define":
+    def _fuse(self):
+        """
+        Peephole pass over the decoded program: the sequences of handlers
+        recognized by the _match_* methods are replaced by a fused handler
+        at the pc of their first instruction, which leaves the pc after
+        the sequence (or at the branch target).  The other instructions
+        of the sequence are kept, since the sequences have no labels or
+        calls, nothing jumps or returns into them anyway.
+        """
+        matchers = (
+            self._match_compare_branch,
+            self._match_binop_store,
+            self._match_binop,
+            self._match_elem_access,
+            self._match_load_elem,
+            self._match_literal_store,
+            self._match_array_copy,
+        )
+        program = self.program
+        pc = 0
+        while pc < len(program):
+            for match in matchers:
+                fused = match(pc)
+                if fused is not None:
+                    handler, args, length = fused
+                    program[pc] = (handler, args)
+                    self.fusions[handler.__name__] += 1
+                    pc += length
                     break
-                elif _opcode.isdigit():
-                    # labels don't go to memory, just in the dictionary
-                    self.vars["%" + _opcode] = _lpc
-            except IndexError:
-                break
+            else:
+                pc += 1
+
+    def fusion_report(self):
+        # Text report of the superinstructions used in the program, and
+        # the number of sequences replaced by each one
+        lines = []
+        for name, count in self.fusions.most_common():
+            lines.append("%-24s %6d" % (name[len("_run_") :], count))
+        return "\n".join(lines)
+
+    def vector_report(self):
+        # Text report of the loops vectorized, and the number of times
+        # each one run as vector operations or fell back
+        lines = []
+        for pc, loop in sorted(self.vector_loops.items()):
+            lines.append(
+                "%-48s %6d %6d" % (loop.describe(), loop.runs, loop.fallbacks)
+            )
+        return "\n".join(lines)
+
+    def memo_report(self):
+        # Text report of the pure functions memoized, and the number of
+        # calls found (hits) & not found (misses) in their tables
+        lines = []
+        for pc, memo in sorted(self.memos.items()):
+            lines.append(memo.describe())
+        return "\n".join(lines)
+
+    def _handler(self, pc, *handlers):
+        # The (handler, args) at pc if its handler is one of the given
+        if pc < len(self.program):
+            handler, args = self.program[pc]
+            if getattr(handler, "__func__", None) in handlers:
+                return (handler.__func__, args)
+        return (None, None)
+
+    def _match_operands(self, pc):
+        # Two operands (loads or literals) followed by a binary operation
+        # on them: returns (a, x, b, y, op, t, kind), where x = a is a load
+        # and y = b is a load (kind "ll") or y = the literal b (kind "lc").
+        operands = {}
+        for i in (pc, pc + 1):
+            handler, args = self._handler(i, Interpreter.run_load_int)
+            if handler is not None:
+                operands[args[1]] = (False, args[0])
+            else:
+                handler, args = self._handler(i, Interpreter.run_literal_int)
+                if handler is None:
+                    return None
+                operands[args[1]] = (True, args[0])
+        handler, args = self._handler(pc + 2, *Interpreter.BINARY_OPS)
+        if handler is None or len(operands) != 2 or set(args[:2]) != set(operands):
+            return None
+        x, y, t = args
+        op = Interpreter.BINARY_OPS[handler]
+        if operands[x][0] and not operands[y][0]:
+            # the literal is the left operand: swap, if the op allows it
+            if op not in Interpreter.SWAPPED_OPS:
+                return None
+            x, y, op = y, x, Interpreter.SWAPPED_OPS[op]
+        _literal_x, a = operands[x]
+        _literal_y, b = operands[y]
+        if _literal_x or (not _literal_y and b == x) or a == y:
+            # two literals, or an operand loaded from the other one
+            return None
+        return (a, x, b, y, op, t, "lc" if _literal_y else "ll")
+
+    def _match_compare_branch(self, pc):
+        # load/literal, load/literal, compare, cbranch on the result
+        operands = self._match_operands(pc)
+        handler, args = self._handler(pc + 3, Interpreter.run_cbranch)
+        if operands is None or handler is None or args[0] != operands[5]:
+            return None
+        a, x, b, y, op, t, kind = operands
+        if kind == "ll":
+            fused = self._run_load_load_branch
+        else:
+            fused = self._run_load_literal_branch
+        return (fused, (a, x, b, y, op, t) + args[1:], 4)
+
+    def _match_binop_store(self, pc):
+        # load/literal, load/literal, binary op, store of the result
+        operands = self._match_operands(pc)
+        handler, args = self._handler(pc + 3, Interpreter.run_store_int)
+        if operands is None or handler is None or args[0] != operands[5]:
+            return None
+        a, x, b, y, op, t, kind = operands
+        if kind == "ll":
+            fused = self._run_load_load_store
+        else:
+            fused = self._run_load_literal_store
+        return (fused, (a, x, b, y, op, t, args[1]), 4)
+
+    def _match_binop(self, pc):
+        # load/literal, load/literal, binary op
+        operands = self._match_operands(pc)
+        if operands is None:
+            return None
+        a, x, b, y, op, t, kind = operands
+        if kind == "ll":
+            fused = self._run_load_load_op
+        else:
+            fused = self._run_load_literal_op
+        return (fused, (a, x, b, y, op, t), 3)
+
+    def _match_elem_access(self, pc):
+        # elem, followed by a load or store through the element pointer
+        handler, args = self._handler(pc, Interpreter.run_elem_int)
+        if handler is None or args[0] < 0:
+            return None
+        source, index, target = args
+        handler, args = self._handler(pc + 1, Interpreter.run_load_int_)
+        if handler is not None and args[0] == target and args[2:] == (1, 1):
+            return (self._run_elem_load, (source, index, target, args[1]), 2)
+        handler, args = self._handler(pc + 1, Interpreter.run_store_int_)
+        if handler is not None and args[1] == target and args[2:] == (1, 1):
+            if args[0] >= 0:
+                return (self._run_elem_store, (source, index, target, args[0]), 2)
+        return None
+
+    def _match_load_elem(self, pc):
+        # load of the index, elem
+        handler, load = self._handler(pc, Interpreter.run_load_int)
+        if handler is None:
+            return None
+        handler, args = self._handler(pc + 1, Interpreter.run_elem_int)
+        if handler is None or args[0] < 0 or args[1] != load[1]:
+            return None
+        return (self._run_load_elem, load + (args[0], args[2]), 2)
+
+    def _match_literal_store(self, pc):
+        # literal, store of the literal
+        handler, literal = self._handler(pc, Interpreter.run_literal_int)
+        if handler is None:
+            return None
+        handler, args = self._handler(pc + 1, Interpreter.run_store_int)
+        if handler is None or args[0] != literal[1]:
+            return None
+        return (self._run_literal_store, literal + (args[1],), 2)
+
+    def _match_array_copy(self, pc):
+        # load of an array to a temporary copy, store of the copy (the
+        # assignment of arrays), when nothing else uses the copy
+        handler, load = self._handler(pc, Interpreter.run_load_int_)
+        if handler is None or load[3] != 0:
+            return None
+        handler, args = self._handler(pc + 1, Interpreter.run_store_int_)
+        if handler is None or args[0] != load[1] or args[2:] != load[2:]:
+            return None
+        _temp = self.code[pc][2]
+        _entry = max(_entry for _entry in self.functions if _entry < pc)
+        _end = min([_pc for _pc in self.functions if _pc > pc] + [len(self.code)])
+        for _pc in range(_entry + 1, _end):
+            if _temp in self.code[_pc][1:] and _pc not in (pc, pc + 1):
+                return None
+        return (self._run_array_copy, (load[0], args[1], load[2]), 2)
+
+    def _run_load_load_branch(self, a, x, b, y, op, t, true_target, false_target):
+        fp = self.fp
+        M = self.M
+        _x = M[fp + x] = M[fp + a]
+        _y = M[fp + y] = M[fp + b]
+        if op(_x, _y):
+            M[fp + t] = True
+            self.pc = true_target
+        else:
+            M[fp + t] = False
+            self.pc = false_target
+
+    def _run_load_literal_branch(self, a, x, b, y, op, t, true_target, false_target):
+        fp = self.fp
+        M = self.M
+        _x = M[fp + x] = M[fp + a]
+        M[fp + y] = b
+        if op(_x, b):
+            M[fp + t] = True
+            self.pc = true_target
+        else:
+            M[fp + t] = False
+            self.pc = false_target
+
+    def _run_load_load_store(self, a, x, b, y, op, t, target):
+        fp = self.fp
+        M = self.M
+        _x = M[fp + x] = M[fp + a]
+        _y = M[fp + y] = M[fp + b]
+        M[fp + target] = M[fp + t] = op(_x, _y)
+        self.pc += 3
+
+    def _run_load_literal_store(self, a, x, b, y, op, t, target):
+        fp = self.fp
+        M = self.M
+        _x = M[fp + x] = M[fp + a]
+        M[fp + y] = b
+        M[fp + target] = M[fp + t] = op(_x, b)
+        self.pc += 3
+
+    def _run_load_load_op(self, a, x, b, y, op, t):
+        fp = self.fp
+        M = self.M
+        _x = M[fp + x] = M[fp + a]
+        _y = M[fp + y] = M[fp + b]
+        M[fp + t] = op(_x, _y)
+        self.pc += 2
+
+    def _run_load_literal_op(self, a, x, b, y, op, t):
+        fp = self.fp
+        M = self.M
+        _x = M[fp + x] = M[fp + a]
+        M[fp + y] = b
+        M[fp + t] = op(_x, b)
+        self.pc += 2
+
+    def _run_elem_load(self, source, index, pointer, target):
+        fp = self.fp
+        M = self.M
+        _address = M[fp + pointer] = M[fp + source] + M[fp + index]
+        M[fp + target] = self.memory.load(_address)
+        self.pc += 1
+
+    def _run_elem_store(self, source, index, pointer, value):
+        fp = self.fp
+        M = self.M
+        _address = M[fp + pointer] = M[fp + source] + M[fp + index]
+        self.memory.store(_address, M[fp + value])
+        self.pc += 1
+
+    def _run_load_elem(self, varname, index, source, target):
+        fp = self.fp
+        M = self.M
+        _index = M[fp + index] = M[fp + varname]
+        M[fp + target] = M[fp + source] + _index
+        self.pc += 1
+
+    def _run_literal_store(self, value, temp, target):
+        fp = self.fp
+        M = self.M
+        M[fp + target] = M[fp + temp] = value
+        self.pc += 1
+
+    def _run_array_copy(self, source, target, dim):
+        # the array is copied once, straight to the target, since the
+        # temporary copy is only read by the store
+        M = self.M
+        self._copy_values(dim, M[self._address(target)], M[self._address(source)])
+        self.pc += 1
+
+    def run(self, ircode, stdin=None):
+        """
+        Run intermediate code in the interpreter, and return its result
+        (a RunResult).  ircode is a list of instruction tuples, or any
+        iterable of them (e.g. uc_irtext.iter_ir of a stream).  The input
+        of the program is read from stdin: a stream (sys.stdin by default),
+        a str, a bytes, or a list of the values to be read.  The number of
+        instructions of the result is only counted when the run has limits
+        (the plain execution loop doesn't count them), and is None else.
+        """
+        if not isinstance(ircode, Sequence):
+            ircode = list(ircode)
+        self._reset()
+        return self._result(self._execute, ircode, stdin)
 
-    def _alloc_reg(self, target):
-        # Alloc space in memory and save the offset in the dictionary
-        # for new vars or tempraries, only.
-        if target not in self.vars:
-            self.vars[target] = self.offset
-            self.offset += 1
+    def load(self, ircode):
+        """
+        Load the intermediate code, and keep the state of the memory after
+        the load (the global vars & constants), so the program can be run
+        many times with rerun, without loading it again.
+        """
+        if not isinstance(ircode, Sequence):
+            ircode = list(ircode)
+        self._reset()
+        self._load(ircode)
+        self.loaded = self.memory.snapshot()
 
-    def _get_address(self, source):
-        if source.startswith("@"):
-            return self.globals[source]
+    def rerun(self, stdin=None):
+        """
+        Run again the program loaded by load, from the state after the
+        load, and return its result, as run does.
+        """
+        self.memory.restore(self.loaded)
+        self.output = OutputBuffer(
+            io.StringIO() if self.capture else self.sink, self.flush
+        )
+        self.stack = []
+        self.params = []
+        self.memo_keys = []
+        self.executed = 0
+        return self._result(self._start, stdin)
+
+    def _result(self, execute, *args):
+        # Run the program with execute(*args) and build its RunResult
+        _start = time.perf_counter()
+        _code = 0
+        _error = None
+        try:
+            execute(*args)
+        except ProgramExit as e:
+            _code = e.code
+        except (LimitExceeded, StackOverflow, OutOfRange) as e:
+            _code = 1
+            _error = e
+        finally:
+            self.output.flush()
+        return self._run_result(_code, _error, _start)
+
+    def _run_result(self, code, error, start):
+        # The RunResult of the run started at start (perf_counter)
+        return RunResult(
+            code,
+            self.output.sink.getvalue() if self.capture else None,
+            None if self.limits is None else self.executed,
+            time.perf_counter() - start,
+            error,
+        )
+
+    def _execute(self, ircode, stdin):
+        self._load(ircode)
+        self._start(stdin)
+
+    def _start(self, stdin):
+        # Each instruction (opcode, *args) is decoded at load time to its
+        # method self.run_opcode, so here we just dispatch to the handler
+        # of the current pc. With hooks, the program run is instrumented
+        # to call them (see uc_hooks.Hooks).
+        _hooked = bool(self.hooks)
+        program = self.hooks.instrument() if _hooked else self.program
+        self._enter_main(InputSource(stdin))
+        if _hooked:
+            self.hooks.enter()
+        if self.limits is None:
+            self._dispatch(program)
         else:
-            return self.vars[source]
+            self._dispatch_limited(program)
+
+    def _enter_main(self, source):
+        # Now, running the program starting from the main function,
+        # whose frame is placed right after the global vars, reading
+        # from the source (see uc_io.InputSource).
+        self.input = source
+        self.frame = self.functions[self.start]
+        self.fp = self.memory.push(self.frame.size)
+        self._alloc_arrays()
+        self.M[self.fp] = None
+        self.pc = self.start
 
-    def _get_input(self):
-        global inputline
+    def _dispatch(self, program):
+        # The execution loop, kept apart so the profiler (see uc_profiler)
+        # can replace it without any cost here
         while True:
-            if len(inputline) > 0:
+            try:
+                handler, args = program[self.pc]
+            except IndexError:
                 break
-            inputline = sys.stdin.readline()
-            if not inputline:
-                print("Unexpected end of input file.", flush=True)
-            inputline = inputline[:-1].strip().split()
-
-    def _get_value(self, source):
-        if source.startswith("@"):
-            return M[self.globals[source]]
-        else:
-            return M[self.vars[source]]
-
-    def _load_multiple_values(self, size, varname, target):
-        self.vars[target] = self.offset
-        self.offset += size
-        self._store_multiple_values(size, target, varname)
-
-    def _push(self):
-        # save the addresses of the vars from caller & their last offset
-        self.stack.append(self.vars)
-        self.sp.append(self.offset)
+            self.pc += 1
+            handler(*args)
+
+    def _dispatch_limited(self, program):
+        # The execution loop with limits: the program runs in chunks of
+        # interval instructions (or of the instructions left), and the
+        # limits are checked between the chunks
+        limits = self.limits
+        _start = time.monotonic()
+        _base = 0  # Number of instructions run in the previous chunks
+        _count = 0  # Number of instructions started in this chunk
+        try:
+            while self.pc < len(program):
+                _chunk = limits.interval
+                if limits.instructions is not None:
+                    _chunk = min(_chunk, limits.instructions - _base)
+                    if _chunk <= 0:
+                        raise self._limit_exceeded(
+                            "instructions", limits.instructions, _base
+                        )
+                for _count in range(1, _chunk + 1):
+                    try:
+                        handler, args = program[self.pc]
+                    except IndexError:
+                        _count -= 1
+                        return
+                    self.pc += 1
+                    handler(*args)
+                _base += _chunk
+                _count = 0
+                self._check_limits(_start)
+        finally:
+            self.executed = _base + _count
+
+    def _check_limits(self, start):
+        limits = self.limits
+        if limits.time is not None:
+            _elapsed = time.monotonic() - start
+            if _elapsed > limits.time:
+                raise self._limit_exceeded("time", limits.time, round(_elapsed, 3))
+        if limits.memory is not None:
+            _memory = len(self.M) + sum(self.memory.tops)
+            if _memory > limits.memory:
+                raise self._limit_exceeded("memory", limits.memory, _memory)
+        if limits.depth is not None and len(self.stack) > limits.depth:
+            raise self._limit_exceeded("depth", limits.depth, len(self.stack))
+
+    def _limit_exceeded(self, limit, maximum, value):
+        # The error for the limit exceeded, at the next instruction to run
+        return LimitExceeded(limit, maximum, value, self.pc, self.frame.name)
 
-        # clear the dictionary of caller local vars and their offsets in memory
-        # and copy the parameters passed to the callee in their local vars.
+    #
+    # Auxiliary methods
+    #
+    def _address(self, operand):
+        # Absolute address of a register (slot >= 0) or a global (~address)
+        if operand >= 0:
+            return self.fp + operand
+        return ~operand
+
+    def _alloc_arrays(self):
+        # Alloc the arrays of the current frame, on top of the buffers
+        for _register, (_segment, _size) in self.frame.arrays.items():
+            _address = self.memory.alloc(_segment, _size)
+            self.M[self.fp + self.frame.slots[_register]] = _address
+
+    def _read(self, read):
+        # Read the next value of the input. Flush the output first, if
+        # someone may be waiting for the prompt.
+        if self.input.interactive:
+            self.output.flush()
+        try:
+            return read()
+        except EOFError as e:
+            self.output.write(str(e) + "\n")
+            raise ProgramExit(1)
+
+    def _push(self, layout, target):
+        # save the caller state: return pc, frame, the address of the register
+        # that receives the return value & the top of the memory. The frame
+        # of the callee is pushed right after the frame of the caller.
+        M = self.M
+        _mark = self.memory.mark()
+        self.stack.append((self.pc, self.fp, self.frame, target, _mark))
+        self.fp = self.memory.push(layout.size)
+        self.frame = layout
+        self._alloc_arrays()
+
+        # copy the parameters passed to the callee in their registers.
         # Finally, cleanup the parameters list used to transfer these vars
-        self.vars = {}
         idx = -1
         for idx, val in enumerate(self.params):
             # Note that arrays (size >=1) are passed by reference only.
-            self.vars["%" + str(idx)] = self.offset
-            M[self.offset] = M[val]
-            self.offset += 1
+            _slot = layout.numbered.get(idx)
+            if _slot is not None:
+                M[self.fp + _slot] = val
         self.params = []
 
-        # alloc register to the return value & initialize it with 0.
-        self.vars["%" + str(idx + 1)] = self.offset
-        M[self.offset] = 0
-        self.offset += 1
-
-        self._alloc_labels()
+        # initialize the register of the return value with 0.
+        _slot = layout.numbered.get(idx + 1)
+        if _slot is not None:
+            M[self.fp + _slot] = 0
 
     def _pop(self, target):
-        if self.returns:
+        M = self.M
+        if self.stack:
             # get the return value
-            _value = M[target]
-            # restore the vars of the caller
-            self.vars = self.stack.pop()
+            _value = None if target is None else M[target]
+            # restore the state of the caller & free the frame of the callee
+            self.pc, self.fp, self.frame, _register, _mark = self.stack.pop()
+            self.memory.release(_mark)
             # store in the caller return register the _value
-            M[self.vars[self.registers.pop()]] = _value
-            # restore the last offset from the caller
-            self.offset = self.sp.pop()
-            # jump to the return point in the caller
-            self.pc = self.returns.pop()
+            M[_register] = _value
         else:
             # We reach the end of main function, so return to system
             # with the code returned by main in the return register.
-            print(flush=True)
-            if target is None:
-                # void main () was defined, so exit with value 0
-                sys.exit(0)
-            else:
-                sys.exit(M[target])
-
-    def _store_deref(self, target, value):
-        if target.startswith("@"):
-            M[M[self.globals[target]]] = value
+            self._exit(None if target is None else M[target])
+
+    def _exit(self, value):
+        self.output.write("\n")
+        self.output.flush()
+        if value is None:
+            # void main () was defined, so exit with value 0
+            raise ProgramExit(0)
         else:
-            M[M[self.vars[target]]] = value
+            raise ProgramExit(value)
 
     def _store_multiple_values(self, dim, target, value):
-        _left = self._get_address(target)
-        _right = self._get_address(value)
-        if value.startswith("@"):
-            if isinstance(M[_right], str):
-                _value = list(M[_right])
-                M[_left : _left + dim] = _value
-                return
-        M[_left : _left + dim] = M[_right : _right + dim]
-
-    def _store_value(self, target, value):
-        if target.startswith("@"):
-            M[self.globals[target]] = value
+        # Copy the array (or the string constant) in the cell value to
+        # the array in the cell target.
+        M = self.M
+        self._copy_values(dim, M[self._address(target)], M[self._address(value)])
+
+    def _copy_values(self, dim, address, value):
+        # Copy dim elements of the array at the address value (or of the
+        # string value) to the array at address.
+        if isinstance(value, str):
+            self.memory.write(address, self.pool.chars(value)[:dim])
         else:
-            M[self.vars[target]] = value
+            self.memory.copy(address, value, dim)
 
     #
     # Run Operations, except Binary, Relational & Cast
     #
+    def _run_nop(self):
+        pass
+
+    def _run_unknown(self, opcode):
+        self.output.write("Warning: No run_" + opcode + "() method\n")
+
+    def _run_vector_loop(self, loop):
+        if loop.run(self):
+            self.pc = loop.exit
+
+    def _run_move(self, source, target):
+        self.M[self._address(target)] = self.M[self._address(source)]
+
     def run_alloc_int(self, varname):
-        self._alloc_reg(varname)
-        M[self.vars[varname]] = 0
+        self.M[self.fp + varname] = 0
 
     run_alloc_float = run_alloc_int
     run_alloc_char = run_alloc_int
+    run_alloc_bool = run_alloc_int
 
-    def run_alloc_int_(self, varname, **kwargs):
-        _dim = 1
-        for arg in kwargs.values():
-            if arg.isdigit():
-                _dim *= int(arg)
-        self.vars[varname] = self.offset
-        M[self.offset : self.offset + _dim] = _dim * [0]
-        self.offset += _dim
+    def run_alloc_int_(self, varname, dim, ref):
+        self.memory.clear(self.M[self.fp + varname], dim)
 
     run_alloc_float_ = run_alloc_int_
     run_alloc_char_ = run_alloc_int_
-
-    def run_call(self, source, target):
-        # alloc register to return and append it to register stack
-        self._alloc_reg(target)
-        self.registers.append(target)
-        # save the return pc in the return stack
-        self.returns.append(self.pc)
-        # jump to the calle function
-        if source.startswith("@"):
-            self.pc = M[self.globals[source]]
+    run_alloc_bool_ = run_alloc_int_
+
+    def _run_call_pointer(self, source, target):
+        # the pointer holds the entry pc of the function
+        self.run_call(self.functions[self.M[self._address(source)]], target)
+
+    def run_call(self, layout, target):
+        # save the return pc & jump to the callee function, right after
+        # its define
+        self._push(layout, self.fp + target)
+        self.pc = layout.entry + 1
+
+    def _run_call_memo(self, layout, target, memo):
+        # the result of a pure function, from its table if the arguments
+        # are there, else from the call (see _run_return_memo)
+        _key = memo.key(self.params)
+        _value = memo.lookup(_key)
+        if _value is MISSING:
+            self.memo_keys.append(_key)
+            self.run_call(layout, target)
         else:
-            self.pc = M[self.vars[source]]
+            self.params = []
+            self.M[self.fp + target] = _value
+
+    def _run_return_memo(self, target, memo):
+        memo.store(self.memo_keys.pop(), self.M[self.fp + target])
+        self._pop(self.fp + target)
 
     def run_cbranch(self, expr_test, true_target, false_target):
-        if M[self.vars[expr_test]]:
-            self.pc = self.vars[true_target]
+        if self.M[self.fp + expr_test]:
+            self.pc = true_target
         else:
-            self.pc = self.vars[false_target]
-
-    # Enter the function
-    def run_define(self, source):
-        if source == "@main":
-            # alloc register to the return value but not initialize it.
-            # We use the "None" value to check if main function returns void.
-            self._alloc_reg("%0")
-            # alloc the labels with respective pc's
-            self._alloc_labels()
-        else:
-            self._push()
+            self.pc = false_target
 
     def run_elem_int(self, source, index, target):
-        self._alloc_reg(target)
-        _aux = self._get_address(source)
-        _idx = self._get_value(index)
-        _address = _aux + _idx
-        self._store_value(target, _address)
+        M = self.M
+        M[self.fp + target] = M[self._address(source)] + M[self.fp + index]
 
     run_elem_float = run_elem_int
     run_elem_char = run_elem_int
+    run_elem_bool = run_elem_int
 
     def run_get_int(self, source, target):
         # We never generate this code without * (ref)
         # but we need to define it
         pass
 
-    def run_get_int_(self, source, target, **kwargs):
-        # kwargs always contain * (ref), so we ignore it.
-        self._store_value(target, self._get_address(source))
+    def run_get_int_(self, source, target, dim, ref):
+        # the modifier always contain * (ref), so we ignore it.
+        self.M[self._address(target)] = self._address(source)
 
     run_get_float_ = run_get_int_
     run_get_char_ = run_get_int_
 
     def run_jump(self, target):
-        self.pc = self.vars[target]
+        self.pc = target
 
     # load literals into registers
     def run_literal_int(self, value, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = value
+        self.M[self.fp + target] = value
 
     run_literal_float = run_literal_int
     run_literal_char = run_literal_int
 
     # Load/stores
     def run_load_int(self, varname, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = self._get_value(varname)
+        M = self.M
+        M[self.fp + target] = M[self.fp + varname]
 
     run_load_float = run_load_int
     run_load_char = run_load_int
     run_load_bool = run_load_int
 
-    def run_load_int_(self, varname, target, **kwargs):
-        _ref = 0
-        _dim = 1
-        for arg in kwargs.values():
-            if arg.isdigit():
-                _dim *= int(arg)
-            elif arg == "*":
-                _ref += 1
-        if _ref == 0:
-            self._load_multiple_values(_dim, varname, target)
-        elif _dim == 1 and _ref == 1:
-            self._alloc_reg(target)
-            M[self.vars[target]] = M[self._get_value(varname)]
+    def run_load_int_(self, varname, target, dim, ref):
+        if ref == 0:
+            self._store_multiple_values(dim, target, varname)
+        elif dim == 1 and ref == 1:
+            M = self.M
+            M[self.fp + target] = self.memory.load(M[self._address(varname)])
 
     run_load_float_ = run_load_int_
     run_load_char_ = run_load_int_
+    run_load_bool_ = run_load_int_
 
     def run_param_int(self, source):
-        self.params.append(self.vars[source])
+        # the value, since the slot of the source may be reused before
+        # the call (see _pack)
+        self.params.append(self.M[self.fp + source])
 
     run_param_float = run_param_int
     run_param_char = run_param_int
 
     def run_print_string(self, source):
-        _res = list(self._get_value((source)))
-        for c in _res:
-            print(c, end="", flush=True)
+        self.output.write(self.M[self._address(source)])
 
     def run_print_int(self, source):
-        print(self._get_value(source), end="", flush=True)
+        self.output.write(str(self.M[self._address(source)]))
 
     run_print_float = run_print_int
     run_print_char = run_print_int
     run_print_bool = run_print_int
 
     def run_read_int(self, source):
-        global inputline
-        self._get_input()
-        try:
-            v1 = inputline[0]
-            inputline = inputline[1:]
-            try:
-                v2 = int(v1)
-            except:
-                v2 = v1
-        except:
-            print("Illegal input value.", flush=True)
-        self._alloc_reg(source)
-        self._store_value(source, v2)
+        self.M[self._address(source)] = self._read(self.input.read_int)
 
     def run_read_float(self, source):
-        global inputline
-        self._get_input()
-        try:
-            v1 = inputline[0]
-            inputline = inputline[1:]
-            try:
-                v2 = float(v1)
-            except:
-                v2 = v1
-        except:
-            print("Illegal input value.", flush=True)
-        self._alloc_reg(source)
-        self._store_value(source, v2)
+        self.M[self._address(source)] = self._read(self.input.read_float)
 
     def run_read_char(self, source):
-        global inputline
-        self._get_input()
-        v1 = inputline[0]
-        inputline = inputline[1:]
-        self._alloc_reg(source)
-        self._store_value(source, v1)
+        self.M[self._address(source)] = self._read(self.input.read_char)
 
     def run_return_int(self, target):
-        self._pop(self.vars[target])
+        self._pop(self.fp + target)
 
     run_return_float = run_return_int
     run_return_char = run_return_int
 
     def run_return_void(self):
-        self._pop(M[self.vars["%0"]])
+        self._pop(None)
 
     def run_store_int(self, source, target):
-        self._store_value(target, self._get_value(source))
+        M = self.M
+        M[self.fp + target] = M[self.fp + source]
 
     run_store_float = run_store_int
     run_store_char = run_store_int
     run_store_bool = run_store_int
 
-    def run_store_int_(self, source, target, **kwargs):
-        _ref = 0
-        _dim = 1
-        for arg in kwargs.values():
-            if arg.isdigit():
-                _dim *= int(arg)
-            elif arg == "*":
-                _ref += 1
-        if _ref == 0:
-            self._store_multiple_values(_dim, target, source)
-        elif _dim == 1 and _ref == 1:
-            self._store_deref(target, self._get_value(source))
+    def run_store_int_(self, source, target, dim, ref):
+        if ref == 0:
+            self._store_multiple_values(dim, target, source)
+        elif dim == 1 and ref == 1:
+            M = self.M
+            self.memory.store(M[self._address(target)], M[self._address(source)])
 
     run_store_float_ = run_store_int_
     run_store_char_ = run_store_int_
+    run_store_bool_ = run_store_int_
 
     #
     # perform binary, relational & cast operations
     #
     def run_add_int(self, left, right, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = M[self.vars[left]] + M[self.vars[right]]
+        fp = self.fp
+        M = self.M
+        M[fp + target] = M[fp + left] + M[fp + right]
 
     def run_sub_int(self, left, right, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = M[self.vars[left]] - M[self.vars[right]]
+        fp = self.fp
+        M = self.M
+        M[fp + target] = M[fp + left] - M[fp + right]
 
     def run_mul_int(self, left, right, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = M[self.vars[left]] * M[self.vars[right]]
+        fp = self.fp
+        M = self.M
+        M[fp + target] = M[fp + left] * M[fp + right]
 
     def run_mod_int(self, left, right, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = M[self.vars[left]] % M[self.vars[right]]
+        fp = self.fp
+        M = self.M
+        M[fp + target] = M[fp + left] % M[fp + right]
 
     def run_div_int(self, left, right, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = M[self.vars[left]] // M[self.vars[right]]
+        fp = self.fp
+        M = self.M
+        M[fp + target] = M[fp + left] // M[fp + right]
 
     def run_div_float(self, left, right, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = M[self.vars[left]] / M[self.vars[right]]
+        fp = self.fp
+        M = self.M
+        M[fp + target] = M[fp + left] / M[fp + right]
 
     # Floating point ops (same as int)
     run_add_float = run_add_int
@@ -509,28 +1309,34 @@ class Interpreter(object):
 
     # Integer comparisons
     def run_lt_int(self, left, right, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = M[self.vars[left]] < M[self.vars[right]]
+        fp = self.fp
+        M = self.M
+        M[fp + target] = M[fp + left] < M[fp + right]
 
     def run_le_int(self, left, right, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = M[self.vars[left]] <= M[self.vars[right]]
+        fp = self.fp
+        M = self.M
+        M[fp + target] = M[fp + left] <= M[fp + right]
 
     def run_gt_int(self, left, right, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = M[self.vars[left]] > M[self.vars[right]]
+        fp = self.fp
+        M = self.M
+        M[fp + target] = M[fp + left] > M[fp + right]
 
     def run_ge_int(self, left, right, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = M[self.vars[left]] >= M[self.vars[right]]
+        fp = self.fp
+        M = self.M
+        M[fp + target] = M[fp + left] >= M[fp + right]
 
     def run_eq_int(self, left, right, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = M[self.vars[left]] == M[self.vars[right]]
+        fp = self.fp
+        M = self.M
+        M[fp + target] = M[fp + left] == M[fp + right]
 
     def run_ne_int(self, left, right, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = M[self.vars[left]] != M[self.vars[right]]
+        fp = self.fp
+        M = self.M
+        M[fp + target] = M[fp + left] != M[fp + right]
 
     # Float comparisons
     run_lt_float = run_lt_int
@@ -553,21 +1359,53 @@ class Interpreter(object):
     run_ne_bool = run_ne_int
 
     def run_and_bool(self, left, right, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = M[self.vars[left]] and M[self.vars[right]]
+        fp = self.fp
+        M = self.M
+        M[fp + target] = M[fp + left] and M[fp + right]
 
     def run_or_bool(self, left, right, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = M[self.vars[left]] or M[self.vars[right]]
+        fp = self.fp
+        M = self.M
+        M[fp + target] = M[fp + left] or M[fp + right]
 
     def run_not_bool(self, source, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = not self._get_value(source)
+        fp = self.fp
+        M = self.M
+        M[fp + target] = not M[fp + source]
 
     def run_sitofp(self, source, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = float(self._get_value(source))
+        fp = self.fp
+        M = self.M
+        M[fp + target] = float(M[fp + source])
 
     def run_fptosi(self, source, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = int(self._get_value(source))
+        fp = self.fp
+        M = self.M
+        M[fp + target] = int(M[fp + source])
+
+    # Python operators of the binary opcodes, used by the superinstructions,
+    # and the operator to use when its operands are swapped.
+    BINARY_OPS = {
+        run_add_int: operator.add,
+        run_sub_int: operator.sub,
+        run_mul_int: operator.mul,
+        run_mod_int: operator.mod,
+        run_div_int: operator.floordiv,
+        run_div_float: operator.truediv,
+        run_lt_int: operator.lt,
+        run_le_int: operator.le,
+        run_gt_int: operator.gt,
+        run_ge_int: operator.ge,
+        run_eq_int: operator.eq,
+        run_ne_int: operator.ne,
+    }
+    SWAPPED_OPS = {
+        operator.add: operator.add,
+        operator.mul: operator.mul,
+        operator.lt: operator.gt,
+        operator.le: operator.ge,
+        operator.gt: operator.lt,
+        operator.ge: operator.le,
+        operator.eq: operator.eq,
+        operator.ne: operator.ne,
+    }
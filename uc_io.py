@@ -0,0 +1,188 @@
+# ---------------------------------------------------------------------------------
+# uc: uc_io.py
+#
+# Input & output of the programs run by the interpreter of the uC intermediate
+# representation (see uc_interpreter.py)
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+import codecs
+import io
+import re
+import sys
+
+# Flush policies of the output:
+#   "exit"   - flush when the buffer is full, before an interactive read
+#              and when the program ends (the default)
+#   "line"   - also flush at the end of each line written
+#   "always" - flush at each write, as print(..., flush=True) does
+FLUSH_POLICIES = ("exit", "line", "always")
+
+# Number of characters kept in the buffer before writing to the sink,
+# and read at once from the input
+BUFFER_SIZE = 1 << 16
+
+# A token of the input, and the blanks before it
+TOKEN = re.compile(r"\s*(\S+)")
+
+
+class OutputBuffer(object):
+    """
+    Output of the print_* opcodes.  The text written is accumulated in a
+    buffer, and written to the sink in large chunks, according to the
+    flush policy.  The sink is a binary stream (sys.stdout.buffer by
+    default), where the text is written encoded as sys.stdout would do,
+    or a text stream.
+    """
+
+    def __init__(self, sink=None, policy="exit", encoding=None, errors=None):
+        if policy not in FLUSH_POLICIES:
+            raise ValueError("Unknown flush policy: %s" % policy)
+        self.stdout = sink is None
+        if sink is None:
+            sink = getattr(sys.stdout, "buffer", sys.stdout)
+        self.sink = sink
+        self.binary = not isinstance(sink, io.TextIOBase)
+        self.encoding = encoding or getattr(sys.stdout, "encoding", None) or "utf-8"
+        self.errors = errors or getattr(sys.stdout, "errors", None) or "strict"
+        self.policy = policy
+        self.pieces = []  # Text written & not flushed yet
+        self.size = 0  # Number of characters in the pieces
+        self.written = 0  # Number of characters written to the sink
+        if policy == "line":
+            self.write = self._write_line
+        elif policy == "always":
+            self.write = self._write_always
+
+    def write(self, text):
+        self.pieces.append(text)
+        self.size += len(text)
+        if self.size >= BUFFER_SIZE:
+            self.flush()
+
+    def _write_line(self, text):
+        self.pieces.append(text)
+        self.size += len(text)
+        if self.size >= BUFFER_SIZE or "\n" in text:
+            self.flush()
+
+    def _write_always(self, text):
+        self.pieces.append(text)
+        self.flush()
+
+    def flush(self):
+        _text = "".join(self.pieces)
+        self.pieces = []
+        self.size = 0
+        self.written += len(_text)
+        if self.stdout:
+            # keep the order with what was printed through sys.stdout
+            sys.stdout.flush()
+        if _text and self.binary:
+            self.sink.write(_text.encode(self.encoding, self.errors))
+        elif _text:
+            self.sink.write(_text)
+        self.sink.flush()
+
+
+class InputSource(object):
+    """
+    Input of the read_* opcodes.  The source is read in bulk (or line by
+    line, when it is interactive) and split in tokens separated by blanks
+    only when a token is requested, keeping a cursor in the buffer.  The
+    source may be a text or binary stream (sys.stdin by default), a str,
+    a bytes, or a list of values already split, like [3, "1", 2.5].  A
+    read of the stream returns the input available, without waiting for
+    a full buffer, so a pipe or a socket is not blocked by a short input.
+
+    read_int & read_float convert the next token, or return it unchanged
+    when it is not a valid number, and read_char returns the token. All
+    of them raise EOFError when the input ends.
+    """
+
+    def __init__(self, source=None):
+        if source is None:
+            source = sys.stdin
+        self.values = None  # Values of a pre-built input vector
+        self.stream = None  # Stream still to be read
+        self.text = ""  # Text read & not consumed yet
+        self.pos = 0  # Cursor of the next token in the text
+        if isinstance(source, (list, tuple)):
+            self.values = iter(source)
+        elif isinstance(source, (bytes, bytearray)):
+            self.text = source.decode("utf-8")
+        elif isinstance(source, str):
+            self.text = source
+        else:
+            # a text stream is read from its binary buffer, where read1
+            # returns as soon as some bytes are available
+            self.stream = getattr(source, "buffer", source)
+            self.read_chunk = getattr(self.stream, "read1", self.stream.read)
+        # a char of the stream may be split between two chunks
+        self.decoder = codecs.getincrementaldecoder(
+            getattr(source, "encoding", None) or "utf-8"
+        )(getattr(source, "errors", None) or "strict")
+        isatty = getattr(source, "isatty", None)
+        # flush the output before reading, if someone may be waiting for
+        # the prompt
+        self.interactive = bool(isatty and isatty())
+
+    def _fill(self):
+        # Read more text from the stream, keeping the unconsumed text
+        while True:
+            if self.interactive:
+                _data = self.stream.readline()
+            else:
+                _data = self.read_chunk(BUFFER_SIZE)
+            _chunk = _data
+            if isinstance(_data, bytes):
+                _chunk = self.decoder.decode(_data, final=not _data)
+            if _chunk or not _data:
+                break
+        if not _chunk:
+            self.stream = None
+            return False
+        self.text = self.text[self.pos :] + _chunk
+        self.pos = 0
+        return True
+
+    def next_token(self):
+        if self.values is not None:
+            return next(self.values, None)
+        while True:
+            _match = TOKEN.match(self.text, self.pos)
+            # a token at the end of the text may continue in the stream
+            if _match and (_match.end() < len(self.text) or self.stream is None):
+                self.pos = _match.end()
+                return _match.group(1)
+            if self.stream is None or not self._fill():
+                if _match:
+                    continue
+                return None
+
+    def _next(self):
+        _token = self.next_token()
+        if _token is None:
+            raise EOFError("Unexpected end of input file.")
+        return _token
+
+    def read_int(self):
+        _token = self._next()
+        try:
+            return int(_token)
+        except (TypeError, ValueError):
+            return _token
+
+    def read_float(self):
+        _token = self._next()
+        try:
+            return float(_token)
+        except (TypeError, ValueError):
+            return _token
+
+    def read_char(self):
+        return self._next()
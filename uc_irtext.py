@@ -0,0 +1,148 @@
+# ---------------------------------------------------------------------------------
+# uc: uc_irtext.py
+#
+# Text format of the uC intermediate representation: one instruction tuple per
+# line, e.g. ('literal_int', 1, '%1'), read as a stream & written buffered
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+import ast
+import re
+
+# Number of characters kept in the buffer of the writer before writing
+BUFFER_SIZE = 1 << 16
+
+# An argument of a plain instruction: a str without quotes or escapes, or a
+# number, followed by a comma or by the end of the tuple
+ARGUMENT = re.compile(
+    r"\s*(?:'([^'\\]*)'|([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?))\s*(,|(?=\)))"
+)
+INTEGER = re.compile(r"[-+]?\d+$")
+
+# The end of an instruction: the tuple closed, and maybe a comment with the
+# source coordinate, in the format of ast.Coord, e.g. # @ 12:9
+END = re.compile(r"\)\s*(?:#\s*(?:@\s*(\d+))?.*)?$")
+
+
+def parse_line(line):
+    """
+    Parse a line of the text format: returns (instruction, source line),
+    the instruction None for a blank or comment line, and the source line
+    None when there is no coordinate.  The plain instructions (strs &
+    numbers) are parsed by the regexes, the others by ast.literal_eval.
+    """
+    _text = line.strip()
+    if not _text or _text[0] == "#":
+        return (None, None)
+    _args = []
+    _pos = 1
+    _comma = False
+    if _text[0] == "(":
+        while True:
+            _arg = ARGUMENT.match(_text, _pos)
+            if _arg is None:
+                break
+            _str, _number, _comma = _arg.groups()
+            if _str is not None:
+                _args.append(_str)
+            elif INTEGER.match(_number):
+                _args.append(int(_number))
+            else:
+                _args.append(float(_number))
+            _pos = _arg.end()
+    _end = END.match(_text, _pos)
+    if _end is None or not _args or (len(_args) == 1 and not _comma):
+        # lists, escapes, ... (a comment with a ")" ends here too)
+        op = ast.literal_eval(_text)
+        _coord = re.search(r"#\s*@\s*(\d+)", _text)
+        return (op, int(_coord.group(1)) if _coord else None)
+    _line = _end.group(1)
+    return (tuple(_args), int(_line) if _line else None)
+
+
+def iter_ir(stream):
+    """
+    Generator of the instruction tuples of a stream in the text format,
+    read line by line, so the memory used doesn't depend on its size.
+    """
+    for line in stream:
+        op, _ = parse_line(line)
+        if op is not None:
+            yield op
+
+
+def iter_coords(stream):
+    """ Generator of the source line of each instruction (or None) """
+    for line in stream:
+        op, _line = parse_line(line)
+        if op is not None:
+            yield _line
+
+
+def read_ir(filename):
+    """ Read the instruction tuples of a .ir file """
+    with open(filename, "r") as ir_file:
+        return list(iter_ir(ir_file))
+
+
+def read_coords(filename):
+    """ Read the source line of each instruction of a .ir file (or None) """
+    with open(filename, "r") as ir_file:
+        return list(iter_coords(ir_file))
+
+
+class IRWriter(object):
+    """
+    Writes instruction tuples to a text stream, one per line, with the
+    source coordinate (an ast.Coord or a line number) as a comment if
+    given.  The lines are kept in a buffer & written in large chunks:
+
+        with open("prog.ir", "w") as ir_file:
+            with IRWriter(ir_file) as writer:
+                for op in ircode:
+                    writer.write(op)
+    """
+
+    def __init__(self, stream, buffer_size=BUFFER_SIZE):
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.pieces = []  # Lines written & not flushed yet
+        self.size = 0  # Number of characters in the pieces
+
+    def write(self, op, coord=None):
+        _line = repr(tuple(op))
+        if coord is not None:
+            if not hasattr(coord, "line"):
+                _line += "  # @ %s" % coord
+            elif coord.column is None:
+                _line += "  # @ %s" % coord.line
+            else:
+                _line += "  # @ %s:%s" % (coord.line, coord.column)
+        self.pieces.append(_line + "\n")
+        self.size += len(_line) + 1
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.pieces:
+            self.stream.write("".join(self.pieces))
+            self.pieces = []
+            self.size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+
+def write_ir(ircode, filename, coords=None):
+    """ Write the instruction tuples (and their coordinates) to a .ir file """
+    with open(filename, "w") as ir_file:
+        with IRWriter(ir_file) as writer:
+            for pc, op in enumerate(ircode):
+                writer.write(op, None if coords is None else coords[pc])
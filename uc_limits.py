@@ -0,0 +1,81 @@
+# ---------------------------------------------------------------------------------
+# uc: uc_limits.py
+#
+# Limits of the resources used by a program run in the interpreter of the uC
+# intermediate representation (see uc_interpreter.py)
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+
+# Number of instructions run between two checks of the limits
+CHECK_INTERVAL = 1 << 12
+
+
+class LimitExceeded(Exception):
+    """
+    Raised when a program exceeds one of its limits.  It tells which
+    limit (instructions, time, memory or depth), its value & the value
+    reached, and where the program was: the pc & the function.
+    """
+
+    def __init__(self, limit, maximum, value, pc, function):
+        self.limit = limit
+        self.maximum = maximum
+        self.value = value
+        self.pc = pc
+        self.function = function
+        super().__init__(
+            "Limit exceeded: %s (%s of %s) at pc %d in %s"
+            % (limit, value, maximum, pc, function)
+        )
+
+    def __reduce__(self):
+        # pickled with its fields (e.g. from the workers of uc_batch)
+        return (
+            LimitExceeded,
+            (self.limit, self.maximum, self.value, self.pc, self.function),
+        )
+
+    def as_dict(self):
+        return {
+            "limit": self.limit,
+            "maximum": self.maximum,
+            "value": self.value,
+            "pc": self.pc,
+            "function": self.function,
+        }
+
+
+class Limits(object):
+    """
+    Limits of a run: the number of instructions executed, the wall time
+    in seconds, the memory (cells plus array elements in use) & the depth
+    of the calls.  None means no limit.  The limits are checked every
+    interval instructions, so a program may go past a limit by less than
+    interval instructions, except the number of instructions, that is
+    exact.  A run with limits doesn't fuse superinstructions, vectorize
+    loops nor memoize calls (see Interpreter), so every instruction of
+    the program is counted.
+
+        vm = Interpreter(limits=Limits(instructions=10 ** 7, time=2.0))
+    """
+
+    def __init__(
+        self,
+        instructions=None,
+        time=None,
+        memory=None,
+        depth=None,
+        interval=CHECK_INTERVAL,
+    ):
+        if interval < 1:
+            raise ValueError("The check interval must be positive")
+        self.instructions = instructions
+        self.time = time
+        self.memory = memory
+        self.depth = depth
+        self.interval = interval
@@ -0,0 +1,848 @@
+# ---------------------------------------------------------------------------------
+# uc: uc_llvm.py
+#
+# LLVMEngine class: runs the uC intermediate representation natively, lowering it
+#                   to LLVM IR compiled by the MCJIT of llvmlite, or falls back to
+#                   the interpreter (see uc_interpreter.py)
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+import ctypes
+import itertools
+import threading
+from uc_interpreter import Interpreter
+from uc_io import InputSource
+from uc_memory import DEFAULT_STACK_LIMIT, StackOverflow
+
+try:
+    from llvmlite import binding, ir
+except ImportError:
+    # without llvmlite, the programs are run by the interpreter
+    binding = ir = None
+
+# LLVM types of the uC types. Chars are unicode code points, as the
+# chars of the interpreter are str of length 1.
+if ir is not None:
+    TYPES = {
+        "int": ir.IntType(64),
+        "float": ir.DoubleType(),
+        "char": ir.IntType(32),
+        "bool": ir.IntType(1),
+    }
+    INDEX = ir.IntType(32)
+else:
+    TYPES = {}
+    INDEX = None
+
+# Bytes of the native stack the frames of the program may use, counted
+# by the functions on entry from the size of their slots & arrays, and
+# the bytes of a frame besides them (return address, saved registers)
+NATIVE_STACK = 1 << 21
+FRAME_OVERHEAD = 64
+
+# Python & LLVM operators of the binary & relational opcodes
+ARITHMETIC = {"add", "sub", "mul", "div", "mod"}
+COMPARISONS = {"lt": "<", "le": "<=", "gt": ">", "ge": ">=", "eq": "==", "ne": "!="}
+
+# Runtime shims called by the native code: name -> (restype, argtypes).
+# They write & read through the output & input of the interpreter.  The
+# native code passes the key of its engine before the arguments.
+SHIMS = {
+    "print_int": (None, (ctypes.c_int64,)),
+    "print_float": (None, (ctypes.c_double,)),
+    "print_char": (None, (ctypes.c_int32,)),
+    "print_bool": (None, (ctypes.c_int32,)),
+    "print_string": (None, (ctypes.c_int64,)),
+    "read_int": (ctypes.c_int64, ()),
+    "read_float": (ctypes.c_double, ()),
+    "read_char": (ctypes.c_int32, ()),
+    "zero_division": (None, (ctypes.c_int32,)),
+    "overflow": (None, ()),
+    "stack_overflow": (None, ()),
+}
+
+
+# The symbols of llvmlite are global to the process, so the shims are
+# bound once, and call the engine of the key passed by the native code
+_engines = {}  # Key -> LLVMEngine running native code
+_keys = itertools.count(1)
+_callbacks = {}  # Name of the shim -> ctypes callback (kept alive)
+_lock = threading.Lock()  # LLVM compiles one module at a time
+
+
+def _bind_shims():
+    # Initialize LLVM & bind the shims to their symbols, once (called
+    # with the lock held)
+    if _callbacks:
+        return
+    try:
+        binding.initialize()
+    except RuntimeError:
+        # newer versions of llvmlite initialize LLVM by themselves
+        pass
+    binding.initialize_native_target()
+    binding.initialize_native_asmprinter()
+    for _name, (_restype, _argtypes) in SHIMS.items():
+        _callback = ctypes.CFUNCTYPE(_restype, ctypes.c_int64, *_argtypes)(
+            _dispatch(_name)
+        )
+        _callbacks[_name] = _callback
+        _address = ctypes.cast(_callback, ctypes.c_void_p).value
+        binding.add_symbol("uc." + _name, _address)
+
+
+def _dispatch(name):
+    # The shim of the process: runs the shim of the engine of the key
+    def _run(key, *args):
+        return _engines[key]._run_shim(name, args)
+
+    return _run
+
+
+class LoweringError(Exception):
+    """ Raised when the program uses a construct the backend can't lower. """
+
+    pass
+
+
+class RecordedInput(InputSource):
+    """
+    Input that keeps the text read from its source, so the program can be
+    run again by the interpreter from its start (see LLVMEngine).
+    """
+
+    def __init__(self, source=None):
+        super().__init__(source)
+        self.items = None  # Values of a pre-built input vector
+        if self.values is not None:
+            self.items = list(source)
+            self.values = iter(self.items)
+        self.chunks = [self.text]  # Text read so far
+
+    def _fill(self):
+        _size = len(self.text) - self.pos
+        if not super()._fill():
+            return False
+        self.chunks.append(self.text[_size:])
+        return True
+
+    def rewind(self):
+        # Read again from the start
+        if self.items is not None:
+            self.values = iter(self.items)
+        self.text = "".join(self.chunks)
+        self.pos = 0
+        self.chunks = [self.text]
+        return self
+
+
+class LLVMEngine(Interpreter):
+    """
+    Runs the uC intermediate code natively.  The instruction tuples are
+    lowered to a LLVM module (one LLVM function per uC function), which
+    is optimized and compiled to machine code by the MCJIT of llvmlite,
+    like the code generator of the fourth project does:
+
+        - each register gets a stack slot (alloca) of its type, inferred
+          from the opcodes that use it; the optimizer promotes the slots
+          to SSA values (mem2reg).
+        - the arrays are LLVM arrays, and the register of an array holds
+          the pointer to its first element, as the cell of an array in
+          the interpreter holds its address.
+        - the globals are LLVM globals, and the labels basic blocks.
+        - print_* & read_* call shims written in Python, that use the
+          buffered output & the input of the interpreter, so the output,
+          the errors and the exit codes are the same.
+
+    An exception can't unwind the native code, so the exception raised by
+    a shim (e.g. the ProgramExit at the end of the input) stops it: the
+    native functions return up to main, and then run raises the exception
+    (or returns the exit code) as the interpreter would.  The native ints
+    have 64 bits, the int division & modulo are rounded to floor as in
+    Python, and a division by zero raises ZeroDivisionError.  The ints of
+    the interpreter have no limit, so on an overflow of +, - or * the
+    program runs again in the interpreter, from its start and with the
+    same input, instead of printing a wrong result; if the output was
+    already written, it can't be taken back and OverflowError is raised.
+    The same goes for a recursion deeper than the native stack allows
+    (see NATIVE_STACK), that raises StackOverflow, and for an input that
+    the native types can't hold (e.g. a word read by read_int, that the
+    interpreter keeps as a str), that raises LoweringError.
+
+    When llvmlite is not importable, or the program uses a construct that
+    is not lowered (e.g. pointers to functions, pointers to pointers, or
+    an opcode without run_* method), the program is run by the Interpreter
+    instead: self.fallback tells the reason, or is None when native.
+    """
+
+    def __init__(
+        self, stack_limit=DEFAULT_STACK_LIMIT, output=None, flush="exit", capture=False
+    ):
+        super().__init__(stack_limit, output, flush, capture=capture)
+        self.fallback = None  # Reason to run in the interpreter, if any
+        self.module = None  # LLVM module of the program
+        self.builder = None
+        self.engine = None  # MCJIT execution engine
+        self.stop = None  # LLVM global set when a shim stops the program
+        self.depth = None  # LLVM global of the bytes of native stack in use
+        self.frame_size = 0  # Bytes of native stack of the current function
+        self.stopped = None  # The value of self.stop, as a ctypes int
+        self.key = next(_keys)  # Key of the engine, passed to the shims
+        self.context = None  # LLVM global of the key
+        self.error = None  # Exception that stopped the native code
+        self.shims = {}  # Name -> LLVM function of the runtime shims
+        self.texts = []  # Text of the global strings, by index
+        self.strings = {}  # Name of global string -> index of its text
+        self.variables = {}  # Global name -> (LLVM global, value type, kind)
+        self.signatures = {}  # Function name -> LLVM function
+        self.kinds = {}  # Register of the current function -> LLVM type
+        self.slots = {}  # Register of the current function -> alloca
+        self.local_arrays = {}  # Array register -> (element type, size)
+        self.labels = {}  # Label of the current function -> basic block
+        self.pending = []  # Parameters passed to the next call
+
+    def _execute(self, ircode, stdin):
+        # Run intermediate code natively, or in the interpreter (see the
+        # class docstring & Interpreter.run)
+        if ir is None:
+            self.fallback = "llvmlite is not installed"
+            return super()._execute(ircode, stdin)
+        try:
+            self._lower(ircode)
+            main = self._compile()
+        except (LoweringError, RuntimeError, TypeError) as e:
+            # RuntimeError & TypeError are raised by llvmlite for invalid
+            # IR (e.g. registers used with different types)
+            self.fallback = str(e)
+            return super()._execute(ircode, stdin)
+
+        self.input = RecordedInput(stdin)
+        self.error = None
+        self.stopped.value = 0
+        _engines[self.key] = self
+        try:
+            _value = main()
+        finally:
+            del _engines[self.key]
+        if isinstance(self.error, (OverflowError, StackOverflow, LoweringError)) and (
+            self.capture or self.output.written == 0
+        ):
+            # nothing printed yet, the interpreter can run it from the start
+            self.fallback = str(self.error)
+            return self._replay(ircode, self.input.rewind())
+        elif self.error is not None:
+            raise self.error
+        if self.signatures["@main"].function_type.return_type == ir.VoidType():
+            _value = None
+        self._exit(_value)
+
+    def _replay(self, ircode, source):
+        # Run the program in the interpreter, reading from source
+        self._reset()
+        self._load(ircode)
+        self._enter_main(source)
+        self._dispatch(self.program)
+
+    #
+    # Compilation
+    #
+    def _compile(self):
+        # Optimize & compile the module, and bind the shims. Returns the
+        # main function as a ctypes function.
+        with _lock:
+            return self._compile_module()
+
+    def _compile_module(self):
+        _bind_shims()
+        _module = binding.parse_assembly(str(self.module))
+        _module.verify()
+        _target = binding.Target.from_default_triple().create_target_machine()
+        if hasattr(binding, "create_pass_builder"):
+            _options = binding.create_pipeline_tuning_options(speed_level=2)
+            _builder = binding.create_pass_builder(_target, _options)
+            _builder.getModulePassManager().run(_module, _builder)
+        else:
+            _builder = binding.create_pass_manager_builder()
+            _builder.opt_level = 2
+            _passes = binding.create_module_pass_manager()
+            _builder.populate(_passes)
+            _passes.run(_module)
+
+        self.engine = binding.create_mcjit_compiler(_module, _target)
+        self.engine.finalize_object()
+        _address = self.engine.get_global_value_address(self.stop.name)
+        self.stopped = ctypes.c_int32.from_address(_address)
+        _address = self.engine.get_global_value_address(self.context.name)
+        ctypes.c_int64.from_address(_address).value = self.key
+        _main = self.signatures["@main"]
+        _restype = {
+            "i64": ctypes.c_int64,
+            "double": ctypes.c_double,
+            "i32": ctypes.c_int32,
+            "i1": ctypes.c_bool,
+        }.get(str(_main.function_type.return_type))
+        _address = self.engine.get_function_address(_main.name)
+        return ctypes.CFUNCTYPE(_restype)(_address)
+
+    def _run_shim(self, name, args):
+        # An exception can't unwind the native code, so the shims keep it
+        # and set the stop flag, and the native code returns up to main
+        # (see _call), where _execute raises it.
+        try:
+            return getattr(self, "_shim_" + name)(*args)
+        except BaseException as e:
+            self.error = e
+            self.stopped.value = 1
+            return 0
+
+    def _shim_print_int(self, value):
+        self.output.write(str(value))
+
+    _shim_print_float = _shim_print_int
+
+    def _shim_print_char(self, value):
+        self.output.write(chr(value))
+
+    def _shim_print_bool(self, value):
+        self.output.write(str(bool(value)))
+
+    def _shim_print_string(self, index):
+        self.output.write(self.texts[index])
+
+    def _shim_read_int(self):
+        _value = self._read(self.input.read_int)
+        if not isinstance(_value, int):
+            raise LoweringError("No lowering of the input %r as int" % _value)
+        elif not -(1 << 63) <= _value < 1 << 63:
+            raise OverflowError("int overflow in the input %d" % _value)
+        return _value
+
+    def _shim_read_float(self):
+        _value = self._read(self.input.read_float)
+        if not isinstance(_value, float):
+            raise LoweringError("No lowering of the input %r as float" % _value)
+        return _value
+
+    def _shim_read_char(self):
+        _value = self._read(self.input.read_char)
+        if len(_value) != 1:
+            raise LoweringError("No lowering of the input %r as char" % _value)
+        return ord(_value)
+
+    def _shim_zero_division(self, is_float):
+        if is_float:
+            raise ZeroDivisionError("float division by zero")
+        raise ZeroDivisionError("integer division or modulo by zero")
+
+    def _shim_overflow(self):
+        raise OverflowError("int overflow in the native code")
+
+    def _shim_stack_overflow(self):
+        raise StackOverflow(
+            "Stack overflow: more than %d bytes of native stack in use."
+            % NATIVE_STACK
+        )
+
+    #
+    # Lowering
+    #
+    def _lower(self, ircode):
+        # Build the LLVM module: the shims, the globals, the signature of
+        # each function, and then the body of the functions.
+        self.texts = []
+        self.strings = {}
+        self.variables = {}
+        self.signatures = {}
+        self.module = ir.Module(name="uc")
+        self.module.triple = binding.get_default_triple()
+        self.stop = ir.GlobalVariable(self.module, ir.IntType(32), "uc.stop")
+        self.stop.initializer = ir.Constant(ir.IntType(32), 0)
+        self.depth = ir.GlobalVariable(self.module, TYPES["int"], "uc.depth")
+        self.depth.initializer = ir.Constant(TYPES["int"], 0)
+        self.context = ir.GlobalVariable(self.module, TYPES["int"], "uc.context")
+        self.context.initializer = ir.Constant(TYPES["int"], 0)
+        for _name, (_restype, _argtypes) in SHIMS.items():
+            _type = ir.FunctionType(
+                self._ctype(_restype),
+                [TYPES["int"]] + [self._ctype(_arg) for _arg in _argtypes],
+            )
+            self.shims[_name] = ir.Function(self.module, _type, name="uc." + _name)
+
+        _bodies = {}
+        _body = None
+        for op in ircode:
+            if op[0].startswith("global"):
+                self._lower_global(op)
+            elif op[0] == "define":
+                _body = _bodies[op[1]] = []
+            elif _body is not None:
+                _body.append(op)
+        if "@main" not in _bodies:
+            raise LoweringError("No main function")
+        self._lower_signatures(_bodies)
+        for _name, _body in _bodies.items():
+            self._lower_function(_name, _body)
+
+    def _ctype(self, ctype):
+        # LLVM type of the ctypes type of a shim
+        if ctype is None:
+            return ir.VoidType()
+        elif ctype is ctypes.c_double:
+            return ir.DoubleType()
+        return ir.IntType(8 * ctypes.sizeof(ctype))
+
+    def _type(self, opcode):
+        # LLVM type of the uC type of opcode, e.g. store_float -> double
+        _parts = opcode.split("_")
+        if len(_parts) < 2 or _parts[1] not in TYPES:
+            raise LoweringError("No lowering of %s" % opcode)
+        return TYPES[_parts[1]]
+
+    def _lower_global(self, op):
+        opcode, modifier = self._extract_operation(op[0])
+        _value = op[2] if len(op) == 3 else None
+        _name = "g" + op[1][1:]
+        if opcode == "global_string":
+            # printed by index, and copied as an array of chars
+            _type = ir.ArrayType(TYPES["char"], len(_value))
+            _variable = ir.GlobalVariable(self.module, _type, _name)
+            _variable.initializer = ir.Constant(_type, [ord(c) for c in _value])
+            _variable.global_constant = True
+            self.variables[op[1]] = (_variable, TYPES["char"], "string")
+            self.strings[op[1]] = len(self.texts)
+            self.texts.append(_value)
+            return
+        _base = self._type(opcode)
+        _dim, _ref = self._extract_size(modifier)
+        if _ref > 1 or (_ref and self._is_array(modifier)):
+            raise LoweringError("No lowering of %s" % op[0])
+        elif self._is_array(modifier):
+            _type = ir.ArrayType(_base, _dim)
+            _initializer = ir.Constant(_type, None)
+            if _value is not None:
+                if any(isinstance(item, list) for item in _value):
+                    _value = [item for sublist in _value for item in sublist]
+                _value = [self._constant(_base, item) for item in _value[:_dim]]
+                _value += [0] * (_dim - len(_value))
+                _initializer = ir.Constant(_type, _value)
+            _kind = "array"
+        elif _ref:
+            _type = _base.as_pointer()
+            _initializer = ir.Constant(_type, None)
+            _kind = "pointer"
+        else:
+            _type = _base
+            _initializer = ir.Constant(_type, self._constant(_base, _value or 0))
+            _kind = "scalar"
+        _variable = ir.GlobalVariable(self.module, _type, _name)
+        _variable.initializer = _initializer
+        self.variables[op[1]] = (_variable, _base, _kind)
+
+    def _constant(self, base, value):
+        # Python value of a constant of the uC program in the LLVM type
+        if base == TYPES["char"] and isinstance(value, str):
+            return ord(value)
+        elif base == TYPES["float"]:
+            return float(value)
+        return value
+
+    def _lower_signatures(self, bodies):
+        # The return type of a function is the type of its return_*, and
+        # the type of the parameters the type of the param_* before its
+        # calls, that must agree in all the calls.
+        _returns = {}
+        _params = {}
+        for _name, _body in bodies.items():
+            _pending = []
+            for op in _body:
+                if op[0].startswith("return"):
+                    if op[0] == "return_void":
+                        _type = ir.VoidType()
+                    else:
+                        _type = self._type(op[0])
+                    if _returns.setdefault(_name, _type) != _type:
+                        raise LoweringError("Different return types in %s" % _name)
+                elif op[0].startswith("param"):
+                    _type = self._type(op[0])
+                    _pending.append(_type.as_pointer() if "*" in op[0] else _type)
+                elif op[0] == "call":
+                    if op[1] not in bodies:
+                        raise LoweringError("Call through a pointer to function")
+                    if _params.setdefault(op[1], _pending) != _pending:
+                        raise LoweringError("Different parameters in %s" % op[1])
+                    _pending = []
+        for _name in bodies:
+            _type = ir.FunctionType(
+                _returns.get(_name, ir.VoidType()), _params.get(_name, [])
+            )
+            self.signatures[_name] = ir.Function(
+                self.module, _type, name="uc_" + _name[1:]
+            )
+
+    def _unify(self, name, type):
+        # Set (or check) the type of a register
+        if name.startswith("@"):
+            return
+        if self.kinds.setdefault(name, type) != type:
+            raise LoweringError("Register %s used with different types" % name)
+
+    def _infer(self, op):
+        # Infer the types of the registers of one instruction
+        opcode, modifier = self._extract_operation(op[0])
+        if opcode == "cbranch":
+            self._unify(op[1], TYPES["bool"])
+            return
+        elif opcode == "call":
+            _type = self.signatures[op[1]].function_type.return_type
+            if _type != ir.VoidType():
+                self._unify(op[2], _type)
+            return
+        elif opcode == "sitofp":
+            self._unify(op[1], TYPES["int"])
+            self._unify(op[2], TYPES["float"])
+            return
+        elif opcode == "fptosi":
+            self._unify(op[1], TYPES["float"])
+            self._unify(op[2], TYPES["int"])
+            return
+        elif opcode in {"jump", "print_string", "return_void"}:
+            return
+
+        # the opcodes without a run_* method (that the interpreter runs as
+        # a warning) are not lowered
+        _kind = opcode.split("_")[0]
+        _scalar = not self._is_array(modifier) and _kind == "alloc"
+        _suffix = "_" if modifier and not _scalar else ""
+        if not hasattr(self, "run_" + opcode + _suffix):
+            raise LoweringError("No lowering of %s" % op[0])
+        _base = self._type(opcode)
+        _pointer = _base.as_pointer()
+        _dim, _ref = self._extract_size(modifier)
+        if _ref > 1 or (_ref and self._is_array(modifier)):
+            raise LoweringError("No lowering of %s" % op[0])
+
+        if _kind == "alloc" and self._is_array(modifier):
+            self._unify(op[1], _pointer)
+            self.local_arrays[op[1]] = (_base, _dim)
+        elif _kind == "alloc":
+            self._unify(op[1], _pointer if _ref else _base)
+        elif _kind == "literal":
+            self._unify(op[2], _base)
+        elif _kind in {"load", "store"} and self._is_array(modifier):
+            # copy of the array (or string) op[1] to the array op[2]
+            self._unify(op[1], _pointer)
+            self._unify(op[2], _pointer)
+            if _kind == "load":
+                self.local_arrays[op[2]] = (_base, _dim)
+        elif _kind == "load":
+            self._unify(op[1], _pointer if _ref else _base)
+            self._unify(op[2], _base)
+        elif _kind == "store":
+            self._unify(op[1], _base)
+            self._unify(op[2], _pointer if _ref else _base)
+        elif _kind == "elem":
+            self._unify(op[1], _pointer)
+            self._unify(op[2], TYPES["int"])
+            self._unify(op[3], _pointer)
+        elif _kind == "get":
+            self._unify(op[2], _pointer)
+        elif _kind == "param":
+            self._unify(op[1], _pointer if _ref else _base)
+        elif _kind in {"read", "print", "return"}:
+            if len(op) > 1:
+                self._unify(op[1], _base)
+        elif _kind in ARITHMETIC:
+            for _name in op[1:]:
+                self._unify(_name, _base)
+        elif _kind in COMPARISONS:
+            self._unify(op[1], _base)
+            self._unify(op[2], _base)
+            self._unify(op[3], TYPES["bool"])
+        elif _kind in {"and", "or", "not"}:
+            for _name in op[1:]:
+                self._unify(_name, TYPES["bool"])
+        else:
+            raise LoweringError("No lowering of %s" % op[0])
+
+    def _lower_function(self, name, body):
+        function = self.signatures[name]
+        self.kinds = {}
+        self.local_arrays = {}
+        self.pending = []
+        for op in body:
+            if not op[0].isdigit():
+                self._infer(op)
+        for i, _type in enumerate(function.function_type.args):
+            self._unify("%" + str(i), _type)
+
+        # the slots of the registers & the arrays are allocated in the entry
+        # block, the arrays filled with zeros as a new frame in the memory
+        _entry = function.append_basic_block("entry")
+        self.builder = ir.IRBuilder(_entry)
+        self.slots = {}
+        for _register, _type in sorted(self.kinds.items()):
+            self.slots[_register] = self.builder.alloca(_type, name=_register[1:])
+        for _register, (_base, _size) in sorted(self.local_arrays.items()):
+            _type = ir.ArrayType(_base, _size)
+            _array = self.builder.alloca(_type, name="array" + _register[1:])
+            self.builder.store(ir.Constant(_type, None), _array)
+            _zero = ir.Constant(INDEX, 0)
+            _first = self.builder.gep(_array, [_zero, _zero], inbounds=True)
+            self.builder.store(_first, self.slots[_register])
+        for i, _argument in enumerate(function.args):
+            self.builder.store(_argument, self.slots["%" + str(i)])
+        self._enter_frame()
+        _return = "%" + str(len(function.args))
+        if name != "@main" and _return in self.kinds:
+            # the return register starts with 0
+            self._set(_return, ir.Constant(self.kinds[_return], None))
+
+        self.labels = {}
+        for op in body:
+            if op[0].isdigit():
+                self.labels["%" + op[0]] = function.append_basic_block(op[0])
+        for op in body:
+            if op[0].isdigit():
+                if not self.builder.block.is_terminated:
+                    self.builder.branch(self.labels["%" + op[0]])
+                self.builder.position_at_end(self.labels["%" + op[0]])
+            elif not op[0].startswith("global"):
+                self._lower_instruction(op)
+                if self.builder.block.is_terminated:
+                    # the instructions after a jump, before a label, are dead
+                    self.builder.position_at_end(function.append_basic_block())
+        if not self.builder.block.is_terminated:
+            self._return_zero()
+
+    def _enter_frame(self):
+        # Count the bytes of the frame in the native stack, and stop the
+        # program before a deep recursion overflows the stack of the host
+        # (each return takes them back, see _return)
+        _elements = len(self.slots) + sum(
+            _size for _base, _size in self.local_arrays.values()
+        )
+        self.frame_size = FRAME_OVERHEAD + 8 * _elements
+        _size = ir.Constant(TYPES["int"], self.frame_size)
+        _depth = self.builder.add(self.builder.load(self.depth), _size)
+        self.builder.store(_depth, self.depth)
+        _limit = ir.Constant(TYPES["int"], NATIVE_STACK)
+        _deep = self.builder.icmp_signed(">", _depth, _limit)
+        with self.builder.if_then(_deep, likely=False):
+            self._call_shim("stack_overflow", [], check=False)
+            self._return_zero()
+
+    def _return(self, value=None):
+        # Return from the current function, leaving its frame
+        _size = ir.Constant(TYPES["int"], self.frame_size)
+        _depth = self.builder.sub(self.builder.load(self.depth), _size)
+        self.builder.store(_depth, self.depth)
+        if value is None:
+            self.builder.ret_void()
+        else:
+            self.builder.ret(value)
+
+    def _get(self, name):
+        # Value of a register or global
+        if not name.startswith("@"):
+            return self.builder.load(self.slots[name])
+        _variable, _base, _kind = self.variables[name]
+        if _kind in {"scalar", "pointer"}:
+            return self.builder.load(_variable)
+        _zero = ir.Constant(INDEX, 0)
+        return self.builder.gep(_variable, [_zero, _zero], inbounds=True)
+
+    def _set(self, name, value):
+        if not name.startswith("@"):
+            self.builder.store(value, self.slots[name])
+            return
+        _variable, _base, _kind = self.variables[name]
+        if _kind not in {"scalar", "pointer"}:
+            raise LoweringError("Store to the array %s" % name)
+        self.builder.store(value, _variable)
+
+    def _pointer(self, name):
+        # Pointer to a register or global (get_*_*): the address of an
+        # array is its value, as in the interpreter.
+        if name in self.signatures:
+            raise LoweringError("Pointer to function %s" % name)
+        elif name.startswith("@"):
+            _variable, _base, _kind = self.variables[name]
+            if _kind in {"scalar", "pointer"}:
+                return _variable
+        elif name not in self.local_arrays:
+            return self.slots[name]
+        return self._get(name)
+
+    def _call(self, function, args):
+        # Call a shim or a function of the program, and return from the
+        # current function if the program was stopped by a shim
+        _result = self.builder.call(function, args)
+        _stopped = self.builder.icmp_signed(
+            "!=", self.builder.load(self.stop), ir.Constant(ir.IntType(32), 0)
+        )
+        with self.builder.if_then(_stopped, likely=False):
+            self._return_zero()
+        return _result
+
+    def _call_shim(self, name, args, check=True):
+        # Call a runtime shim with the key of the engine, and return if
+        # the program was stopped (with check, else the caller does)
+        _args = [self.builder.load(self.context)] + args
+        if check:
+            return self._call(self.shims[name], _args)
+        return self.builder.call(self.shims[name], _args)
+
+    def _return_zero(self):
+        # Return the zero of the type of the current function
+        _type = self.builder.function.function_type.return_type
+        if _type == ir.VoidType():
+            self._return()
+        else:
+            self._return(ir.Constant(_type, None))
+
+    def _copy(self, dim, source, target):
+        # Copy dim elements of the array (or string) source to target. A
+        # string shorter than the array is copied up to its length.
+        if source in self.strings:
+            dim = min(dim, len(self.texts[self.strings[source]]))
+        _source = self._get(source)
+        _type = ir.ArrayType(_source.type.pointee, dim).as_pointer()
+        _value = self.builder.load(self.builder.bitcast(_source, _type))
+        self.builder.store(_value, self.builder.bitcast(self._get(target), _type))
+
+    def _lower_instruction(self, op):
+        opcode, modifier = self._extract_operation(op[0])
+        _kind = opcode.split("_")[0]
+        builder = self.builder
+        if opcode == "jump":
+            builder.branch(self.labels[op[1]])
+        elif opcode == "cbranch":
+            _test = self._get(op[1])
+            builder.cbranch(_test, self.labels[op[2]], self.labels[op[3]])
+        elif opcode == "call":
+            _result = self._call(self.signatures[op[1]], self.pending)
+            self.pending = []
+            if _result.type != ir.VoidType():
+                self._set(op[2], _result)
+        elif _kind == "param":
+            # the value passed is the value of the register at the call
+            self.pending.append(self._get(op[1]))
+        elif _kind == "return":
+            self._return(self._get(op[1]) if len(op) > 1 else None)
+        elif opcode == "print_string":
+            if op[1] not in self.strings:
+                raise LoweringError("No lowering of %s of %s" % (op[0], op[1]))
+            _index = ir.Constant(TYPES["int"], self.strings[op[1]])
+            self._call_shim("print_string", [_index])
+        elif opcode == "print_bool":
+            _value = builder.zext(self._get(op[1]), ir.IntType(32))
+            self._call_shim("print_bool", [_value])
+        elif _kind == "print":
+            self._call_shim(opcode, [self._get(op[1])])
+        elif _kind == "read":
+            self._set(op[1], self._call_shim(opcode, []))
+        elif opcode == "sitofp":
+            self._set(op[2], builder.sitofp(self._get(op[1]), TYPES["float"]))
+        elif opcode == "fptosi":
+            self._set(op[2], builder.fptosi(self._get(op[1]), TYPES["int"]))
+        elif _kind == "literal":
+            _type = self._type(opcode)
+            self._set(op[2], ir.Constant(_type, self._constant(_type, op[1])))
+        else:
+            self._lower_operation(op, opcode, modifier)
+
+    def _lower_operation(self, op, opcode, modifier):
+        # Memory, arithmetic & logical instructions
+        builder = self.builder
+        _kind = opcode.split("_")[0]
+        _dim, _ref = self._extract_size(modifier)
+        if _kind == "alloc" and self._is_array(modifier):
+            _value = self._get(op[1])
+            _type = ir.ArrayType(_value.type.pointee, _dim)
+            builder.store(
+                ir.Constant(_type, None), builder.bitcast(_value, _type.as_pointer())
+            )
+        elif _kind == "alloc":
+            self._set(op[1], ir.Constant(self.kinds[op[1]], None))
+        elif _kind in {"load", "store"} and self._is_array(modifier):
+            self._copy(_dim, op[1], op[2])
+        elif _kind == "load" and _ref:
+            self._set(op[2], builder.load(self._get(op[1])))
+        elif _kind == "store" and _ref:
+            builder.store(self._get(op[1]), self._get(op[2]))
+        elif _kind in {"load", "store"}:
+            self._set(op[2], self._get(op[1]))
+        elif _kind == "elem":
+            _index = self._get(op[2])
+            self._set(op[3], builder.gep(self._get(op[1]), [_index], inbounds=True))
+        elif _kind == "get":
+            self._set(op[2], self._pointer(op[1]))
+        elif _kind in ARITHMETIC:
+            self._set(op[3], self._arithmetic(_kind, opcode, op))
+        elif _kind in COMPARISONS:
+            _left = self._get(op[1])
+            _right = self._get(op[2])
+            if opcode.endswith("float") and _kind == "ne":
+                _value = builder.fcmp_unordered("!=", _left, _right)
+            elif opcode.endswith("float"):
+                _value = builder.fcmp_ordered(COMPARISONS[_kind], _left, _right)
+            else:
+                _value = builder.icmp_signed(COMPARISONS[_kind], _left, _right)
+            self._set(op[3], _value)
+        elif _kind == "and":
+            self._set(op[3], builder.and_(self._get(op[1]), self._get(op[2])))
+        elif _kind == "or":
+            self._set(op[3], builder.or_(self._get(op[1]), self._get(op[2])))
+        elif _kind == "not":
+            self._set(op[2], builder.not_(self._get(op[1])))
+        else:
+            raise LoweringError("No lowering of %s" % op[0])
+
+    def _arithmetic(self, kind, opcode, op):
+        builder = self.builder
+        _left = self._get(op[1])
+        _right = self._get(op[2])
+        _float = opcode.endswith("float")
+        if kind in {"div", "mod"}:
+            # a division by zero ends the program, as in the interpreter
+            _zero = ir.Constant(_right.type, None)
+            if _float:
+                _test = builder.fcmp_ordered("==", _right, _zero)
+            else:
+                _test = builder.icmp_signed("==", _right, _zero)
+            with builder.if_then(_test, likely=False):
+                _flag = ir.Constant(ir.IntType(32), int(_float))
+                self._call_shim("zero_division", [_flag], check=False)
+                self._return_zero()
+        if _float:
+            _operation = {
+                "add": builder.fadd,
+                "sub": builder.fsub,
+                "mul": builder.fmul,
+                "div": builder.fdiv,
+            }[kind]
+            return _operation(_left, _right)
+        elif kind in {"add", "sub", "mul"}:
+            _result = getattr(builder, "s" + kind + "_with_overflow")(_left, _right)
+            with builder.if_then(builder.extract_value(_result, 1), likely=False):
+                self._call_shim("overflow", [], check=False)
+                self._return_zero()
+            return builder.extract_value(_result, 0)
+
+        # sdiv & srem round toward zero, Python's // & % toward -infinity:
+        # when the remainder & the divisor have different signs, adjust.
+        _quotient = builder.sdiv(_left, _right)
+        _remainder = builder.srem(_left, _right)
+        _zero = ir.Constant(_right.type, 0)
+        _adjust = builder.and_(
+            builder.icmp_signed("!=", _remainder, _zero),
+            builder.icmp_signed("<", builder.xor(_remainder, _right), _zero),
+        )
+        if kind == "div":
+            _one = ir.Constant(_right.type, 1)
+            return builder.select(_adjust, builder.sub(_quotient, _one), _quotient)
+        return builder.select(_adjust, builder.add(_remainder, _right), _remainder)
@@ -0,0 +1,157 @@
+# ---------------------------------------------------------------------------------
+# uc: uc_memo.py
+#
+# MemoTable class: results of the calls of the pure functions of the uC
+#                  intermediate representation, cached by the interpreter
+#                  (see uc_interpreter.py)
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+import math
+from collections import OrderedDict
+
+# Maximum number of results kept for each function
+MEMO_SIZE = 1 << 12
+
+# Returned by MemoTable.lookup for the arguments not in the table
+MISSING = object()
+
+# Instructions that a pure function can't have: I/O, addresses & arrays
+IMPURE = {"print", "read", "get", "elem"}
+
+
+class MemoTable(object):
+    """
+    The results of the calls of a pure function, by the values of its
+    arguments, in a table of at most size entries, the least recently
+    used dropped first.  It counts the calls found in the table (hits)
+    and the ones not found (misses).  With float arguments, 0.0 & -0.0
+    are different keys, since the function may tell them apart.
+    """
+
+    def __init__(self, name, floats=False, size=MEMO_SIZE):
+        self.name = name  # Name of the function (e.g. '@fib')
+        self.floats = floats  # Some argument is a float
+        self.size = size
+        self.entries = OrderedDict()  # Arguments -> result, oldest first
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, params):
+        if self.floats:
+            return tuple(
+                (_val, math.copysign(1.0, _val)) if isinstance(_val, float) else _val
+                for _val in params
+            )
+        return tuple(params)
+
+    def lookup(self, key):
+        _value = self.entries.get(key, MISSING)
+        if _value is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return _value
+
+    def store(self, key, value):
+        self.entries[key] = value
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def describe(self):
+        return "%-24s %8d %8d %6d" % (
+            self.name,
+            self.hits,
+            self.misses,
+            len(self.entries),
+        )
+
+
+def find_pure(vm, ircode):
+    """
+    Find the pure functions of the intermediate code whose results can
+    be cached: a dictionary of the entry pc -> MemoTable.  A function is
+    pure when its result depends on its arguments only, and it has no
+    effect but the result:
+
+        - it returns a value, and its address is never taken
+        - it has no I/O, and no arrays or pointers (no modifiers, elem
+          or get), so its arguments are all scalars
+        - it reads only the global vars that are never written, and
+          writes none
+        - it calls only pure functions, directly
+
+    A function is pure unless proved otherwise, so the recursive ones can
+    be pure too.
+    """
+    _written = set(vm.arrays)  # Globals that may change while running
+    _floats = set()  # Functions with float arguments
+    _pending = False
+    for op in ircode:
+        _kind = op[0].split("_")[0]
+        if _kind == "store" and str(op[-1]).startswith("@"):
+            _written.add(op[-1])
+        elif _kind in {"read", "get"} and str(op[1]).startswith("@"):
+            _written.add(op[1])
+        elif op[0] == "param_float":
+            _pending = True
+        elif op[0] == "call":
+            if _pending:
+                _floats.add(op[1])
+            _pending = False
+
+    _calls = {}  # Name of pure function -> names of its callees
+    _values = set()  # Functions that return a value
+    _entries = sorted(vm.functions) + [len(ircode)]
+    for _entry, _end in zip(_entries, _entries[1:]):
+        _name = vm.functions[_entry].name
+        _callees = _function_calls(vm, ircode, _entry + 1, _end, _written)
+        if _callees is not None and _name != "@main" and _name not in _written:
+            _calls[_name] = _callees
+        if any(ircode[pc][0].startswith("return_") for pc in range(_entry, _end)):
+            if ("return_void",) not in ircode[_entry:_end]:
+                _values.add(_name)
+
+    # a function that calls one not pure is not pure
+    _changed = True
+    while _changed:
+        _changed = False
+        for _name, _callees in list(_calls.items()):
+            if not _callees <= _calls.keys():
+                del _calls[_name]
+                _changed = True
+
+    memos = {}
+    for _entry, _layout in vm.functions.items():
+        if _layout.name in _calls and _layout.name in _values:
+            memos[_entry] = MemoTable(_layout.name, _layout.name in _floats)
+    return memos
+
+
+def _function_calls(vm, ircode, pc, end, written):
+    # The names of the functions called by the instructions from pc to
+    # end, or None if they do anything but compute with scalars
+    _callees = set()
+    for op in ircode[pc:end]:
+        if op[0].isdigit():
+            continue
+        opcode, modifier = vm._extract_operation(op[0])
+        if modifier or opcode.split("_")[0] in IMPURE:
+            return None
+        if opcode == "call":
+            if not vm._is_function(op[1]):
+                # a call through a pointer
+                return None
+            _callees.add(op[1])
+            _operands = op[2:]
+        else:
+            _operands = op[1:]
+        for _name in _operands:
+            if isinstance(_name, str) and _name in written:
+                return None
+    return _callees
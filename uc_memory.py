@@ -0,0 +1,293 @@
+# ---------------------------------------------------------------------------------
+# uc: uc_memory.py
+#
+# Memory class: the memory model used by the interpreter of the uC intermediate
+#               representation (see uc_interpreter.py)
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+from array import array, typecodes
+
+# An address is a plain integer: the high bits select the segment and the
+# low bits are the index inside the segment. The segment 0 are the cells.
+SEGMENT_BITS = 32
+INDEX_MASK = (1 << SEGMENT_BITS) - 1
+
+CELLS, INT, FLOAT, CHAR, BOOL = range(5)
+
+# Typecode of the buffer used by each typed segment. Chars are stored as
+# unicode code units, so a char of uC is still a str of length 1. Bools
+# are stored as bytes, and loaded as bools (see Memory.load).
+TYPECODES = {
+    INT: "q",
+    FLOAT: "d",
+    CHAR: "w" if "w" in typecodes else "u",
+    BOOL: "b",
+}
+
+# The typed segments are split in pages, that are only allocated (filled
+# with zeros) when they are first written.
+PAGE_BITS = 12
+PAGE_SIZE = 1 << PAGE_BITS
+PAGE_MASK = PAGE_SIZE - 1
+
+# Default maximum number of cells (global vars + frames of the stack)
+DEFAULT_STACK_LIMIT = 1 << 20
+
+# Segment of the arrays of each uC type. Arrays of pointers are stored as
+# ints.
+KINDS = {"int": INT, "float": FLOAT, "char": CHAR, "bool": BOOL}
+
+# uC type of the arrays of each segment
+NAMES = {INT: "int", FLOAT: "float", CHAR: "char", BOOL: "bool"}
+
+# First address of the segment of the bools, the last one
+BOOLS = BOOL << SEGMENT_BITS
+
+
+class StackOverflow(Exception):
+    """ Raised when the frames of the program exceed the stack limit. """
+
+    pass
+
+
+class OutOfRange(Exception):
+    """
+    Raised when a value doesn't fit in an element of an array, e.g. an
+    int of more than 64 bits (the vars & registers have no limit).
+    """
+
+    pass
+
+
+class Memory(object):
+    """
+    Memory of the interpreter.  Scalars (global vars, and the registers
+    of the frames) are kept in a list of Python objects, the cells, since
+    they are read & written by almost every instruction.  The cells grow
+    as a stack: push(size) reserves the cells of a new frame, up to the
+    stack limit.  Arrays are kept in compact typed buffers, one per type,
+    and are handled by address:
+
+        address = memory.alloc(INT, 100)
+        memory.store(address + 3, 42)
+        memory.load(address + 3)
+
+    The typed buffers are paged: alloc only moves the top of the segment
+    and a page is filled with zeros the first time it is written, so an
+    array costs nothing until touched.  A value that doesn't fit in its
+    array raises OutOfRange.  Both the cells and the arrays are
+    allocated as a stack: mark() returns the current tops and release(mark)
+    frees everything allocated after it (e.g. the frame of a callee).
+    """
+
+    def __init__(self, stack_limit=DEFAULT_STACK_LIMIT):
+        self.cells = []
+        self.stack_limit = stack_limit
+        self.pages = {}  # Dictionary of page number (address >> PAGE_BITS) -> page
+        # Number of elements allocated in each segment
+        self.tops = [0] * (len(TYPECODES) + 1)
+        self.zeros = {}  # A page filled with zeros for each typed segment
+        for _segment, _typecode in TYPECODES.items():
+            _page = array(_typecode)
+            _page.frombytes(bytes(PAGE_SIZE * _page.itemsize))
+            self.zeros[_segment] = _page
+
+    #
+    # Allocation
+    #
+    def push(self, size):
+        # Reserve size cells on top of the stack
+        _address = len(self.cells)
+        if _address + size > self.stack_limit:
+            raise StackOverflow(
+                "Stack overflow: more than %d cells in use." % self.stack_limit
+            )
+        self.cells.extend(size * [None])
+        return _address
+
+    def alloc(self, segment, size):
+        # Alloc size zero-filled elements in the buffer of the segment
+        _index = self.tops[segment]
+        self.tops[segment] += size
+        _address = (segment << SEGMENT_BITS) | _index
+        # only the page of the top may have been used before (see release)
+        self.clear(_address, min(size, PAGE_SIZE - (_index & PAGE_MASK)))
+        return _address
+
+    def mark(self):
+        return (len(self.cells), tuple(self.tops))
+
+    def release(self, mark):
+        _top, _tops = mark
+        del self.cells[_top:]
+        for _segment in TYPECODES:
+            # drop the pages that are above the new top of the segment
+            _base = _segment << SEGMENT_BITS
+            _first = (_base + _tops[_segment] + PAGE_MASK) >> PAGE_BITS
+            _last = (_base + self.tops[_segment] + PAGE_MASK) >> PAGE_BITS
+            for _page in range(_first, _last):
+                self.pages.pop(_page, None)
+            self.tops[_segment] = _tops[_segment]
+
+    def snapshot(self):
+        # Copy of the contents of the memory, to be restored later
+        _pages = {_number: _page[:] for _number, _page in self.pages.items()}
+        return (self.cells[:], _pages, self.tops[:])
+
+    def restore(self, snapshot):
+        # Go back to the contents of a snapshot, which is kept unchanged.
+        # The cells are the same list, since the users keep a reference.
+        _cells, _pages, _tops = snapshot
+        self.cells[:] = _cells
+        self.pages = {_number: _page[:] for _number, _page in _pages.items()}
+        self.tops[:] = _tops
+
+    #
+    # Scalar access
+    #
+    def load(self, address):
+        if address <= INDEX_MASK:
+            return self.cells[address]
+        _page = self.pages.get(address >> PAGE_BITS)
+        if _page is None:
+            _page = self.zeros[address >> SEGMENT_BITS]
+        if address >= BOOLS:
+            return _page[address & PAGE_MASK] != 0
+        return _page[address & PAGE_MASK]
+
+    def store(self, address, value):
+        if address <= INDEX_MASK:
+            self.cells[address] = value
+            return
+        try:
+            self._page(address)[address & PAGE_MASK] = value
+        except OverflowError:
+            raise self._out_of_range(address, value)
+
+    def _out_of_range(self, address, value):
+        return OutOfRange(
+            "Value out of range for an array of %s: %r"
+            % (NAMES[address >> SEGMENT_BITS], value)
+        )
+
+    #
+    # Bulk access
+    #
+    def _page(self, address):
+        _page = self.pages.get(address >> PAGE_BITS)
+        if _page is None:
+            _page = self.zeros[address >> SEGMENT_BITS][:]
+            self.pages[address >> PAGE_BITS] = _page
+        return _page
+
+    def _chunks(self, address, size):
+        # Split the region in pieces that do not cross a page:
+        # (address of the piece, start & end inside the page)
+        _end = address + size
+        while address < _end:
+            _start = address & PAGE_MASK
+            _count = min(PAGE_SIZE - _start, _end - address)
+            yield (address, _start, _start + _count)
+            address += _count
+
+    def read(self, address, size):
+        _start = address & PAGE_MASK
+        if _start + size <= PAGE_SIZE:
+            # the region is in a single page, a slice is enough
+            _page = self.pages.get(address >> PAGE_BITS)
+            if _page is None:
+                _page = self.zeros[address >> SEGMENT_BITS]
+            return _page[_start : _start + size]
+        _result = array(TYPECODES[address >> SEGMENT_BITS])
+        _zeros = self.zeros[address >> SEGMENT_BITS]
+        for _address, _start, _end in self._chunks(address, size):
+            _page = self.pages.get(_address >> PAGE_BITS, _zeros)
+            _result += _page[_start:_end]
+        return _result
+
+    def write(self, address, values):
+        _typecode = TYPECODES[address >> SEGMENT_BITS]
+        if not isinstance(values, array) or values.typecode != _typecode:
+            values = list(values)
+            try:
+                values = array(_typecode, values)
+            except OverflowError:
+                for _value in values:
+                    # the first value that doesn't fit
+                    try:
+                        array(_typecode, [_value])
+                    except OverflowError:
+                        raise self._out_of_range(address, _value)
+                raise
+        _start = address & PAGE_MASK
+        if _start + len(values) <= PAGE_SIZE:
+            self._page(address)[_start : _start + len(values)] = values
+            return
+        _offset = 0
+        for _address, _start, _end in self._chunks(address, len(values)):
+            _count = _end - _start
+            self._page(_address)[_start:_end] = values[_offset : _offset + _count]
+            _offset += _count
+
+    def copy(self, target, source, size):
+        # memmove of size elements, the slice is a copy so the regions
+        # may overlap.
+        _from = source & PAGE_MASK
+        _to = target & PAGE_MASK
+        if _from + size <= PAGE_SIZE and _to + size <= PAGE_SIZE:
+            # both regions are in a single page: a slice of a page to a
+            # slice of the other
+            _source = self.pages.get(source >> PAGE_BITS)
+            if _source is None:
+                _source = self.zeros[source >> SEGMENT_BITS]
+            self._page(target)[_to : _to + size] = _source[_from : _from + size]
+        else:
+            self.write(target, self.read(source, size))
+
+    def clear(self, address, size):
+        # Zero-fill size elements. The pages not allocated yet are
+        # already zero, so they are not touched.
+        _zeros = self.zeros.get(address >> SEGMENT_BITS)
+        for _address, _start, _end in self._chunks(address, size):
+            _page = self.pages.get(_address >> PAGE_BITS)
+            if _page is not None:
+                _page[_start:_end] = _zeros[: _end - _start]
+
+
+class ConstantPool(object):
+    """
+    Read-only pool of the string constants of a program, in the memory.
+    Each distinct text is stored once, in a cell of its own, and all the
+    global strings with that text are the address of that cell.  The
+    chars of a text, as a typed buffer, are built the first time it is
+    copied to a char array, and then just sliced:
+
+        address = pool.intern("Enter a number: ")
+        memory.write(array_address, pool.chars(text)[:size])
+    """
+
+    def __init__(self, memory):
+        self.memory = memory
+        self.addresses = {}  # Dictionary of text -> address of its cell
+        self.buffers = {}  # Dictionary of text -> typed buffer of its chars
+
+    def intern(self, text):
+        _address = self.addresses.get(text)
+        if _address is None:
+            _address = self.addresses[text] = self.memory.push(1)
+            self.memory.cells[_address] = text
+        return _address
+
+    def chars(self, text):
+        _chars = self.buffers.get(text)
+        if _chars is None:
+            _chars = array(TYPECODES[CHAR], text)
+            if text in self.addresses:
+                # only the constants are kept, not the texts read
+                self.buffers[text] = _chars
+        return _chars
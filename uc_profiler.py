@@ -0,0 +1,292 @@
+# ---------------------------------------------------------------------------------
+# uc: uc_profiler.py
+#
+# Profiler class: runs the uC intermediate representation in the interpreter,
+#                 recording where the time goes (see uc_interpreter.py)
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+import json
+import time
+from uc_interpreter import Interpreter
+from uc_memory import BOOL, CHAR, DEFAULT_STACK_LIMIT, FLOAT, INT, TYPECODES
+
+
+class FunctionStats(object):
+    """
+    Calls of a function: the number of calls, the inclusive time (with
+    the callees, counted once for the recursive calls) & the exclusive
+    time (without the callees).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.inclusive = 0.0
+        self.exclusive = 0.0
+        self.active = 0  # Number of calls in the stack (recursion)
+
+
+class Profiler(Interpreter):
+    """
+    Interpreter that profiles the program while it runs.  It records:
+
+        - the execution count & cumulative time of each opcode (the
+          superinstructions and the vectorized loops count as one)
+        - the calls, inclusive & exclusive time of each function
+        - the hits of each label (e.g. the iterations of a loop)
+        - the peak number of cells & array elements in use
+
+    The profiled execution loop replaces Interpreter._dispatch, so the
+    plain interpreter pays nothing for it.  The counters are kept by pc
+    and grouped only when the report is built.  A call or a return is
+    seen as a change of the depth of the stack after a handler.
+
+    Instructions for use:
+        profiler = Profiler()
+        try:
+            profiler.run(ircode)
+        finally:
+            profiler.write_report("prog.profile.json")
+            profiler.write_folded("prog.folded")
+
+    The folded file has a line per call stack with its exclusive time in
+    microseconds (e.g. "main;fat;fat 1234"), the input of flamegraph.pl
+    and speedscope.
+
+    Given the source line of each instruction (see uc_irtext.read_coords),
+    annotate() returns the uC source annotated with the instructions run
+    by each line, and write_lines() the same profile as JSON.
+    """
+
+    def __init__(
+        self,
+        stack_limit=DEFAULT_STACK_LIMIT,
+        output=None,
+        flush="exit",
+        fuse=True,
+        vectorize=True,
+        capture=False,
+        memoize=False,
+    ):
+        super().__init__(
+            stack_limit,
+            output,
+            flush,
+            fuse,
+            vectorize,
+            capture=capture,
+            memoize=memoize,
+        )
+        self.counts = []  # Number of executions of the instruction at each pc
+        self.times = []  # Cumulative time of the instruction at each pc
+        self.calls = {}  # Dictionary of function name -> FunctionStats
+        self.folded = {}  # Dictionary of call stack -> exclusive time
+        self.peak_cells = 0
+        self.peak_elements = [0] * len(self.memory.tops)
+        self.elapsed = 0.0
+        self._shadow = []  # Calls in the stack: [stats, path, start, children]
+
+    def _dispatch(self, program):
+        clock = time.perf_counter
+        # the profile of this run only, not of the former ones
+        counts = self.counts = [0] * len(program)
+        times = self.times = [0.0] * len(program)
+        self.calls = {}
+        self.folded = {}
+        self.peak_cells = 0
+        self.peak_elements = [0] * len(self.memory.tops)
+        self._shadow = []
+        stack = self.stack
+        depth = len(stack)
+        self._sample()
+        _begin = clock()
+        self._enter(_begin)
+        pc = _start = None
+        try:
+            while True:
+                pc = self.pc
+                try:
+                    handler, args = program[pc]
+                except IndexError:
+                    break
+                self.pc = pc + 1
+                counts[pc] += 1
+                _start = clock()
+                handler(*args)
+                _now = clock()
+                times[pc] += _now - _start
+                _start = None
+                if len(stack) != depth:
+                    if len(stack) > depth:
+                        self._enter(_now)
+                        self._sample()
+                    else:
+                        self._leave(_now)
+                    depth = len(stack)
+        finally:
+            # the program ends in a handler (exit) or with an error
+            _now = clock()
+            if _start is not None:
+                times[pc] += _now - _start
+            while self._shadow:
+                self._leave(_now)
+            self.elapsed = _now - _begin
+
+    def _sample(self):
+        # Update the peak usage of the memory, after a call
+        self.peak_cells = max(self.peak_cells, len(self.M))
+        for _segment in TYPECODES:
+            _top = self.memory.tops[_segment]
+            if _top > self.peak_elements[_segment]:
+                self.peak_elements[_segment] = _top
+
+    def _enter(self, now):
+        # A call to the function of the current frame
+        _name = self.frame.name[1:]
+        _stats = self.calls.get(_name)
+        if _stats is None:
+            _stats = self.calls[_name] = FunctionStats(_name)
+        _stats.calls += 1
+        _stats.active += 1
+        _path = self._shadow[-1][1] + ";" + _name if self._shadow else _name
+        self._shadow.append([_stats, _path, now, 0.0])
+
+    def _leave(self, now):
+        # The return of the innermost call
+        _stats, _path, _start, _children = self._shadow.pop()
+        _inclusive = now - _start
+        _exclusive = _inclusive - _children
+        _stats.active -= 1
+        if _stats.active == 0:
+            # the time of a recursive call is already in the outermost one
+            _stats.inclusive += _inclusive
+        _stats.exclusive += _exclusive
+        self.folded[_path] = self.folded.get(_path, 0.0) + _exclusive
+        if self._shadow:
+            self._shadow[-1][3] += _inclusive
+
+    #
+    # Reports
+    #
+    def _opcode_name(self, pc):
+        # Name of the instruction at pc in the report: the opcode, with the
+        # dims of the arrays as N, or the name of the superinstruction
+        _name = getattr(self.program[pc][0], "__name__", "")
+        if _name in self.fusions or _name == "_run_vector_loop":
+            return _name[len("_run_") :]
+        op = self.code[pc]
+        if op[0].isdigit():
+            return "label"
+        opcode, modifier = self._extract_operation(op[0])
+        for _val in modifier.values():
+            opcode += "_N" if _val.isdigit() else "_" + _val
+        return opcode
+
+    def report(self):
+        """
+        Profile of the last run, as a dictionary of opcodes, functions,
+        labels & memory, ready to be dumped as JSON.  Times are in seconds.
+        """
+        _opcodes = {}
+        for pc, _count in enumerate(self.counts):
+            if _count:
+                _name = self._opcode_name(pc)
+                _entry = _opcodes.setdefault(_name, {"count": 0, "time": 0.0})
+                _entry["count"] += _count
+                _entry["time"] += self.times[pc]
+
+        # the hits of a label are the executions of its next instruction
+        _labels = {}
+        for _layout in self.functions.values():
+            for _label, _target in _layout.labels.items():
+                if _target < len(self.counts) and self.counts[_target]:
+                    _labels[_layout.name + " " + _label] = self.counts[_target]
+
+        _functions = {}
+        for _stats in self.calls.values():
+            _functions[_stats.name] = {
+                "calls": _stats.calls,
+                "inclusive": _stats.inclusive,
+                "exclusive": _stats.exclusive,
+            }
+
+        return {
+            "elapsed": self.elapsed,
+            "instructions": sum(self.counts),
+            "opcodes": dict(
+                sorted(_opcodes.items(), key=lambda item: -item[1]["time"])
+            ),
+            "functions": dict(
+                sorted(_functions.items(), key=lambda item: -item[1]["inclusive"])
+            ),
+            "labels": dict(sorted(_labels.items(), key=lambda item: -item[1])),
+            "memory": {
+                "peak_cells": self.peak_cells,
+                "peak_ints": self.peak_elements[INT],
+                "peak_floats": self.peak_elements[FLOAT],
+                "peak_chars": self.peak_elements[CHAR],
+                "peak_bools": self.peak_elements[BOOL],
+            },
+        }
+
+    def line_profile(self, lines):
+        """
+        Count & time of the instructions run, by line of the uC source.
+        lines[pc] is the source line of the instruction at pc, or None.
+        A superinstruction counts on the line of its first instruction.
+        """
+        _profile = {}
+        for pc, _count in enumerate(self.counts):
+            if _count and pc < len(lines) and lines[pc] is not None:
+                _entry = _profile.setdefault(lines[pc], {"count": 0, "time": 0.0})
+                _entry["count"] += _count
+                _entry["time"] += self.times[pc]
+        return dict(sorted(_profile.items()))
+
+    def annotate(self, source, lines):
+        """
+        The text of the uC source, with the number of instructions run on
+        each line, and its share of the instructions & time of the lines.
+        """
+        _profile = self.line_profile(lines)
+        _count = sum(_entry["count"] for _entry in _profile.values()) or 1
+        _time = sum(_entry["time"] for _entry in _profile.values()) or 1.0
+        _lines = ["%10s %7s %7s %5s" % ("count", "instr", "time", "line")]
+        for _number, _text in enumerate(source.splitlines(), 1):
+            _entry = _profile.get(_number)
+            if _entry is None:
+                _lines.append("%10s %7s %7s %5d  %s" % ("", "", "", _number, _text))
+            else:
+                _lines.append(
+                    "%10d %6.1f%% %6.1f%% %5d  %s"
+                    % (
+                        _entry["count"],
+                        100.0 * _entry["count"] / _count,
+                        100.0 * _entry["time"] / _time,
+                        _number,
+                        _text,
+                    )
+                )
+        return "\n".join(_lines) + "\n"
+
+    def write_lines(self, filename, lines):
+        # The line profile as JSON: source line -> count & time
+        with open(filename, "w") as lines_file:
+            json.dump(self.line_profile(lines), lines_file, indent=2)
+            lines_file.write("\n")
+
+    def write_report(self, filename):
+        with open(filename, "w") as report_file:
+            json.dump(self.report(), report_file, indent=2)
+            report_file.write("\n")
+
+    def write_folded(self, filename):
+        # One line per call stack, with its exclusive time in microseconds
+        with open(filename, "w") as folded_file:
+            for _path, _time in sorted(self.folded.items()):
+                folded_file.write("%s %d\n" % (_path, round(_time * 1e6)))
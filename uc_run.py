@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# ---------------------------------------------------------------------------------
+# uc: uc_run.py
+#
+# Runs a program in the uC intermediate representation, read from a .ir file
+# with one instruction tuple per line, e.g. ('literal_int', 1, '%1')
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+import re
+import sys
+from uc_binary import BinaryProgram
+from uc_debug import Tracer
+from uc_interpreter import Interpreter
+from uc_irtext import read_coords, read_ir
+from uc_limits import Limits
+from uc_llvm import LLVMEngine
+from uc_profiler import Profiler
+from uc_transpiler import Transpiler
+
+# Execution engines, selected with -engine=<name>
+ENGINES = {
+    "interpreter": Interpreter,
+    "python": Transpiler,
+    "llvm": LLVMEngine,
+}
+
+# Limits of a run, set with -max-<limit>=<value>, and the type of the value
+LIMITS = {
+    "instructions": int,
+    "time": float,
+    "memory": int,
+    "depth": int,
+}
+LIMIT = re.compile(r"-max-(%s)=([0-9.]+)$" % "|".join(LIMITS))
+
+
+def run():
+    """ Runs the command-line interpreter. """
+
+    if len(sys.argv) < 2:
+        print(
+            "Usage: ./uc_run.py <ir-file|irb-file> [-engine=interpreter|python|llvm] "
+            "[-report] [-profile] [-lines] [-memoize] [-trace=N] "
+            "[-max-<limit>=<value>]\n"
+            "  -trace=N runs the program without superinstructions or "
+            "vectorized loops"
+        )
+        sys.exit(1)
+
+    engine = "interpreter"
+    report = False
+    profile = False
+    lines = False
+    memoize = False
+    trace = 0
+    limits = {}
+
+    params = sys.argv[1:]
+    files = sys.argv[1:]
+
+    for param in params:
+        if param[0] == "-":
+            if param.startswith("-engine=") and param[8:] in ENGINES:
+                engine = param[8:]
+            elif param == "-report":
+                report = True
+            elif param == "-profile":
+                profile = True
+            elif param == "-lines":
+                profile = lines = True
+            elif param == "-memoize":
+                memoize = True
+            elif param.startswith("-trace=") and param[7:].isdigit():
+                # the last N instructions go to <file>.trace; the trace
+                # runs the plain program (see uc_hooks), so it is slower
+                trace = int(param[7:])
+            elif LIMIT.match(param):
+                # e.g. -max-instructions=1000000 or -max-time=2.5
+                name, value = LIMIT.match(param).groups()
+                limits[name] = LIMITS[name](value)
+            else:
+                print("Unknown option: %s" % param)
+                sys.exit(1)
+            files.remove(param)
+
+    # the profile, the limits, the memoized calls & the trace are only
+    # supported by the interpreter, and a run with limits counts all the
+    # instructions, so it is neither profiled nor memoized
+    used = [
+        option
+        for option, value in [
+            ("-profile", profile and not lines),
+            ("-lines", lines),
+            ("-memoize", memoize),
+            ("-trace", trace),
+            ("-max-*", limits),
+        ]
+        if value
+    ]
+    if engine != "interpreter" and used:
+        print("Option %s can't be used with -engine=%s" % (used[0], engine))
+        sys.exit(1)
+    if limits and (profile or memoize):
+        print("Option %s can't be used with -max-*" % used[0])
+        sys.exit(1)
+
+    for file in files:
+        if file[-4:] == ".irb":
+            # binary uCIR (see uc_binary), mapped in memory
+            ir_filename = file
+            ircode = BinaryProgram(file)
+        else:
+            if file[-3:] == ".ir":
+                ir_filename = file
+            else:
+                ir_filename = file + ".ir"
+            ircode = read_ir(ir_filename)
+        base = ir_filename[: ir_filename.rindex(".")]
+        if profile:
+            # the profile goes to <file>.profile.json & <file>.folded
+            vm = Profiler(memoize=memoize)
+        elif engine == "interpreter":
+            vm = Interpreter(
+                limits=Limits(**limits) if limits else None, memoize=memoize
+            )
+        else:
+            vm = ENGINES[engine]()
+        if trace:
+            tracer = Tracer(vm, trace)
+        try:
+            result = vm.run(ircode)
+        finally:
+            if report:
+                # superinstructions & loops vectorized, on stderr
+                sys.stderr.write(vm.fusion_report() + "\n")
+                sys.stderr.write(vm.vector_report() + "\n")
+                sys.stderr.write(vm.memo_report() + "\n")
+            if profile:
+                vm.write_report(base + ".profile.json")
+                vm.write_folded(base + ".folded")
+            if lines:
+                # the annotated source (<file>.uc) goes to stderr
+                coords = read_coords(base + ".ir")
+                vm.write_lines(base + ".lines.json", coords)
+                with open(base + ".uc", "r") as source_file:
+                    sys.stderr.write(vm.annotate(source_file.read(), coords))
+            if trace:
+                with open(base + ".trace", "w") as trace_file:
+                    tracer.dump(trace_file)
+        if result.error is not None:
+            sys.stderr.write(str(result.error) + "\n")
+        sys.exit(result.exit_code)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,414 @@
+# ---------------------------------------------------------------------------------
+# uc: uc_transpiler.py
+#
+# Transpiler class: runs the uC intermediate representation by translating each
+#                   function to a Python function (see uc_interpreter.py)
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+from uc_interpreter import Interpreter
+from uc_io import InputSource
+from uc_memory import DEFAULT_STACK_LIMIT, StackOverflow
+
+# Python operators of the binary & relational opcodes
+OPERATORS = {
+    "add": "+",
+    "sub": "-",
+    "mul": "*",
+    "mod": "%",
+    "lt": "<",
+    "le": "<=",
+    "gt": ">",
+    "ge": ">=",
+    "eq": "==",
+    "ne": "!=",
+    "and": "and",
+    "or": "or",
+}
+
+# Maximum number of programs kept compiled, by all the Transpilers
+CACHE_SIZE = 1 << 6
+
+# Maximum depth of the calls of the uC program (each call of the program
+# is a call of a Python function)
+RECURSION_LIMIT = 1 << 17
+
+# Prologue of the generated program: program(vm) binds the runtime (the
+# memory, the input & output of the vm) to local names of the closure of
+# the functions, and returns the function main.
+PROLOGUE = """\
+def program(vm):
+    M = vm.M
+    memory = vm.memory
+    push = memory.push
+    mark = memory.mark
+    release = memory.release
+    alloc = memory.alloc
+    clear = memory.clear
+    load = memory.load
+    store = memory.store
+    copy = vm._copy_values
+    write = vm.output.write
+    read = vm._read
+    read_int = vm.input.read_int
+    read_float = vm.input.read_float
+    read_char = vm.input.read_char
+    exit = vm._exit
+"""
+
+
+class _RecursionLimit(object):
+    # The recursion limit of the process, raised while a program runs as
+    # Python code: the first run raises it, and the last one to end puts
+    # back the original, so the runs in threads don't undo each other.
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.runs = 0  # Number of runs in progress
+        self.original = None  # Recursion limit before the first run
+
+    def __enter__(self):
+        with self.lock:
+            if self.runs == 0:
+                self.original = sys.getrecursionlimit()
+                sys.setrecursionlimit(max(self.original, self.limit))
+            self.runs += 1
+
+    def __exit__(self, *exc_info):
+        with self.lock:
+            self.runs -= 1
+            if self.runs == 0:
+                sys.setrecursionlimit(self.original)
+        return False
+
+
+_recursion_limit = _RecursionLimit(RECURSION_LIMIT)
+
+
+class Transpiler(Interpreter):
+    """
+    Runs the uC intermediate code as Python code.  Each function of the
+    program (from its define to the next define) is translated into the
+    source of a Python function, where the registers are locals and the
+    globals are cells of the memory, e.g.:
+
+        ('define', '@main')              def uc_main():
+        ('alloc_int', '%1')                  r0 = None
+        ('literal_int', 2, '%2')             r1 = r2 = r3 = None
+        ('store_int', '%2', '%1')     =>     r1 = 0
+        ('load_int', '%1', '%3')             r2 = 2
+        ('print_int', '%3')                  r1 = r2
+                                             r3 = r1
+                                             write(str(r3))
+
+    The functions with labels run as a state machine: a loop where each
+    iteration runs the basic block of the current _state, selected by a
+    binary tree of ifs, and each jump or branch just sets the next state.
+    The registers whose address is taken (get_*_*) are kept in a frame
+    in the cells of the memory, like the Interpreter does.
+
+    The whole program is compiled once with compile(), and the code object
+    is cached by the hash of the intermediate code, so the same program
+    is only translated again by a new process, or after CACHE_SIZE other
+    programs (the least recently used is dropped first).  The memory, the
+    input & output and the exit code are the same of the Interpreter.
+    """
+
+    cache = OrderedDict()  # IR hash -> code object of the program, oldest first
+    cache_lock = threading.Lock()  # The cache is shared by the threads
+
+    def __init__(
+        self, stack_limit=DEFAULT_STACK_LIMIT, output=None, flush="exit", capture=False
+    ):
+        super().__init__(stack_limit, output, flush, fuse=False, capture=capture)
+        self.source = None  # Python source of the last program translated
+        self.lines = []  # Lines of Python source generated
+        self.cells = {}  # Register of the current function -> offset in the frame
+        self.marked = False  # Whether the current function allocs in the memory
+        self.pending = []  # Parameters passed to the next call
+
+    def _load(self, ircode):
+        # The ircode is translated & compiled the first time it is loaded
+        self._load_globals(ircode)
+        _key = hashlib.sha1(repr(ircode).encode()).hexdigest()
+        with self.cache_lock:
+            self.program = self.cache.get(_key)
+            if self.program is not None:
+                self.cache.move_to_end(_key)
+        if self.program is None:
+            self.source = self._translate(ircode)
+            self.program = compile(self.source, "<uCIR %s>" % _key[:12], "exec")
+            with self.cache_lock:
+                self.cache[_key] = self.program
+                if len(self.cache) > CACHE_SIZE:
+                    self.cache.popitem(last=False)
+
+    def _start(self, stdin):
+        # Run the code object of the program, as Python code
+        self.input = InputSource(stdin)
+        _namespace = {}
+        exec(self.program, _namespace)
+        main = _namespace["program"](self)
+        try:
+            with _recursion_limit:
+                main()
+        except RecursionError:
+            raise StackOverflow("Stack overflow: more than %d calls." % RECURSION_LIMIT)
+
+    #
+    # Translation
+    #
+    def _translate(self, ircode):
+        # Python source of the program: the prologue, the functions, and a
+        # dictionary of entry pc -> function for the calls through pointers
+        self.lines = [PROLOGUE]
+        self._count_params(ircode)
+        _entries = sorted(self.functions) + [len(ircode)]
+        for _entry, _end in zip(_entries, _entries[1:]):
+            self._translate_function(ircode, self.functions[_entry], _end)
+        _functions = ", ".join(
+            "%d: %s" % (_entry, self._function_name(_layout.name))
+            for _entry, _layout in sorted(self.functions.items())
+        )
+        self._emit(1, "functions = {%s}" % _functions)
+        self._emit(1, "return %s" % self._function_name("@main"))
+        return "\n".join(self.lines) + "\n"
+
+    def _emit(self, indent, lines):
+        for _line in lines.split("\n"):
+            self.lines.append("    " * indent + _line)
+
+    def _function_name(self, name):
+        return "uc_" + name[1:]
+
+    def _ref(self, name):
+        # Python expression of a register or global var
+        if name.startswith("@"):
+            return "M[%d]" % self.globals[name]
+        if name in self.cells:
+            return "M[fp + %d]" % self.cells[name]
+        return "r" + name[1:]
+
+    def _translate_function(self, ircode, layout, end):
+        self.frame = layout
+        _arity = self.arity.get(layout.name, 0)
+        _body = ircode[layout.entry + 1 : end]
+
+        # the registers whose address is taken live in the memory cells
+        self.cells = {}
+        for op in _body:
+            if op[0].startswith("get") and op[0].endswith("*"):
+                _source = op[1]
+                if _source.startswith("%") and _source not in layout.arrays:
+                    self.cells.setdefault(_source, len(self.cells))
+        self.marked = bool(self.cells or layout.arrays)
+
+        _params = ", ".join("r%d=None" % i for i in range(_arity))
+        self._emit(1, "def %s(%s):" % (self._function_name(layout.name), _params))
+        if self.marked:
+            self._emit(2, "_mark = mark()")
+        if self.cells:
+            self._emit(2, "fp = push(%d)" % len(self.cells))
+        for _register, (_segment, _size) in layout.arrays.items():
+            _array = self._ref(_register)
+            self._emit(2, "%s = alloc(%d, %d)" % (_array, _segment, _size))
+        # the return register starts with 0 (None for main), the others
+        # are set to None, as in a new frame of the Interpreter
+        _locals = []
+        for _number, _slot in sorted(layout.numbered.items()):
+            _register = "%" + str(_number)
+            if _number < _arity:
+                if _register in self.cells:
+                    self._emit(2, "%s = r%d" % (self._ref(_register), _number))
+            elif _number == _arity:
+                _value = "None" if layout.name == "@main" else "0"
+                self._emit(2, "%s = %s" % (self._ref(_register), _value))
+            elif _register not in layout.arrays and _register not in self.cells:
+                _locals.append(self._ref(_register))
+        if _locals:
+            self._emit(2, " = ".join(_locals) + " = None")
+
+        # split the body in basic blocks: the first starts at the entry of
+        # the function and the others at the labels that are the target of
+        # a branch. A jump to the next instruction is just dropped.
+        _body = [
+            op
+            for pc, op in enumerate(_body)
+            if op[0] != "jump" or _body[pc + 1 : pc + 2] != [(op[1][1:],)]
+        ]
+        _targets = set()
+        for op in _body:
+            if op[0] == "jump":
+                _targets.add(op[1])
+            elif op[0] == "cbranch":
+                _targets.update(op[2:])
+        _blocks = [[]]
+        _states = {}
+        _terminated = False
+        for op in _body:
+            if op[0].isdigit() and "%" + op[0] not in _targets:
+                continue
+            elif op[0].isdigit():
+                if not _terminated:
+                    _blocks[-1].append("_state = %d" % len(_blocks))
+                _states["%" + op[0]] = len(_blocks)
+                _blocks.append([])
+                _terminated = False
+            elif not _terminated:
+                _blocks[-1].append(op)
+                _terminated = op[0] in {"jump", "cbranch"} or op[0].startswith(
+                    "return"
+                )
+        if not _terminated:
+            _blocks[-1].append("return None")
+
+        self.pending = []
+        if len(_blocks) == 1:
+            for op in _blocks[0]:
+                self._translate_instruction(op, _states, 2)
+        else:
+            self._emit(2, "_state = 0")
+            self._emit(2, "while True:")
+            self._dispatch(_blocks, _states, 0, len(_blocks), 3)
+        self._emit(0, "")
+
+    def _dispatch(self, blocks, states, first, last, indent):
+        # Binary tree of ifs on _state, to select the blocks first..last-1
+        if last - first == 1:
+            for op in blocks[first]:
+                self._translate_instruction(op, states, indent)
+            return
+        _middle = (first + last) // 2
+        self._emit(indent, "if _state < %d:" % _middle)
+        self._dispatch(blocks, states, first, _middle, indent + 1)
+        self._emit(indent, "else:")
+        self._dispatch(blocks, states, _middle, last, indent + 1)
+
+    def _translate_instruction(self, op, states, indent):
+        if isinstance(op, str):
+            # a line already generated (the fall through of a block)
+            self._emit(indent, op)
+            return
+        opcode, modifier = self._extract_operation(op[0])
+        if opcode == "define" or opcode.startswith("global"):
+            return
+        _kind = opcode.split("_")[0]
+        if opcode == "jump":
+            _line = "_state = %d" % states[op[1]]
+        elif opcode == "cbranch":
+            _line = "_state = %d if %s else %d" % (
+                states[op[2]],
+                self._ref(op[1]),
+                states[op[3]],
+            )
+        elif opcode == "call":
+            _params = ", ".join(self.pending)
+            self.pending = []
+            if self._is_function(op[1]):
+                _function = self._function_name(op[1])
+            else:
+                _function = "functions[%s]" % self._ref(op[1])
+            _line = "%s = %s(%s)" % (self._ref(op[2]), _function, _params)
+        elif _kind == "return":
+            _line = self._translate_return(op)
+        elif modifier:
+            _line = self._translate_modifier(op, opcode, modifier)
+        else:
+            _line = self._translate_operation(op, opcode)
+        if _line is None:
+            _line = "write(%r)" % ("Warning: No run_" + opcode + "() method\n")
+        if _line:
+            self._emit(indent, _line)
+
+    def _translate_return(self, op):
+        _value = "None" if len(op) == 1 else self._ref(op[1])
+        if self.frame.name == "@main":
+            return "return exit(%s)" % _value
+        if self.marked:
+            return "release(_mark)\nreturn %s" % _value
+        return "return %s" % _value
+
+    def _translate_modifier(self, op, opcode, modifier):
+        # Instructions on arrays & pointers: alloc, load, store & get
+        _kind = opcode.split("_")[0]
+        if not self._is_array(modifier) and _kind == "alloc":
+            # pointers are scalars
+            return self._translate_operation(op, opcode)
+        if not hasattr(self, "run_" + opcode + "_"):
+            return None
+        _dim, _ref = self._extract_size(modifier)
+        _operands = tuple(self._ref(name) for name in op[1:])
+        if _kind == "alloc":
+            return "clear(%s, %d)" % (_operands[0], _dim)
+        elif _kind == "get" and (op[1] in self.arrays or op[1] in self.frame.arrays):
+            # the address of an array is the value in its cell
+            return "%s = %s" % (_operands[1], _operands[0])
+        elif _kind == "get" and op[1].startswith("@"):
+            return "%s = %d" % (_operands[1], self.globals[op[1]])
+        elif _kind == "get":
+            return "%s = fp + %d" % (_operands[1], self.cells[op[1]])
+        elif _kind == "load" and _ref == 0:
+            return "copy(%d, %s, %s)" % (_dim, _operands[1], _operands[0])
+        elif _kind == "load" and _dim == 1 and _ref == 1:
+            return "%s = load(%s)" % (_operands[1], _operands[0])
+        elif _kind == "store" and _ref == 0:
+            return "copy(%d, %s, %s)" % (_dim, _operands[1], _operands[0])
+        elif _kind == "store" and _dim == 1 and _ref == 1:
+            return "store(%s, %s)" % (_operands[1], _operands[0])
+        elif _kind in {"load", "store"}:
+            return ""
+        return None
+
+    def _translate_operation(self, op, opcode):
+        # Scalar instructions: the Python statement or None if unknown
+        _kind, _, _type = opcode.partition("_")
+        if not hasattr(self, "run_" + opcode):
+            return None
+        elif _kind == "literal":
+            return "%s = %r" % (self._ref(op[2]), op[1])
+        _operands = tuple(self._ref(name) for name in op[1:])
+        if _kind in {"load", "store"}:
+            return "%s = %s" % (_operands[1], _operands[0])
+        elif _kind == "get":
+            # never generated without * (ref)
+            return ""
+        elif _kind == "alloc":
+            return "%s = 0" % _operands
+        elif _kind == "elem":
+            return "%s = %s + %s" % (_operands[2], _operands[0], _operands[1])
+        elif _kind == "param":
+            self.pending.append(_operands[0])
+            return ""
+        elif opcode == "print_string":
+            return "write(%s)" % _operands
+        elif _kind == "print":
+            return "write(str(%s))" % _operands
+        elif _kind == "read":
+            return "%s = read(read_%s)" % (_operands[0], _type)
+        elif opcode == "div_int":
+            return "%s = %s // %s" % (_operands[2], _operands[0], _operands[1])
+        elif opcode == "div_float":
+            return "%s = %s / %s" % (_operands[2], _operands[0], _operands[1])
+        elif _kind in OPERATORS:
+            return "%s = %s %s %s" % (
+                _operands[2],
+                _operands[0],
+                OPERATORS[_kind],
+                _operands[1],
+            )
+        elif opcode == "not_bool":
+            return "%s = not %s" % (_operands[1], _operands[0])
+        elif opcode == "sitofp":
+            return "%s = float(%s)" % (_operands[1], _operands[0])
+        elif opcode == "fptosi":
+            return "%s = int(%s)" % (_operands[1], _operands[0])
+        return None
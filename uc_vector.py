@@ -0,0 +1,518 @@
+# ---------------------------------------------------------------------------------
+# uc: uc_vector.py
+#
+# VectorLoop class: counted loops over arrays of the uC intermediate representation
+#                   run as NumPy operations by the interpreter (see uc_interpreter.py)
+#
+# Copyright (c) 2019-2020, Marcio M Pereira All rights reserved.
+#
+# This software is provided by the author, "as is" without any warranties
+# Redistribution and use in source form with or without modification are
+# permitted but the source code must retain the above copyright notice.
+# ---------------------------------------------------------------------------------
+from array import array
+from uc_memory import FLOAT, INT, SEGMENT_BITS, TYPECODES
+
+try:
+    import numpy
+except ImportError:
+    # without numpy, every loop runs one instruction at a time
+    numpy = None
+
+# Minimum number of iterations of a loop to run it as vector operations
+MIN_TRIP_COUNT = 16
+
+# Maximum number of iterations run at once: a longer loop runs in chunks,
+# so the memory of its vectors is bounded.
+MAX_TRIP_COUNT = 1 << 16
+
+# Vector results of the int operations are checked (as floats) against
+# this limit, since the ints of the interpreter have no limit.
+INT_LIMIT = 2.0**62
+
+# NumPy types of the typed segments that can be vectorized
+DTYPES = {INT: "int64", FLOAT: "float64"}
+
+# Instructions of the body of a loop that can be vectorized: opcode ->
+# NumPy function (binary & casts) or the kind of the instruction
+OPERATIONS = {
+    "add_int": "add",
+    "sub_int": "subtract",
+    "mul_int": "multiply",
+    "div_int": "floor_divide",
+    "mod_int": "mod",
+    "add_float": "add",
+    "sub_float": "subtract",
+    "mul_float": "multiply",
+    "div_float": "true_divide",
+}
+CASTS = {"sitofp": "float64", "fptosi": "int64"}
+
+
+class VectorLoop(object):
+    """
+    A counted loop over arrays, as generated for a for (or while) of uC:
+
+        ('9',)                                  header
+        ('load_int', '%i', '%13')
+        ('load_int', '%n', '%14')               or literal_int
+        ('lt_int', '%13', '%14', '%15')         or le_int
+        ('cbranch', '%15', '%10', '%11')
+        ('10',)
+        ... body ...
+        ('load_int', '%i', '%19')               increment by 1
+        ('literal_int', 1, '%20')
+        ('add_int', '%19', '%20', '%21')
+        ('store_int', '%21', '%i')
+        ('jump', '%9')
+        ('11',)                                 exit
+
+    where the body is straight code (no branches, calls or I/O) that reads
+    & writes arrays at i + constant (elem, load_*, store_*), computes with
+    +, -, *, /, % & casts, and writes scalar vars that are either private
+    (written before read in each iteration) or sums (s = s + x, s = s - x).
+
+    run(vm) runs all the iterations at once as NumPy operations on the
+    memory of the interpreter: first the values are computed, checking
+    that no array written overlaps another access with a different offset
+    (a dependence between iterations), and that the results are the same
+    as the interpreter's (no int overflow, no division by zero).  Only
+    then the arrays and the registers are written.  When a check fails
+    nothing is written and the loop runs one instruction at a time.  A
+    long loop runs in chunks of MAX_TRIP_COUNT iterations, each one written
+    before the next is computed, and if a chunk fails the iterations left
+    run in the interpreter.
+    """
+
+    def __init__(self, function, label, exit):
+        self.function = function  # Name of the function of the loop
+        self.label = label  # Label of the header
+        self.exit = exit  # PC of the label of the exit
+        self.iv = None  # Operand of the induction var
+        self.bound = None  # Operand of the bound, or None if a literal
+        self.limit = None  # Literal bound
+        self.inclusive = False  # Whether the test is <= instead of <
+        self.header = ()  # Registers of the test: i, bound, test
+        self.increment = ()  # Registers of the increment: i, 1, i + 1
+        self.steps = []  # Instructions of the body: (kind, target, *args)
+        self.kinds = set()  # Kinds of vector operations (for the report)
+        self.runs = 0  # Number of times run as vector operations
+        self.fallbacks = 0  # Number of times a check failed
+
+    def describe(self):
+        _kinds = ", ".join(sorted(self.kinds))
+        return "%s %s: %s" % (self.function, self.label, _kinds)
+
+    #
+    # Execution
+    #
+    def run(self, vm):
+        # Returns whether the loop was run to its end, leaving the state
+        # of the vm as if the loop had run in the interpreter.
+        M = vm.M
+        _first = M[vm._address(self.iv)]
+        _bound = self.limit if self.bound is None else M[vm._address(self.bound)]
+        if type(_first) is not int or type(_bound) is not int:
+            return False
+        _count = _bound - _first + (1 if self.inclusive else 0)
+        if _count < MIN_TRIP_COUNT:
+            return False
+        while _count > 0:
+            _chunk = min(_count, MAX_TRIP_COUNT)
+            try:
+                _result = self._evaluate(vm, _first, _chunk)
+            except (ArithmeticError, TypeError, ValueError, MemoryError):
+                _result = None
+            if _result is None:
+                self.fallbacks += 1
+                return False
+            self._commit(vm, _first, _chunk, *_result)
+            _first += _chunk
+            _count -= _chunk
+        self.runs += 1
+        return True
+
+    def _evaluate(self, vm, first, count):
+        # Compute the values of all the registers & arrays written by the
+        # loop, or None if it can't be vectorized.
+        M = vm.M
+        memory = vm.memory
+        _index = numpy.arange(first, first + count, dtype="int64")
+        env = {}  # Operand -> value: a Python scalar or a vector
+        pointers = {}  # Operand of an elem -> (start address, segment)
+        stores = {}  # Start address -> (vector, segment)
+        accesses = []  # (start address, is a store)
+        sums = {}  # Operand of a sum var -> (final, value of its load)
+
+        def _value(operand):
+            _val = env[operand]
+            if isinstance(_val, tuple):
+                # i + offset
+                return _index + _val[1]
+            return _val
+
+        for step in self.steps:
+            _kind, _target = step[:2]
+            if _kind == "literal":
+                env[_target] = step[2]
+            elif _kind == "index":
+                env[_target] = ("index", step[2])
+            elif _kind == "load":
+                env[_target] = M[vm._address(step[2])]
+            elif _kind == "copy":
+                env[_target] = env[step[2]]
+            elif _kind == "elem":
+                if step[2] in env:
+                    _base = env[step[2]]
+                else:
+                    _base = M[vm._address(step[2])]
+                _start = _base + first + env[step[3]][1]
+                _segment = _start >> SEGMENT_BITS
+                if (
+                    _segment not in DTYPES
+                    or (_start + count - 1) >> SEGMENT_BITS != _segment
+                ):
+                    return None
+                pointers[_target] = (_start, _segment)
+            elif _kind == "gather":
+                _start, _segment = pointers[step[2]]
+                accesses.append((_start, False))
+                if _start in stores:
+                    env[_target] = stores[_start][0]
+                else:
+                    _values = memory.read(_start, count)
+                    env[_target] = numpy.frombuffer(_values, DTYPES[_segment])
+            elif _kind == "scatter":
+                _start, _segment = pointers[step[2]]
+                accesses.append((_start, True))
+                _vector = self._typed(_value(_target), _segment, count)
+                if _vector is None:
+                    return None
+                stores[_start] = (_vector, _segment)
+            elif _kind == "binary":
+                env[_target] = self._binary(step[2], _value(step[3]), _value(step[4]))
+                if env[_target] is None:
+                    return None
+            elif _kind == "cast":
+                env[_target] = self._cast(step[2], _value(step[3]))
+                if env[_target] is None:
+                    return None
+            elif _kind == "sum":
+                # s = s + x (or s - x): step is (sum, s, x, load, result, op)
+                sums[_target] = self._sum(
+                    M[vm._address(_target)], _value(step[2]), step[5], count
+                )
+                if sums[_target] is None:
+                    return None
+                env[step[3]], env[step[4]] = sums[_target][1], sums[_target][0]
+
+        # a store & another access with a different start address to the
+        # same memory is a dependence between the iterations
+        _ends = [(_start, _start + count, _store) for _start, _store in accesses]
+        for _start, _end, _store in _ends:
+            for _other, _other_end, _other_store in _ends:
+                if (_store or _other_store) and _start != _other:
+                    if _start < _other_end and _other < _end:
+                        return None
+        return (env, pointers, stores, sums)
+
+    def _typed(self, value, segment, count):
+        # The vector stored in an array of the segment, or None if the
+        # interpreter would fail to store it (e.g. a float in an int array)
+        _vector = numpy.asarray(value)
+        if segment == INT and _vector.dtype.kind != "i":
+            return None
+        _vector = _vector.astype(DTYPES[segment])
+        if _vector.ndim == 0:
+            _vector = numpy.full(count, _vector, DTYPES[segment])
+        return _vector
+
+    def _binary(self, function, left, right):
+        _left = numpy.asarray(left)
+        _right = numpy.asarray(right)
+        if _left.dtype.kind not in "if" or _right.dtype.kind not in "if":
+            return None
+        if function in {"floor_divide", "mod", "true_divide"} and numpy.any(
+            _right == 0
+        ):
+            # ZeroDivisionError in the interpreter
+            return None
+        _result = getattr(numpy, function)(_left, _right)
+        if _result.dtype.kind == "i":
+            # the result must be the same of the unbounded ints
+            _estimate = getattr(numpy, function)(
+                _left.astype("float64"), _right.astype("float64")
+            )
+            if numpy.any(numpy.abs(_estimate) >= INT_LIMIT):
+                return None
+        return _result
+
+    def _cast(self, dtype, value):
+        _value = numpy.asarray(value)
+        if dtype == "int64":
+            # int() of the interpreter fails on nan & inf
+            if not numpy.all(numpy.abs(_value) < INT_LIMIT):
+                return None
+        return _value.astype(dtype)
+
+    def _sum(self, initial, value, function, count):
+        # Final value of s = s + x (or s - x) & the value of s before the
+        # last iteration, added in the same order of the interpreter
+        _value = numpy.asarray(value)
+        if _value.ndim == 0:
+            _value = numpy.full(count, _value)
+        if isinstance(initial, float) or _value.dtype.kind == "f":
+            _partial = getattr(numpy, function).accumulate(
+                numpy.concatenate(([initial], _value.astype("float64")))
+            )
+            return (_partial[-1].item(), _partial[-2].item())
+        elif type(initial) is not int or _value.dtype.kind != "i":
+            return None
+        _total = sum(_value.tolist())
+        _last = _value[-1].item()
+        if function == "add":
+            return (initial + _total, initial + _total - _last)
+        return (initial - _total, initial - _total + _last)
+
+    def _commit(self, vm, first, count, env, pointers, stores, sums):
+        # Write the arrays, and the registers with their value in the last
+        # iteration, as the interpreter would leave them
+        M = vm.M
+        for _start, (_vector, _segment) in stores.items():
+            _values = array(TYPECODES[_segment])
+            _values.frombytes(_vector.tobytes())
+            vm.memory.write(_start, _values)
+        _last = first + count - 1
+        for _operand, _value in env.items():
+            if isinstance(_value, tuple):
+                _value = _last + _value[1]
+            elif isinstance(_value, numpy.ndarray) and _value.ndim:
+                _value = _value[-1].item()
+            elif isinstance(_value, numpy.ndarray):
+                _value = _value.item()
+            M[vm._address(_operand)] = _value
+        for _operand, (_start, _segment) in pointers.items():
+            M[vm._address(_operand)] = _start + count - 1
+        for _operand, (_final, _before) in sums.items():
+            M[vm._address(_operand)] = _final
+        _i, _one, _next = self.increment
+        M[vm._address(self.iv)] = _last + 1
+        M[vm.fp + _i] = _last
+        M[vm.fp + _one] = 1
+        M[vm.fp + _next] = _last + 1
+        _i, _bound, _test = self.header
+        M[vm.fp + _i] = _last + 1
+        M[vm.fp + _bound] = (
+            self.limit if self.bound is None else M[vm._address(self.bound)]
+        )
+        M[vm.fp + _test] = False
+
+
+def find_loops(vm, ircode):
+    """
+    Find the loops of the intermediate code that can be vectorized: a
+    dictionary of the pc of the header label -> VectorLoop.  The register
+    names are translated to the operands of vm (see Interpreter._operand).
+    """
+    loops = {}
+    if numpy is None:
+        return loops
+    _entries = sorted(vm.functions) + [len(ircode)]
+    for _entry, _end in zip(_entries, _entries[1:]):
+        vm.frame = vm.functions[_entry]
+        for pc in range(_entry + 1, _end):
+            if ircode[pc][0].isdigit():
+                try:
+                    loop = _analyze(vm, ircode, pc, _end)
+                except (KeyError, IndexError, ValueError):
+                    loop = None
+                if loop is not None:
+                    loops[pc] = loop
+    return loops
+
+
+def _analyze(vm, ircode, pc, end):
+    # The VectorLoop of the loop with header at pc, or None
+    _test, _branch = ircode[pc + 3 : pc + 5]
+    _load, _bound = ircode[pc + 1 : pc + 3]
+    if (
+        _load[0] != "load_int"
+        or _bound[0] not in {"load_int", "literal_int"}
+        or _test[0] not in {"lt_int", "le_int"}
+        or _test[1:3] != (_load[2], _bound[2])
+        or _branch[:2] != ("cbranch", _test[3])
+        or ircode[pc + 5] != (_branch[2][1:],)
+    ):
+        return None
+    _iv = _load[1]
+    _exit = ircode.index((_branch[3][1:],), pc + 6, end)
+    _increment = ircode[_exit - 5 : _exit]
+    if (
+        _increment[4] != ("jump", "%" + ircode[pc][0])
+        or _increment[0][:2] != ("load_int", _iv)
+        or _increment[1][:2] != ("literal_int", 1)
+        or _increment[2][0] != "add_int"
+        or set(_increment[2][1:3]) != {_increment[0][2], _increment[1][2]}
+        or _increment[3] != ("store_int", _increment[2][3], _iv)
+    ):
+        return None
+
+    operand = vm._operand
+    loop = VectorLoop(vm.frame.name, "%" + ircode[pc][0], _exit)
+    loop.iv = operand(_iv)
+    if _bound[0] == "literal_int":
+        loop.limit = _bound[1]
+    else:
+        loop.bound = operand(_bound[1])
+    loop.inclusive = _test[0] == "le_int"
+    loop.header = tuple(operand(name) for name in _test[1:])
+    loop.increment = tuple(operand(name) for name in _increment[2][1:])
+    if _increment[2][1] != _increment[0][2]:
+        loop.increment = (loop.increment[1], loop.increment[0], loop.increment[2])
+    _body = ircode[pc + 6 : _exit - 5]
+    if not _translate_body(vm, loop, _body, _iv, _bound[1]):
+        return None
+    return loop
+
+
+def _translate_body(vm, loop, body, iv, bound):
+    # Translate the body of the loop into loop.steps, checking that every
+    # instruction can be vectorized. The registers are classified as:
+    #   index   - i + offset (offset is the literal of the step)
+    #   literal - a literal value, known at load time
+    #   value   - any other scalar or vector value
+    #   pointer - an element of an array at i + offset (elem)
+    #   sum     - the value of a sum var, or the sum (s + x) itself
+    operand = vm._operand
+    _stored = set()  # Scalar vars stored in the body
+    for op in body:
+        if op[0] in {"store_int", "store_float"}:
+            _stored.add(op[2])
+    if iv in _stored or bound in _stored:
+        return False
+
+    kinds = {}  # Register -> (kind, literal value or index offset)
+    _private = set()  # Vars stored before read in the iteration
+    _sums = {}  # Register of the load of a sum var -> var
+    _done = set()  # Sum vars already stored
+    for op in body:
+        opcode = op[0]
+        if opcode in {"literal_int", "literal_float"}:
+            kinds[op[2]] = ("literal", op[1])
+            loop.steps.append(("literal", operand(op[2]), op[1]))
+        elif opcode in {"load_int", "load_float"} and op[1] == iv:
+            kinds[op[2]] = ("index", 0)
+            loop.steps.append(("index", operand(op[2]), 0))
+        elif opcode in {"load_int", "load_float"} and op[1] in _private:
+            kinds[op[2]] = kinds[op[1]]
+            loop.steps.append(("copy", operand(op[2]), operand(op[1])))
+        elif opcode in {"load_int", "load_float"} and op[1] in _stored:
+            # s = s + x: the var is read before it is stored
+            if op[1] in _sums.values() or op[1] in _done:
+                return False
+            kinds[op[2]] = ("sum", None)
+            _sums[op[2]] = op[1]
+        elif opcode in {"load_int", "load_float"}:
+            # loop invariant
+            if op[1] in vm.arrays or op[1] in vm.frame.arrays:
+                return False
+            kinds[op[2]] = ("invariant", None)
+            loop.steps.append(("load", operand(op[2]), operand(op[1])))
+        elif opcode in {"store_int", "store_float"}:
+            _kind = kinds[op[1]][0]
+            if _kind == "sum" and op[1] in _sums or _kind == "pointer":
+                return False
+            elif _kind == "sum":
+                # the store of s + x, see the add & sub below
+                _step = loop.steps.pop()
+                if _step[0] != "sum" or _step[1] != operand(op[2]):
+                    return False
+                loop.steps.append(_step)
+                loop.kinds.add("sum")
+                _sums = {k: v for k, v in _sums.items() if v != op[2]}
+                _done.add(op[2])
+            elif op[2] in _sums.values():
+                return False
+            else:
+                kinds[op[2]] = kinds[op[1]]
+                _private.add(op[2])
+                loop.steps.append(("copy", operand(op[2]), operand(op[1])))
+        elif opcode in {"elem_int", "elem_float"}:
+            _base = kinds.get(op[1], ("invariant", None))[0]
+            if op[1] in _stored or _base != "invariant" or kinds[op[2]][0] != "index":
+                return False
+            kinds[op[3]] = ("pointer", None)
+            loop.steps.append(("elem", operand(op[3]), operand(op[1]), operand(op[2])))
+        elif opcode in {"load_int_*", "load_float_*"}:
+            if kinds[op[1]][0] != "pointer":
+                return False
+            kinds[op[2]] = ("value", None)
+            loop.steps.append(("gather", operand(op[2]), operand(op[1])))
+            loop.kinds.add("load")
+        elif opcode in {"store_int_*", "store_float_*"}:
+            if kinds[op[2]][0] != "pointer" or kinds[op[1]][0] in {"sum", "pointer"}:
+                return False
+            loop.steps.append(("scatter", operand(op[1]), operand(op[2])))
+            loop.kinds.add("store")
+        elif opcode in OPERATIONS:
+            _left, _right = kinds[op[1]], kinds[op[2]]
+            if "pointer" in (_left[0], _right[0]):
+                return False
+            elif "sum" in (_left[0], _right[0]):
+                # s + x, x + s or s - x
+                _function = OPERATIONS[opcode]
+                _var = _sums.get(op[1]) if _left[0] == "sum" else _sums.get(op[2])
+                _other = op[2] if _left[0] == "sum" else op[1]
+                if (
+                    _var is None
+                    or _function not in {"add", "subtract"}
+                    or _function == "subtract"
+                    and _left[0] != "sum"
+                    or kinds[_other][0] == "sum"
+                ):
+                    return False
+                kinds[op[3]] = ("sum", None)
+                _load = op[1] if _left[0] == "sum" else op[2]
+                loop.steps.append(
+                    (
+                        "sum",
+                        operand(_var),
+                        operand(_other),
+                        operand(_load),
+                        operand(op[3]),
+                        _function,
+                    )
+                )
+            elif (
+                opcode in {"add_int", "sub_int"}
+                and _left[0] == "index"
+                and _right[0] == "literal"
+            ):
+                _sign = 1 if opcode == "add_int" else -1
+                kinds[op[3]] = ("index", _left[1] + _sign * _right[1])
+                loop.steps.append(("index", operand(op[3]), kinds[op[3]][1]))
+            elif opcode == "add_int" and _left[0] == "literal" and _right[0] == "index":
+                kinds[op[3]] = ("index", _right[1] + _left[1])
+                loop.steps.append(("index", operand(op[3]), kinds[op[3]][1]))
+            else:
+                kinds[op[3]] = ("value", None)
+                loop.steps.append(
+                    (
+                        "binary",
+                        operand(op[3]),
+                        OPERATIONS[opcode],
+                        operand(op[1]),
+                        operand(op[2]),
+                    )
+                )
+                loop.kinds.add(opcode.split("_")[0])
+        elif opcode in CASTS:
+            if kinds[op[1]][0] in {"sum", "pointer"}:
+                return False
+            kinds[op[2]] = ("value", None)
+            loop.steps.append(("cast", operand(op[2]), CASTS[opcode], operand(op[1])))
+        else:
+            # branches, calls, I/O, ...
+            return False
+    # every sum var must be stored
+    return not _sums and bool(loop.kinds)